@@ -0,0 +1,6 @@
+"""Benchmarks for the agent service.
+
+Run from agents/agent_service, e.g.:
+
+    python -m benchmarks.e2e --concurrency 1,8,32 --output results.json
+"""
@@ -0,0 +1,372 @@
+"""End-to-end load benchmark of the agent service against local fakes.
+
+Boots main:app in a subprocess with Gemini and ElevenLabs pointed at fake
+servers and Pinecone replaced by a fake index, then drives each scenario
+at fixed concurrency levels for a fixed duration. Reports throughput,
+error rate and latency percentiles per scenario, plus per-stage
+percentiles from the Server-Timing headers of agent executions, and
+writes everything as JSON for comparing runs:
+
+    python -m benchmarks.e2e --concurrency 1,8,32 --duration 20 --output after.json --baseline before.json
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import socket
+import tempfile
+import subprocess
+from collections import defaultdict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+
+from benchmarks.fakes import (
+    BackgroundServer,
+    FakeStats,
+    LatencyModel,
+    create_fake_elevenlabs_app,
+    create_fake_gemini_app
+)
+from benchmarks.report import (
+    compare,
+    environment,
+    load_results,
+    print_comparison,
+    summarize,
+    write_results
+)
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+AGENT_IDS = [
+    "seo_bench_1", "business_bench_1", "customer_bench_1", "data_bench_1",
+    "dev_bench_1", "creative_bench_1", "sales_bench_1", "marketing_bench_1"
+]
+
+PROMPTS = [
+    "Summarize our sales pipeline for this quarter and flag deals at risk.",
+    "Draft a reply to a customer asking why their invoice doubled this month.",
+    "Suggest five blog post titles about remote onboarding, optimized for search.",
+    "Review this function for bugs: def add(a, b): return a - b",
+    "What trends do you see in last week's support tickets? Most were about login failures.",
+    "Write a short product announcement for our new analytics dashboard.",
+]
+
+GOALS = [
+    "Automate lead qualification and follow-up emails",
+    "Monitor competitor pricing and report weekly",
+    "Triage support tickets and escalate urgent ones",
+    "Publish a weekly newsletter from our blog posts",
+    "Reconcile invoices against bank transactions",
+]
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+def _execute(rng: random.Random, args: argparse.Namespace) -> Request:
+    agent_id = rng.choice(AGENT_IDS)
+    context = {
+        "guild_id": f"guild-{rng.randrange(args.tenants)}",
+        "user_id": f"user-{rng.randrange(args.tenants * 4)}",
+        "voice_enabled": rng.random() < args.voice_ratio,
+        "executionId": f"bench-{rng.getrandbits(48):x}"
+    }
+    return "POST", f"/agent/{agent_id}/execute", {
+        "json": {"input": rng.choice(PROMPTS), "context": context},
+        "params": {"timings": "true"}
+    }
+
+
+def _memory_write(rng: random.Random, args: argparse.Namespace) -> Request:
+    body = {
+        "content": f"{rng.choice(PROMPTS)} (note {rng.getrandbits(32):x})",
+        "memory_type": "interaction",
+        "importance": round(rng.random(), 2)
+    }
+    return "POST", f"/agent/{rng.choice(AGENT_IDS)}/memory", {"json": body}
+
+
+def _memory_search(rng: random.Random, args: argparse.Namespace) -> Request:
+    params = {"query": " ".join(rng.choice(PROMPTS).split()[:6]), "limit": 10}
+    return "GET", f"/agent/{rng.choice(AGENT_IDS)}/memories/search", {"params": params}
+
+
+def _memory_recent(rng: random.Random, args: argparse.Namespace) -> Request:
+    return "GET", f"/agent/{rng.choice(AGENT_IDS)}/memories", {"params": {"limit": 10}}
+
+
+def _blueprint(rng: random.Random, args: argparse.Namespace) -> Request:
+    user_input = f"{rng.choice(GOALS)} for team {rng.randrange(args.unique_inputs)}"
+    return "POST", "/generate-blueprint", {"json": {"user_input": user_input}}
+
+
+SCENARIOS: Dict[str, Callable[[random.Random, argparse.Namespace], Request]] = {
+    "execute": _execute,
+    "memory_write": _memory_write,
+    "memory_search": _memory_search,
+    "memory_recent": _memory_recent,
+    "blueprint": _blueprint,
+}
+
+
+def parse_server_timing(header: Optional[str]) -> Dict[str, float]:
+    """Stage durations in seconds from a Server-Timing header."""
+    stages = {}
+    for metric in (header or "").split(","):
+        name, *params = [part.strip() for part in metric.split(";")]
+        for param in params:
+            key, _, value = param.partition("=")
+            if name and key == "dur":
+                try:
+                    stages[name] = float(value) / 1000
+                except ValueError:
+                    pass
+    return stages
+
+
+async def run_level(
+    client: httpx.AsyncClient,
+    scenario: str,
+    concurrency: int,
+    duration: float,
+    args: argparse.Namespace
+) -> Dict[str, Any]:
+    """Drive one scenario at a fixed concurrency for a fixed duration."""
+    build = SCENARIOS[scenario]
+    latencies: List[float] = []
+    stages: Dict[str, List[float]] = defaultdict(list)
+    statuses: Dict[str, int] = defaultdict(int)
+    deadline = time.perf_counter() + duration
+
+    async def worker(worker_id: int):
+        rng = random.Random(f"{args.seed}:{scenario}:{concurrency}:{worker_id}")
+        while time.perf_counter() < deadline:
+            method, path, kwargs = build(rng, args)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                status = str(response.status_code)
+                for name, value in parse_server_timing(response.headers.get("server-timing")).items():
+                    stages[name].append(value)
+            except httpx.HTTPError as e:
+                status = e.__class__.__name__
+            latencies.append(time.perf_counter() - start)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - started
+
+    errors = sum(count for status, count in statuses.items() if not status.startswith("2"))
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": round(errors / len(latencies), 4) if latencies else 0.0,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "statuses": dict(statuses),
+        "latency": summarize(latencies),
+        "stages": {name: summarize(values) for name, values in sorted(stages.items())}
+    }
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def service_env(args: argparse.Namespace, gemini_url: str, elevenlabs_url: str, port: int) -> Dict[str, str]:
+    """Environment that points the agent service at the fakes."""
+    return {
+        "AGENT_PORT": str(port),
+        "GEMINI_API_KEY": "bench-key",
+        "GEMINI_API_URL": f"{gemini_url}/v1beta/models",
+        "GEMINI_CACHED_CONTENTS_URL": f"{gemini_url}/v1beta/cachedContents",
+        "GEMINI_EMBEDDING_URL": f"{gemini_url}/v1/models/embedding-001:embedContent",
+        "MEMORY_ENABLE_LOCAL_EMBEDDING": "false" if args.gemini_embeddings else "true",
+        "ELEVENLABS_API_KEY": "bench-key",
+        "ELEVENLABS_API_URL": f"{elevenlabs_url}/v1",
+        "PINECONE_API_KEY": "",
+        "BENCH_PINECONE_LATENCY": args.pinecone_latency,
+        "REDIS_URL": args.redis_url or "",
+        "TRAFFIC_MODE": "off",
+        "RELOAD": "false",
+        "DEBUG": "false"
+    }
+
+
+def start_fakes(args: argparse.Namespace, stats: FakeStats) -> Tuple[BackgroundServer, BackgroundServer]:
+    """Start the fake Gemini and ElevenLabs servers."""
+    gemini = BackgroundServer(create_fake_gemini_app(
+        LatencyModel.parse(args.gemini_latency, seed=args.seed), stats, args.output_tokens
+    )).start()
+    elevenlabs = BackgroundServer(create_fake_elevenlabs_app(
+        LatencyModel.parse(args.elevenlabs_latency, seed=args.seed), stats
+    )).start()
+    return gemini, elevenlabs
+
+
+def flush_redis(args: argparse.Namespace):
+    """Empty the benchmark Redis database when asked to."""
+    if args.redis_url and args.flush_redis:
+        import redis
+        redis.from_url(args.redis_url).flushdb()
+
+
+def start_service(args: argparse.Namespace, gemini_url: str, elevenlabs_url: str, port: int, log_path: str) -> subprocess.Popen:
+    """Start main:app wired to the fakes in a subprocess, and wait until it answers."""
+    log = open(log_path, "w", encoding="utf-8")
+    process = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.serve"],
+        cwd=SERVICE_DIR,
+        env={**os.environ, **service_env(args, gemini_url, elevenlabs_url, port)},
+        stdout=log,
+        stderr=subprocess.STDOUT
+    )
+
+    deadline = time.time() + args.startup_timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Agent service exited during startup, see {log_path}")
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/", timeout=1.0).status_code == 200:
+                return process
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"Agent service did not start within {args.startup_timeout}s, see {log_path}")
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    fake_stats = FakeStats()
+    gemini, elevenlabs = start_fakes(args, fake_stats)
+
+    flush_redis(args)
+    port = free_port()
+    process = start_service(args, gemini.url, elevenlabs.url, port, args.service_log)
+    results: List[Dict[str, Any]] = []
+    try:
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+            # Give searches something to find
+            rng = random.Random(args.seed)
+            for _ in range(args.seed_memories):
+                method, path, kwargs = _memory_write(rng, args)
+                await client.request(method, path, **kwargs)
+
+            for scenario in args.scenarios:
+                for concurrency in args.concurrency:
+                    if args.warmup:
+                        await run_level(client, scenario, concurrency, args.warmup, args)
+                    fake_stats.reset()
+                    result = await run_level(client, scenario, concurrency, args.duration, args)
+                    result["upstream"] = {
+                        endpoint: {**summarize(values), "errors": fake_stats.errors[endpoint]}
+                        for endpoint, values in sorted(fake_stats.latencies.items())
+                    }
+                    results.append(result)
+                    print(
+                        f"{scenario:<14} c={concurrency:<4} {result['throughput_rps']:>8.1f} req/s  "
+                        f"p50 {result['latency']['p50_ms']:>8.1f}ms  p95 {result['latency']['p95_ms']:>8.1f}ms  "
+                        f"p99 {result['latency']['p99_ms']:>8.1f}ms  errors {result['error_rate'] * 100:.1f}%"
+                    )
+    finally:
+        process.terminate()
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        gemini.stop()
+        elevenlabs.stop()
+
+    return {
+        "benchmark": "e2e",
+        "environment": environment(),
+        "config": {
+            "scenarios": args.scenarios,
+            "concurrency": args.concurrency,
+            "duration": args.duration,
+            "seed": args.seed,
+            "gemini_latency": args.gemini_latency,
+            "elevenlabs_latency": args.elevenlabs_latency,
+            "pinecone_latency": args.pinecone_latency,
+            "redis": bool(args.redis_url),
+            "voice_ratio": args.voice_ratio
+        },
+        "results": results
+    }
+
+
+def _cases(results: Dict[str, Any]) -> Dict[str, Dict[str, float]]:
+    return {
+        f"{r['scenario']}@c{r['concurrency']}": {**r["latency"], "throughput_rps": r["throughput_rps"]}
+        for r in results["results"]
+    }
+
+
+def add_service_arguments(parser: argparse.ArgumentParser):
+    """Options for the fakes and the service under test, shared with the soak test."""
+    parser.add_argument("--gemini-latency", default="800:0.4:0.01", help="median_ms[:sigma[:error_rate]]")
+    parser.add_argument("--elevenlabs-latency", default="400:0.3:0.0", help="median_ms[:sigma[:error_rate]]")
+    parser.add_argument("--pinecone-latency", default="25:0.3:0.0", help="median_ms[:sigma[:error_rate]]")
+    parser.add_argument("--output-tokens", type=int, default=200, help="Approximate tokens per fake completion")
+    parser.add_argument("--gemini-embeddings", action="store_true", help="Use fake Gemini embeddings instead of local ones")
+    parser.add_argument("--redis-url", default=None, help="Local Redis for the service; in-memory fallbacks without it")
+    parser.add_argument("--flush-redis", action="store_true", help="FLUSHDB the Redis database before the run")
+    parser.add_argument("--tenants", type=int, default=10, help="Distinct guilds in execute traffic")
+    parser.add_argument("--voice-ratio", type=float, default=0.1, help="Share of executions with voice enabled")
+    parser.add_argument("--unique-inputs", type=int, default=1000, help="Distinct blueprint goals")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="Comma-separated scenarios")
+    parser.add_argument("--concurrency", default="1,8,32", help="Comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=20.0, help="Seconds measured per level")
+    parser.add_argument("--warmup", type=float, default=3.0, help="Seconds of unmeasured load before each level")
+    parser.add_argument("--seed", type=int, default=0)
+    add_service_arguments(parser)
+    parser.add_argument("--seed-memories", type=int, default=200, help="Memories written before measuring")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--service-log", default=os.path.join(tempfile.gettempdir(), "agent_service_bench.log"))
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative change counted as a regression")
+    args = parser.parse_args(argv)
+
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    unknown = set(args.scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+    args.concurrency = [int(c) for c in args.concurrency.split(",") if c]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    results = asyncio.run(run(args))
+
+    if args.output:
+        write_results(args.output, results)
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        baseline = _cases(load_results(args.baseline))
+        current = _cases(results)
+        latency = compare(current, baseline, "p95_ms", args.threshold)
+        throughput = compare(current, baseline, "throughput_rps", args.threshold, higher_is_better=True)
+        print_comparison(latency, "p95_ms")
+        print_comparison(throughput, "throughput_rps")
+        if any(row["regression"] for row in latency + throughput):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,404 @@
+"""Local stand-ins for the external services the agent service calls.
+
+The fake Gemini and ElevenLabs servers speak just enough of the real HTTP
+APIs for the service's clients, with latency and errors drawn from a
+configurable distribution. The fake Pinecone index is an in-process
+exact cosine index with the same call signatures as the SDK index.
+"""
+import json
+import time
+import uuid
+import random
+import asyncio
+import hashlib
+import threading
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response, StreamingResponse
+
+FAKE_EMBEDDING_DIMENSION = 768
+
+
+class LatencyModel:
+    """Log-normal latency with a median, a spread and an error rate."""
+
+    def __init__(self, median_ms: float, sigma: float = 0.3, error_rate: float = 0.0, seed: Optional[int] = None):
+        self.median = median_ms / 1000
+        self.sigma = sigma
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+
+    @classmethod
+    def parse(cls, spec: str, seed: Optional[int] = None) -> "LatencyModel":
+        """Parse "median_ms[:sigma[:error_rate]]", e.g. "800:0.4:0.01"."""
+        parts = [float(part) for part in spec.split(":")]
+        return cls(*parts[:3], seed=seed)
+
+    def sample(self) -> float:
+        """A latency in seconds."""
+        if self.median <= 0:
+            return 0.0
+        return self._random.lognormvariate(0, self.sigma) * self.median
+
+    def fails(self) -> bool:
+        """Whether the next call should fail."""
+        return self._random.random() < self.error_rate
+
+    def to_dict(self) -> Dict[str, float]:
+        return {"median_ms": self.median * 1000, "sigma": self.sigma, "error_rate": self.error_rate}
+
+
+class FakeStats:
+    """Calls and injected latency per fake endpoint."""
+
+    def __init__(self):
+        self.calls: Counter = Counter()
+        self.errors: Counter = Counter()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, latency: float, error: bool = False):
+        with self._lock:
+            self.calls[endpoint] += 1
+            self.errors[endpoint] += int(error)
+            self.latencies[endpoint].append(latency)
+
+    def reset(self):
+        with self._lock:
+            self.calls.clear()
+            self.errors.clear()
+            self.latencies.clear()
+
+
+def fake_embedding(text: str, dimension: int = FAKE_EMBEDDING_DIMENSION) -> List[float]:
+    """Deterministic unit vector for a text."""
+    seed = int(hashlib.md5(text.encode()).hexdigest()[:8], 16)
+    vector = np.random.default_rng(seed).standard_normal(dimension)
+    return (vector / np.linalg.norm(vector)).tolist()
+
+
+def fake_blueprint(user_input: str) -> Dict[str, Any]:
+    """A blueprint that passes the service's validation."""
+    return {
+        "id": f"blueprint-{uuid.uuid4().hex[:8]}",
+        "user_input": user_input,
+        "interpretation": f"Automate the following goal: {user_input[:200]}",
+        "suggested_structure": {
+            "guild_name": "Benchmark Guild",
+            "guild_purpose": "Exercise the blueprint endpoint under load",
+            "agents": [
+                {
+                    "name": f"Agent {i}",
+                    "role": "Specialist",
+                    "description": "Handles one part of the goal",
+                    "tools_needed": ["http", "email"]
+                }
+                for i in range(3)
+            ],
+            "workflows": [
+                {"name": "Daily run", "description": "Runs every day", "trigger_type": "schedule"}
+            ]
+        }
+    }
+
+
+def _prompt_text(body: Dict[str, Any]) -> str:
+    parts = []
+    for content in body.get("contents", []):
+        parts.extend(part.get("text", "") for part in content.get("parts", []))
+    return "\n".join(parts)
+
+
+def create_fake_gemini_app(latency: LatencyModel, stats: FakeStats, output_tokens: int = 200) -> FastAPI:
+    """A fake Gemini API server.
+
+    Args:
+        latency: Latency and error model for generate calls.
+        stats: Where calls are counted.
+        output_tokens: Approximate length of generated text.
+    """
+    app = FastAPI()
+    filler = " ".join(["benchmark"] * output_tokens)
+
+    async def delay(endpoint: str, share: float = 1.0) -> Optional[JSONResponse]:
+        wait = latency.sample() * share
+        failed = latency.fails()
+        await asyncio.sleep(wait)
+        stats.record(endpoint, wait, failed)
+        if failed:
+            return JSONResponse(status_code=503, content={"error": {"code": 503, "message": "Injected failure", "status": "UNAVAILABLE"}})
+        return None
+
+    def completion(body: Dict[str, Any]) -> Tuple[str, Dict[str, int]]:
+        prompt = _prompt_text(body)
+        if body.get("generationConfig", {}).get("responseSchema") or "blueprint" in prompt.lower():
+            text = json.dumps(fake_blueprint(prompt))
+        else:
+            text = f"Here is a response to: {prompt[:120]}\n\n{filler}"
+        usage = {
+            "promptTokenCount": len(prompt) // 4 + 1,
+            "candidatesTokenCount": len(text) // 4 + 1,
+            "totalTokenCount": (len(prompt) + len(text)) // 4 + 2
+        }
+        return text, usage
+
+    @app.get("/{version}/models/{model}")
+    async def get_model(version: str, model: str):
+        return {"name": f"models/{model}"}
+
+    @app.post("/{version}/models/{target}")
+    async def model_action(version: str, target: str, request: Request):
+        model, _, action = target.partition(":")
+        body = await request.json()
+
+        if action == "embedContent":
+            text = _prompt_text({"contents": [body.get("content", {})]})
+            stats.record("gemini.embed", 0.0)
+            return {"embedding": {"values": fake_embedding(text)}}
+
+        if action == "countTokens":
+            stats.record("gemini.count_tokens", 0.0)
+            return {"totalTokens": len(_prompt_text(body)) // 4 + 1}
+
+        if action == "generateContent":
+            error = await delay("gemini.generate")
+            if error:
+                return error
+            text, usage = completion(body)
+            return {
+                "candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+                "usageMetadata": usage,
+                "modelVersion": model
+            }
+
+        if action == "streamGenerateContent":
+            # The first chunk takes ~30% of the total, the rest is spread over the chunks
+            error = await delay("gemini.stream_first_chunk", 0.3)
+            if error:
+                return error
+            text, usage = completion(body)
+            pieces = [text[i:i + 64] for i in range(0, len(text), 64)]
+            spacing = latency.sample() * 0.7 / max(len(pieces), 1)
+
+            async def events():
+                for i, piece in enumerate(pieces):
+                    chunk = {"candidates": [{"content": {"parts": [{"text": piece}], "role": "model"}}]}
+                    if i == len(pieces) - 1:
+                        chunk["candidates"][0]["finishReason"] = "STOP"
+                        chunk["usageMetadata"] = usage
+                    yield f"data: {json.dumps(chunk)}\r\n\r\n"
+                    await asyncio.sleep(spacing)
+
+            return StreamingResponse(events(), media_type="text/event-stream")
+
+        return JSONResponse(status_code=404, content={"error": {"code": 404, "message": f"Unknown action {action}"}})
+
+    @app.post("/{version}/cachedContents")
+    async def create_cached_content(version: str, request: Request):
+        body = await request.json()
+        stats.record("gemini.cached_contents", 0.0)
+        return {"name": f"cachedContents/fake-{uuid.uuid4().hex[:12]}", "model": body.get("model")}
+
+    @app.patch("/{version}/cachedContents/{name}")
+    async def update_cached_content(version: str, name: str):
+        stats.record("gemini.cached_contents", 0.0)
+        return {"name": f"cachedContents/{name}"}
+
+    return app
+
+
+def create_fake_elevenlabs_app(latency: LatencyModel, stats: FakeStats) -> FastAPI:
+    """A fake ElevenLabs API server returning silent audio."""
+    app = FastAPI()
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    async def text_to_speech(voice_id: str, request: Request):
+        body = await request.json()
+        wait = latency.sample()
+        failed = latency.fails()
+        await asyncio.sleep(wait)
+        stats.record("elevenlabs.tts", wait, failed)
+        if failed:
+            return JSONResponse(status_code=503, content={"detail": "Injected failure"})
+        # Roughly the size of 128 kbps MP3 for the spoken text
+        size = min(len(body.get("text", "")) * 1000, 2_000_000)
+        return Response(content=b"\xff\xfb" + b"\x00" * size, media_type="audio/mpeg")
+
+    @app.get("/v1/voices")
+    async def voices():
+        stats.record("elevenlabs.voices", 0.0)
+        return {"voices": [{"voice_id": "21m00Tcm4TlvDq8ikWAM", "name": "Benchmark", "category": "premade"}]}
+
+    @app.get("/v1/voices/{voice_id}/settings")
+    async def voice_settings(voice_id: str):
+        return {"stability": 0.5, "similarity_boost": 0.75, "style": 0.0, "use_speaker_boost": True}
+
+    return app
+
+
+class FakePineconeIndex:
+    """Exact in-memory cosine index with the Pinecone index call signatures.
+
+    Calls block for a latency drawn from the model, as the SDK does, so
+    they exercise the service's executor the way real calls would.
+    """
+
+    def __init__(
+        self,
+        latency: Optional[LatencyModel] = None,
+        stats: Optional[FakeStats] = None,
+        capacity: Optional[int] = None
+    ):
+        """Initialize the index.
+
+        Args:
+            latency: Latency and error model for every call.
+            stats: Where calls are counted.
+            capacity: Vectors kept per namespace, oldest evicted first, so
+                the fake's own memory stays flat in long runs. Unbounded
+                by default.
+        """
+        self.latency = latency or LatencyModel(0)
+        self.stats = stats or FakeStats()
+        self.capacity = capacity
+        self._namespaces: Dict[str, Dict[str, Tuple[np.ndarray, Dict[str, Any]]]] = defaultdict(dict)
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._lock = threading.Lock()
+
+    def _call(self, endpoint: str):
+        wait = self.latency.sample()
+        failed = self.latency.fails()
+        time.sleep(wait)
+        self.stats.record(f"pinecone.{endpoint}", wait, failed)
+        if failed:
+            raise Exception("Injected Pinecone failure")
+
+    def upsert(self, vectors: List[Any], namespace: str = "") -> Dict[str, int]:
+        self._call("upsert")
+        with self._lock:
+            for vector in vectors:
+                if isinstance(vector, dict):
+                    vector_id, values, metadata = vector["id"], vector["values"], vector.get("metadata", {})
+                else:
+                    vector_id, values, metadata = (tuple(vector) + ({},))[:3]
+                entries = self._namespaces[namespace]
+                entries.pop(vector_id, None)
+                entries[vector_id] = (np.asarray(values, dtype=np.float32), dict(metadata or {}))
+                if self.capacity and len(entries) > self.capacity:
+                    del entries[next(iter(entries))]
+            self._matrices.pop(namespace, None)
+        return {"upserted_count": len(vectors)}
+
+    def query(
+        self,
+        vector: List[float],
+        namespace: str = "",
+        top_k: int = 10,
+        include_metadata: bool = False,
+        **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._call("query")
+        with self._lock:
+            if namespace not in self._matrices:
+                entries = self._namespaces.get(namespace, {})
+                ids = list(entries)
+                matrix = np.stack([entries[i][0] for i in ids]) if ids else np.zeros((0, len(vector)), dtype=np.float32)
+                norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+                self._matrices[namespace] = (ids, matrix / np.where(norms == 0, 1, norms))
+            ids, matrix = self._matrices[namespace]
+            entries = self._namespaces.get(namespace, {})
+
+        if not ids:
+            return {"matches": [], "namespace": namespace}
+        query = np.asarray(vector, dtype=np.float32)
+        scores = matrix @ (query / (np.linalg.norm(query) or 1))
+        top = np.argsort(-scores)[:top_k]
+        return {
+            "matches": [
+                {
+                    "id": ids[i],
+                    "score": float(scores[i]),
+                    **({"metadata": entries[ids[i]][1]} if include_metadata and ids[i] in entries else {})
+                }
+                for i in top
+            ],
+            "namespace": namespace
+        }
+
+    def fetch(self, ids: List[str], namespace: str = "") -> Dict[str, Any]:
+        self._call("fetch")
+        entries = self._namespaces.get(namespace, {})
+        return {"vectors": {i: {"id": i, "values": entries[i][0].tolist(), "metadata": entries[i][1]} for i in ids if i in entries}}
+
+    def update(self, id: str, namespace: str = "", set_metadata: Optional[Dict[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+        self._call("update")
+        with self._lock:
+            if id in self._namespaces.get(namespace, {}):
+                self._namespaces[namespace][id][1].update(set_metadata or {})
+        return {}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: str = "", delete_all: bool = False, **kwargs: Any) -> Dict[str, Any]:
+        self._call("delete")
+        with self._lock:
+            if delete_all:
+                self._namespaces.pop(namespace, None)
+            else:
+                for vector_id in ids or []:
+                    self._namespaces[namespace].pop(vector_id, None)
+            self._matrices.pop(namespace, None)
+        return {}
+
+    def describe_index_stats(self, **kwargs: Any) -> Dict[str, Any]:
+        namespaces = {ns: {"vector_count": len(entries)} for ns, entries in self._namespaces.items()}
+        return {
+            "dimension": FAKE_EMBEDDING_DIMENSION,
+            "namespaces": namespaces,
+            "total_vector_count": sum(ns["vector_count"] for ns in namespaces.values())
+        }
+
+
+class FakePineconeClient:
+    """Stands in for the Pinecone client, serving one fake index."""
+
+    def __init__(self, index: FakePineconeIndex, index_name: str = "genesis-memory"):
+        self.index = index
+        self.index_name = index_name
+
+    def list_indexes(self) -> List[Any]:
+        return [type("IndexDescription", (), {"name": self.index_name})()]
+
+    def Index(self, name: str) -> FakePineconeIndex:
+        return self.index
+
+    def update(self, **kwargs: Any) -> Dict[str, Any]:
+        return self.index.update(**kwargs)
+
+
+class BackgroundServer:
+    """Runs an ASGI app with uvicorn on a background thread."""
+
+    def __init__(self, app: FastAPI, host: str = "127.0.0.1", port: int = 0):
+        self.config = uvicorn.Config(app, host=host, port=port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(self.config)
+        self.thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self.server.servers[0].sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    def start(self, timeout: float = 10.0) -> "BackgroundServer":
+        self.thread.start()
+        deadline = time.time() + timeout
+        while not self.server.started:
+            if time.time() > deadline or not self.thread.is_alive():
+                raise RuntimeError("Server failed to start")
+            time.sleep(0.02)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=5)
@@ -0,0 +1,199 @@
+"""Microbenchmarks of the CPU work done on every request.
+
+Times the pure-Python hot paths (keyword extraction, input sanitization,
+local embeddings, in-memory and BM25 keyword ranking, JSON encoding of
+memory records) over inputs from a short chat message to a 50KB
+document. Each case is calibrated to run long enough for a stable
+measurement and repeated for several rounds; per-call min, median, mean
+and standard deviation are reported.
+
+Save a baseline, then compare later runs against it:
+
+    python -m benchmarks.micro --output micro-baseline.json
+    python -m benchmarks.micro --baseline micro-baseline.json --threshold 0.2
+"""
+import sys
+import json
+import time
+import random
+import argparse
+import statistics
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List, Optional
+
+from lib.agent_manager import AgentManager, extract_keywords
+from lib.memory_service import MemoryService
+from lib.retrieval import LexicalIndex, bm25_rank
+from benchmarks.report import compare, environment, load_results, print_comparison, write_results
+
+# Input sizes in characters
+TEXT_SIZES = {"chat": 200, "paragraph": 2_000, "document": 10_000, "long_document": 50_000}
+# Memories per agent for the ranking cases
+CORPUS_SIZES = (100, 1_000, 5_000)
+
+_VOCABULARY = (
+    "customer invoice pipeline revenue quarter forecast churn onboarding support ticket "
+    "login failure dashboard analytics campaign search ranking keyword content blog "
+    "release deploy server latency error budget contract renewal discount pricing "
+    "meeting schedule follow report weekly team product feature request priority "
+    "the a and of to in for with on is was that this it by from as"
+).split()
+
+
+def synthetic_text(size: int, seed: int = 0) -> str:
+    """Realistic-looking text of about size characters, with a URL every few sentences."""
+    rng = random.Random(f"{seed}:{size}")
+    sentences = []
+    length = 0
+    while length < size:
+        words = [rng.choice(_VOCABULARY) for _ in range(rng.randint(6, 18))]
+        if rng.random() < 0.15:
+            words.append(f"https://example.com/{rng.choice(_VOCABULARY)}/{rng.randint(1, 9999)}?ref=mail")
+        sentence = " ".join(words).capitalize() + "."
+        sentences.append(sentence)
+        length += len(sentence) + 1
+    return " ".join(sentences)[:size]
+
+
+def memory_record(content: str, index: int, seed: int = 0) -> Dict[str, Any]:
+    """A memory as MemoryService stores it, embedding included."""
+    rng = random.Random(f"{seed}:{index}")
+    return {
+        "id": f"memory-{index}",
+        "agent_id": "bench_agent",
+        "content": content,
+        "type": "interaction",
+        "metadata": {"source": "benchmark", "index": index},
+        "importance": round(rng.random(), 2),
+        "created_at": 1_700_000_000 + index,
+        "embedding": [rng.uniform(-1, 1) for _ in range(768)],
+        "user_id": None
+    }
+
+
+def build_cases(seed: int = 0) -> Dict[str, Callable[[], Any]]:
+    """Benchmark cases by name; each is a zero-argument callable."""
+    cases: Dict[str, Callable[[], Any]] = {}
+
+    for size_name, size in TEXT_SIZES.items():
+        text = synthetic_text(size, seed)
+        cases[f"extract_keywords[{size_name}]"] = lambda text=text: extract_keywords(text)
+        cases[f"preprocess_input[{size_name}]"] = lambda text=text: AgentManager._preprocess_input(None, text)
+        cases[f"local_embedding[{size_name}]"] = lambda text=text: MemoryService._generate_local_embedding(None, text)
+
+    for corpus_size in CORPUS_SIZES:
+        contents = [synthetic_text(random.Random(i).randint(80, 600), seed + i) for i in range(corpus_size)]
+        service = SimpleNamespace(memory_cache={
+            "bench_agent": {f"memory-{i}": memory_record(content, i, seed) for i, content in enumerate(contents)}
+        })
+        cases[f"search_in_memory[{corpus_size}]"] = (
+            lambda service=service: MemoryService._search_in_memory(service, "bench_agent", "pipeline", 10)
+        )
+        cases[f"bm25_rank[{corpus_size}]"] = (
+            lambda contents=contents: bm25_rank("customer invoice renewal pricing", contents, limit=20)
+        )
+        lexical_index = LexicalIndex()
+        for i, content in enumerate(contents):
+            lexical_index.add(f"memory-{i}", content)
+        cases[f"lexical_index_search[{corpus_size}]"] = (
+            lambda lexical_index=lexical_index: lexical_index.search("customer invoice renewal pricing", limit=20)
+        )
+
+    for size_name in ("chat", "document"):
+        record = memory_record(synthetic_text(TEXT_SIZES[size_name], seed), 0, seed)
+        encoded = json.dumps(record)
+        cases[f"memory_json_dumps[{size_name}]"] = lambda record=record: json.dumps(record)
+        cases[f"memory_json_loads[{size_name}]"] = lambda encoded=encoded: json.loads(encoded)
+
+    return cases
+
+
+def measure(func: Callable[[], Any], rounds: int = 5, min_round_time: float = 0.05) -> Dict[str, float]:
+    """Time a callable.
+
+    The number of calls per round is calibrated so a round takes at least
+    min_round_time, then the best, median and mean per-call time over the
+    rounds is reported.
+
+    Args:
+        func: Zero-argument callable to time.
+        rounds: Timed rounds.
+        min_round_time: Minimum seconds per round.
+
+    Returns:
+        Per-call statistics in microseconds, plus calls per round and ops/s.
+    """
+    func()  # Warm up caches and lazy imports
+    number = 1
+    while True:
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_round_time:
+            break
+        number = max(number * 2, int(number * min_round_time / max(elapsed, 1e-9)) + 1)
+
+    per_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        per_call.append((time.perf_counter() - start) / number * 1_000_000)
+
+    median = statistics.median(per_call)
+    return {
+        "min_us": round(min(per_call), 3),
+        "median_us": round(median, 3),
+        "mean_us": round(statistics.mean(per_call), 3),
+        "stddev_us": round(statistics.stdev(per_call), 3) if rounds > 1 else 0.0,
+        "calls_per_round": number,
+        "ops_per_second": round(1_000_000 / median, 1) if median else 0.0
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("-k", "--filter", default="", help="Only run cases whose name contains this")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--min-round-time", type=float, default=0.05, help="Minimum seconds per round")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative slowdown of the median counted as a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    cases = {name: func for name, func in build_cases(args.seed).items() if args.filter in name}
+
+    results = {}
+    print(f"{'case':<36} {'median':>12} {'min':>12} {'stddev':>10} {'ops/s':>12}")
+    for name, func in cases.items():
+        stats = measure(func, args.rounds, args.min_round_time)
+        results[name] = stats
+        print(
+            f"{name:<36} {stats['median_us']:>10.1f}us {stats['min_us']:>10.1f}us "
+            f"{stats['stddev_us']:>8.1f}us {stats['ops_per_second']:>12.1f}"
+        )
+
+    if args.output:
+        write_results(args.output, {
+            "benchmark": "micro",
+            "environment": environment(),
+            "config": {"rounds": args.rounds, "min_round_time": args.min_round_time, "seed": args.seed},
+            "results": results
+        })
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        comparison = compare(results, load_results(args.baseline)["results"], "median_us", args.threshold)
+        print_comparison(comparison, "median_us")
+        if any(row["regression"] for row in comparison):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
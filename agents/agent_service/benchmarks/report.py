@@ -0,0 +1,116 @@
+import json
+import math
+import platform
+import subprocess
+import time
+from typing import Any, Dict, Iterable, List
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Percentile of values by linear interpolation, 0 for no values."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low, high = math.floor(rank), math.ceil(rank)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def summarize(latencies: Iterable[float]) -> Dict[str, float]:
+    """Latency summary in milliseconds.
+
+    Args:
+        latencies: Latencies in seconds.
+
+    Returns:
+        Dict with count, mean, p50, p95, p99 and max.
+    """
+    values = [latency * 1000 for latency in latencies]
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 3) if values else 0.0,
+        "p50_ms": round(percentile(values, 50), 3),
+        "p95_ms": round(percentile(values, 95), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "max_ms": round(max(values), 3) if values else 0.0
+    }
+
+
+def environment() -> Dict[str, Any]:
+    """Where and on what code a benchmark ran, for comparing runs."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except Exception:
+        commit = None
+    return {
+        "timestamp": time.time(),
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine()
+    }
+
+
+def write_results(path: str, results: Dict[str, Any]):
+    """Write benchmark results as JSON."""
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+
+
+def load_results(path: str) -> Dict[str, Any]:
+    """Read benchmark results written by write_results."""
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(
+    current: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    metric: str,
+    threshold: float,
+    higher_is_better: bool = False
+) -> List[Dict[str, Any]]:
+    """Compare a metric between two runs, case by case.
+
+    Args:
+        current: Case name -> metrics of this run.
+        baseline: Case name -> metrics of the baseline run.
+        metric: Metric to compare, e.g. "p95_ms".
+        threshold: Relative change counted as a regression, e.g. 0.1.
+        higher_is_better: Whether larger values are improvements.
+
+    Returns:
+        One entry per case present in both runs, with the relative change
+        and whether it is a regression.
+    """
+    comparison = []
+    for case, metrics in current.items():
+        before = baseline.get(case, {}).get(metric)
+        after = metrics.get(metric)
+        if not before or after is None:
+            continue
+        change = (after - before) / before
+        regression = change < -threshold if higher_is_better else change > threshold
+        comparison.append({
+            "case": case,
+            "baseline": before,
+            "current": after,
+            "change": round(change, 4),
+            "regression": regression
+        })
+    return comparison
+
+
+def print_comparison(comparison: List[Dict[str, Any]], metric: str):
+    """Print a comparison from compare as a table."""
+    print(f"\n{'case':<48} {'baseline':>12} {'current':>12} {'change':>9}")
+    for row in comparison:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(
+            f"{row['case']:<48} {row['baseline']:>12.3f} {row['current']:>12.3f} "
+            f"{row['change'] * 100:>8.1f}%{flag}"
+        )
+    print(f"({metric})")
@@ -0,0 +1,424 @@
+"""Retrieval quality against latency for the memory search backends.
+
+Loads a labelled corpus of agent memories and runs a query set against
+each backend, reporting recall@k, MRR, query latency percentiles, index
+build time and the memory the backend's index holds, for several corpus
+sizes. Backends:
+
+    pinecone      the fake Pinecone index (exact cosine), as a stand-in for
+                  the managed index; add --pinecone-latency to model the
+                  network round trip
+    local_vector  exact cosine over a float32 matrix, as hybrid search does
+                  without Pinecone
+    keyword       the substring match used when semantic search is off
+    bm25          BM25 over the agent's incremental lexical index, as hybrid
+                  search does
+    hybrid        local_vector and bm25 fused with reciprocal rank fusion
+
+The synthetic corpus clusters memories into topics, and embeddings are
+topic centroids plus per-memory noise, so vector search has a signal to
+find without a real embedding model. Queries either name an identifier
+in the target memory or paraphrase it with a few of its words; results
+are also broken down by query kind. A replayed corpus can be used
+instead: --corpus takes memory records as JSON lines (id, content,
+created_at, optional embedding) and --query-file takes {"query",
+"relevant": [ids], optional "embedding", optional "kind"} lines.
+Without embeddings the service's local hash embedding is used, which
+carries no meaning, so vector recall on such a corpus is not meaningful.
+
+    python -m benchmarks.retrieval --sizes 1000,10000,100000 --output retrieval.json
+    python -m benchmarks.retrieval --baseline retrieval.json
+
+A million memories per agent needs several GB: every vector backend holds
+its own float32 copy of the 768-dimensional embeddings. Backends are
+built one at a time and released before the next.
+"""
+import gc
+import sys
+import json
+import time
+import argparse
+import tracemalloc
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from lib.memory_service import (
+    MEMORY_DEFAULT_DIMENSION,
+    MEMORY_HYBRID_CANDIDATES,
+    MEMORY_RRF_K,
+    MemoryService
+)
+from lib.retrieval import LexicalIndex, reciprocal_rank_fusion
+from benchmarks.fakes import FakePineconeIndex, LatencyModel
+from benchmarks.report import compare, environment, load_results, print_comparison, summarize, write_results
+
+BACKENDS = ("pinecone", "local_vector", "keyword", "bm25", "hybrid")
+NAMESPACE = "bench_agent"
+
+_FILLER = (
+    "the a and of to in for with on is was that this it by from as we team "
+    "today yesterday asked about said need update follow note meeting call"
+).split()
+_SYLLABLES = "ka lo mi ne ru sa ti vo zel dar pin quo bex fim gor hul".split()
+
+
+@dataclass
+class Corpus:
+    """Memories as parallel columns; embeddings are unit-length float32 rows."""
+    ids: List[str]
+    contents: List[str]
+    created_at: List[float]
+    embeddings: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def head(self, size: int) -> "Corpus":
+        return Corpus(self.ids[:size], self.contents[:size], self.created_at[:size], self.embeddings[:size])
+
+
+@dataclass
+class Query:
+    text: str
+    embedding: np.ndarray
+    relevant: set
+    kind: str = "query"
+
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return (matrix / np.where(norms == 0, 1, norms)).astype(np.float32)
+
+
+def _words(rng: np.random.Generator, count: int, syllables: int) -> List[str]:
+    """Distinct made-up words, so topic and rare terms never collide with filler."""
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(_SYLLABLES, size=syllables)))
+    return sorted(words)
+
+
+def synthetic_corpus(
+    size: int,
+    queries: int,
+    dimension: int = MEMORY_DEFAULT_DIMENSION,
+    spread: float = 1.0,
+    query_noise: float = 6.0,
+    seed: int = 0
+) -> tuple:
+    """Generate a topic-clustered corpus and a labelled query set.
+
+    Args:
+        size: Number of memories.
+        queries: Number of queries, each with one relevant memory.
+        dimension: Embedding dimension.
+        spread: Norm of the per-memory noise around its topic centroid;
+            larger values make memories of one topic easier to tell apart.
+        query_noise: Norm of the noise added to the target embedding for
+            the query embedding; larger values make vector search harder.
+            Random noise is nearly orthogonal in high dimensions, so it has
+            to be several times the signal before neighbours compete.
+        seed: Random seed.
+
+    Returns:
+        Tuple of (Corpus, list of Query).
+    """
+    rng = np.random.default_rng(seed)
+    topics = max(10, size // 200)
+    topic_words = _words(rng, topics * 6, 3)
+    rare_words = _words(rng, max(size // 2, 100), 4)
+    centroids = _normalize(rng.standard_normal((topics, dimension)))
+    assignment = rng.integers(0, topics, size=size)
+
+    contents = []
+    identifiers: Dict[int, str] = {}
+    for i in range(size):
+        topic = assignment[i]
+        words = [topic_words[topic * 6 + j] for j in rng.choice(6, size=3, replace=False)]
+        words += [rare_words[j] for j in rng.integers(0, len(rare_words), size=2)]
+        words += list(rng.choice(_FILLER, size=int(rng.integers(6, 20))))
+        if rng.random() < 0.3:
+            identifiers[i] = f"ord-{i:07d}"
+            words.append(identifiers[i])
+        rng.shuffle(words)
+        contents.append(" ".join(words).capitalize() + ".")
+
+    embeddings = np.empty((size, dimension), dtype=np.float32)
+    for start in range(0, size, 10_000):
+        stop = min(start + 10_000, size)
+        noise = rng.standard_normal((stop - start, dimension)) * spread / np.sqrt(dimension)
+        embeddings[start:stop] = _normalize(centroids[assignment[start:stop]] + noise)
+
+    corpus = Corpus(
+        ids=[f"memory-{i}" for i in range(size)],
+        contents=contents,
+        created_at=[1_700_000_000.0 + i for i in range(size)],
+        embeddings=embeddings
+    )
+
+    query_set = []
+    for target in rng.integers(0, size, size=queries):
+        target = int(target)
+        if target in identifiers and rng.random() < 0.5:
+            kind, text = "identifier", f"what happened with {identifiers[target]}"
+        else:
+            content_words = [w.strip(".").lower() for w in contents[target].split() if w.strip(".").lower() not in _FILLER]
+            picked = rng.choice(content_words, size=min(3, len(content_words)), replace=False)
+            kind, text = "paraphrase", "anything about " + " ".join(picked)
+        noise = rng.standard_normal(dimension) * query_noise / np.sqrt(dimension)
+        query_set.append(Query(
+            text=text,
+            embedding=_normalize(embeddings[target] + noise),
+            relevant={corpus.ids[target]},
+            kind=kind
+        ))
+    return corpus, query_set
+
+
+def load_corpus(corpus_path: str, queries_path: str) -> tuple:
+    """Load a replayed corpus and query set from JSON lines files."""
+    embed = lambda text: MemoryService._generate_local_embedding(None, text)
+
+    ids, contents, created_at, embeddings = [], [], [], []
+    with open(corpus_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                memory = json.loads(line)
+                ids.append(memory["id"])
+                contents.append(memory.get("content", "") or "")
+                created_at.append(float(memory.get("created_at", 0)))
+                embeddings.append(memory.get("embedding") or embed(contents[-1]))
+    corpus = Corpus(ids, contents, created_at, _normalize(np.asarray(embeddings, dtype=np.float32)))
+
+    query_set = []
+    with open(queries_path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                query = json.loads(line)
+                query_set.append(Query(
+                    text=query["query"],
+                    embedding=_normalize(np.asarray(query.get("embedding") or embed(query["query"]), dtype=np.float32)),
+                    relevant=set(query["relevant"]),
+                    kind=query.get("kind", "query")
+                ))
+    return corpus, query_set
+
+
+class PineconeBackend:
+    def __init__(self, corpus: Corpus, latency: LatencyModel):
+        self.index = FakePineconeIndex(latency)
+        for start in range(0, len(corpus), 1000):
+            self.index.upsert([
+                (corpus.ids[i], corpus.embeddings[i], {"content": corpus.contents[i], "created_at": corpus.created_at[i]})
+                for i in range(start, min(start + 1000, len(corpus)))
+            ], namespace=NAMESPACE)
+        # The fake builds its search matrix on the first query
+        self.index.query(vector=corpus.embeddings[0], namespace=NAMESPACE, top_k=1)
+
+    def search(self, query: Query, k: int) -> List[str]:
+        results = self.index.query(vector=query.embedding, namespace=NAMESPACE, top_k=k, include_metadata=True)
+        return [match["id"] for match in results["matches"]]
+
+
+class LocalVectorBackend:
+    def __init__(self, corpus: Corpus):
+        self.ids = corpus.ids
+        self.matrix = corpus.embeddings.copy()
+
+    def search(self, query: Query, k: int) -> List[str]:
+        scores = self.matrix @ query.embedding
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        return [self.ids[i] for i in top[np.argsort(-scores[top])]]
+
+
+class KeywordBackend:
+    def __init__(self, corpus: Corpus):
+        self.service = SimpleNamespace(memory_cache={NAMESPACE: {
+            memory_id: {"id": memory_id, "content": content, "importance": 0.5, "created_at": created_at}
+            for memory_id, content, created_at in zip(corpus.ids, corpus.contents, corpus.created_at)
+        }})
+
+    def search(self, query: Query, k: int) -> List[str]:
+        results = MemoryService._search_in_memory(self.service, NAMESPACE, query.text.lower(), k)
+        return [memory["id"] for memory in results]
+
+
+class BM25Backend:
+    def __init__(self, corpus: Corpus):
+        self.index = LexicalIndex()
+        for memory_id, content in zip(corpus.ids, corpus.contents):
+            self.index.add(memory_id, content)
+
+    def search(self, query: Query, k: int) -> List[str]:
+        return [memory_id for memory_id, _ in self.index.search(query.text, limit=k)]
+
+
+class HybridBackend:
+    def __init__(self, corpus: Corpus):
+        self.vector = LocalVectorBackend(corpus)
+        self.lexical = BM25Backend(corpus)
+
+    def search(self, query: Query, k: int) -> List[str]:
+        candidates = max(k, MEMORY_HYBRID_CANDIDATES)
+        rankings = {
+            "vector": self.vector.search(query, candidates),
+            "lexical": self.lexical.search(query, candidates)
+        }
+        return [memory_id for memory_id, _, _ in reciprocal_rank_fusion(rankings, k=MEMORY_RRF_K)[:k]]
+
+
+def build_backend(name: str, corpus: Corpus, args: argparse.Namespace):
+    if name == "pinecone":
+        return PineconeBackend(corpus, LatencyModel.parse(args.pinecone_latency))
+    if name == "local_vector":
+        return LocalVectorBackend(corpus)
+    if name == "keyword":
+        return KeywordBackend(corpus)
+    if name == "bm25":
+        return BM25Backend(corpus)
+    if name == "hybrid":
+        return HybridBackend(corpus)
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def evaluate(backend: Any, queries: Sequence[Query], ks: Sequence[int]) -> Dict[str, Any]:
+    """Run every query and score the rankings.
+
+    Args:
+        backend: Object with search(query, k) returning ids best first.
+        queries: Labelled queries.
+        ks: Cutoffs for recall.
+
+    Returns:
+        Recall at each cutoff, MRR, recall at the largest cutoff per query
+        kind, and the latency summary.
+    """
+    depth = max(ks)
+    latencies = []
+    hits = {k: 0.0 for k in ks}
+    reciprocal_ranks = 0.0
+    by_kind: Dict[str, List[float]] = {}
+
+    for query in queries:
+        start = time.perf_counter()
+        ranked = backend.search(query, depth)
+        latencies.append(time.perf_counter() - start)
+
+        for k in ks:
+            hits[k] += len(query.relevant.intersection(ranked[:k])) / len(query.relevant)
+        rank = next((position for position, memory_id in enumerate(ranked, 1) if memory_id in query.relevant), None)
+        reciprocal_ranks += 1 / rank if rank else 0.0
+        by_kind.setdefault(query.kind, []).append(len(query.relevant.intersection(ranked)) / len(query.relevant))
+
+    count = len(queries) or 1
+    return {
+        **{f"recall@{k}": round(hits[k] / count, 4) for k in ks},
+        "mrr": round(reciprocal_ranks / count, 4),
+        "recall_by_kind": {kind: round(sum(values) / len(values), 4) for kind, values in by_kind.items()},
+        **summarize(latencies)
+    }
+
+
+def run_case(name: str, corpus: Corpus, queries: Sequence[Query], args: argparse.Namespace) -> Dict[str, Any]:
+    """Build one backend over a corpus, measuring its footprint, and evaluate it."""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    backend = build_backend(name, corpus, args)
+    build_s = time.perf_counter() - start
+    index_bytes, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = evaluate(backend, queries, args.k)
+    result.update({"build_s": round(build_s, 3), "index_mb": round(index_bytes / 1_048_576, 2)})
+    del backend
+    gc.collect()
+    return result
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated corpus sizes (memories per agent)")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="Comma-separated backends to run")
+    parser.add_argument("--queries", type=int, default=200, help="Synthetic queries per corpus size")
+    parser.add_argument("-k", type=lambda value: sorted(int(k) for k in value.split(",")), default=[1, 5, 10],
+                        help="Comma-separated recall cutoffs")
+    parser.add_argument("--dimension", type=int, default=MEMORY_DEFAULT_DIMENSION)
+    parser.add_argument("--spread", type=float, default=1.0, help="Memory embedding noise around its topic")
+    parser.add_argument("--query-noise", type=float, default=6.0, help="Query embedding noise around its target")
+    parser.add_argument("--pinecone-latency", default="0", help="Fake Pinecone latency as median_ms[:sigma[:error_rate]]")
+    parser.add_argument("--corpus", default=None, help="Replayed memories as JSON lines instead of a synthetic corpus")
+    parser.add_argument("--query-file", default=None, help="Labelled queries as JSON lines, required with --corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="Write results as JSON to this path")
+    parser.add_argument("--baseline", default=None, help="Results JSON of an earlier run to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Relative p95 slowdown counted as a regression")
+    parser.add_argument("--mrr-threshold", type=float, default=0.02, help="Relative MRR drop counted as a regression")
+    args = parser.parse_args(argv)
+    if args.corpus and not args.query_file:
+        parser.error("--corpus requires --query-file")
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    backends = [name.strip() for name in args.backends.split(",") if name.strip()]
+
+    if args.corpus:
+        full_corpus, all_queries = load_corpus(args.corpus, args.query_file)
+
+    results = {}
+    recall_column = f"recall@{max(args.k)}"
+    print(f"{'case':<28} {recall_column:>10} {'mrr':>7} {'p50':>10} {'p95':>10} {'index':>10} {'build':>8}")
+    for size in sizes:
+        if args.corpus:
+            corpus = full_corpus.head(size)
+            present = set(corpus.ids)
+            queries = [query for query in all_queries if query.relevant & present]
+        else:
+            corpus, queries = synthetic_corpus(
+                size, args.queries, args.dimension, args.spread, args.query_noise, args.seed
+            )
+
+        for name in backends:
+            case = f"{name}[{len(corpus)}]"
+            result = run_case(name, corpus, queries, args)
+            results[case] = result
+            print(
+                f"{case:<28} {result[recall_column]:>10.3f} {result['mrr']:>7.3f} {result['p50_ms']:>8.2f}ms "
+                f"{result['p95_ms']:>8.2f}ms {result['index_mb']:>8.1f}MB {result['build_s']:>7.1f}s"
+            )
+        del corpus, queries
+        gc.collect()
+
+    if args.output:
+        write_results(args.output, {
+            "benchmark": "retrieval",
+            "environment": environment(),
+            "config": {
+                key: getattr(args, key)
+                for key in ("sizes", "queries", "k", "dimension", "spread", "query_noise",
+                            "pinecone_latency", "corpus", "query_file", "seed")
+            },
+            "results": results
+        })
+        print(f"\nResults written to {args.output}")
+
+    if args.baseline:
+        baseline = load_results(args.baseline)["results"]
+        latency = compare(results, baseline, "p95_ms", args.threshold)
+        quality = compare(results, baseline, "mrr", args.mrr_threshold, higher_is_better=True)
+        print_comparison(latency, "p95_ms")
+        print_comparison(quality, "mrr")
+        if any(row["regression"] for row in latency + quality):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,38 @@
+"""Run the agent service for benchmarks, with Pinecone replaced by a fake index.
+
+Started by benchmarks.e2e in a subprocess; all other external services are
+pointed at the fakes through the regular environment variables.
+benchmarks.soak runs the service in its own process through
+install_fake_pinecone instead.
+"""
+import os
+from types import ModuleType
+import uvicorn
+
+from benchmarks.fakes import FakePineconeClient, FakePineconeIndex, LatencyModel
+
+
+def install_fake_pinecone(service: ModuleType):
+    """Give the service's memory store a fake Pinecone index, if BENCH_PINECONE_LATENCY is set."""
+    if os.getenv("BENCH_PINECONE_LATENCY"):
+        capacity = int(os.getenv("BENCH_PINECONE_CAPACITY", "0")) or None
+        index = FakePineconeIndex(LatencyModel.parse(os.environ["BENCH_PINECONE_LATENCY"]), capacity=capacity)
+        service.memory_service.pinecone_client = FakePineconeClient(index)
+        service.memory_service.pinecone_index = index
+
+
+def main():
+    import main as service
+
+    install_fake_pinecone(service)
+    uvicorn.run(
+        service.app,
+        host="127.0.0.1",
+        port=int(os.getenv("AGENT_PORT", "8001")),
+        log_level=os.getenv("BENCH_LOG_LEVEL", "warning"),
+        access_log=False
+    )
+
+
+if __name__ == "__main__":
+    main()
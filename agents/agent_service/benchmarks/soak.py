@@ -0,0 +1,351 @@
+"""Soak test: hours of mixed traffic while watching memory and cache growth.
+
+Runs the agent service in this process, wired to the same local fakes as
+benchmarks.e2e, and drives a weighted mix of scenarios at a fixed
+concurrency. Every sample interval it records RSS, the traced Python heap
+and its top growing allocation sites, the size of every container held by
+the service singletons (e.g. MemoryService.memory_cache,
+AgentManager.agents), and with Redis the key count and ZSET
+cardinalities. After the warmup period it fits a line to each series and
+fails if any grows faster than its configured slope.
+
+Allocation tracing slows the service down considerably; throughput in a
+soak run is not comparable with benchmarks.e2e.
+
+    python -m benchmarks.soak --duration 7200 --concurrency 16 --output soak.json
+"""
+import os
+import sys
+import time
+import random
+import asyncio
+import argparse
+import tracemalloc
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+import httpx
+
+from benchmarks.e2e import SCENARIOS, add_service_arguments, flush_redis, free_port, service_env, start_fakes
+from benchmarks.fakes import BackgroundServer, FakeStats
+from benchmarks.report import environment, summarize, write_results
+
+DEFAULT_MIX = "execute=50,memory_write=20,memory_search=20,memory_recent=5,blueprint=5"
+DEFAULT_ZSET_PATTERNS = "memory_index:*,memory_importance:*,gemini_semantic*"
+SERVICE_ATTRIBUTES = ("memory_service", "agent_manager", "gemini_service", "voice_service")
+
+_BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def rss_mb() -> float:
+    """Resident set size of this process in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1_048_576
+    except (OSError, ValueError, AttributeError):
+        import resource
+        # Peak rather than current RSS where /proc is unavailable; kilobytes on Linux, bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / (1_048_576 if sys.platform == "darwin" else 1024)
+
+
+def container_sizes(obj: Any, prefix: str, depth: int = 2) -> Dict[str, int]:
+    """Sizes of the dicts, lists and sets held by an object's attributes.
+
+    Dicts of dicts also report the total of their values' sizes as
+    ``<name>.entries``, e.g. memories across all agents in memory_cache.
+    Attributes holding other service-package objects (caches, trackers)
+    are followed up to depth levels.
+    """
+    sizes: Dict[str, int] = {}
+    for name, value in list(vars(obj).items()):
+        key = f"{prefix}.{name}"
+        if isinstance(value, (dict, list, set, tuple)) or hasattr(value, "maxlen"):
+            sizes[key] = len(value)
+            if isinstance(value, dict):
+                nested = [len(v) for v in list(value.values()) if isinstance(v, (dict, list, set))]
+                if nested:
+                    sizes[f"{key}.entries"] = sum(nested)
+        elif depth > 1 and type(value).__module__.startswith("lib.") and hasattr(value, "__dict__"):
+            sizes.update(container_sizes(value, key, depth - 1))
+    return sizes
+
+
+async def redis_sizes(client: Any, patterns: List[str]) -> Dict[str, int]:
+    """Redis key count and total/max ZSET cardinality per key pattern."""
+    sizes = {"redis.keys": await client.dbsize()}
+    for pattern in patterns:
+        total = largest = count = 0
+        async for key in client.scan_iter(match=pattern, count=1000, _type="zset"):
+            cardinality = await client.zcard(key)
+            total += cardinality
+            largest = max(largest, cardinality)
+            count += 1
+        sizes[f"redis.zsets[{pattern}].count"] = count
+        sizes[f"redis.zsets[{pattern}].members"] = total
+        sizes[f"redis.zsets[{pattern}].max"] = largest
+    return sizes
+
+
+def filtered_snapshot() -> tracemalloc.Snapshot:
+    """Snapshot of traced allocations, excluding the benchmark's own."""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, f"{_BENCHMARK_DIR}/*")
+    ])
+
+
+def top_allocators(snapshot: tracemalloc.Snapshot, baseline: tracemalloc.Snapshot, limit: int) -> List[Dict[str, Any]]:
+    """Allocation sites whose traced size grew most since the baseline."""
+    stats = snapshot.compare_to(baseline, "lineno")
+    return [
+        {
+            "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+            "size_kb": round(stat.size / 1024, 1),
+            "growth_kb": round(stat.size_diff / 1024, 1),
+            "count": stat.count
+        }
+        for stat in stats[:limit]
+    ]
+
+
+def slope_per_hour(points: List[Tuple[float, float]]) -> Optional[float]:
+    """Least-squares slope of (seconds, value) points, per hour."""
+    if len(points) < 3:
+        return None
+    n = len(points)
+    mean_t = sum(t for t, _ in points) / n
+    mean_v = sum(v for _, v in points) / n
+    variance = sum((t - mean_t) ** 2 for t, _ in points)
+    if variance == 0:
+        return None
+    covariance = sum((t - mean_t) * (v - mean_v) for t, v in points)
+    return covariance / variance * 3600
+
+
+def slope_limit(metric: str, args: argparse.Namespace) -> float:
+    if metric == "rss_mb":
+        return args.max_rss_slope
+    if metric == "heap_mb":
+        return args.max_heap_slope
+    if metric.startswith("redis."):
+        return args.max_redis_slope
+    return args.max_size_slope
+
+
+def boot_service(args: argparse.Namespace, gemini_url: str, elevenlabs_url: str, port: int) -> Tuple[Any, BackgroundServer]:
+    """Import main:app configured for the fakes and serve it on a background thread."""
+    os.environ.update(service_env(args, gemini_url, elevenlabs_url, port))
+    os.environ["BENCH_PINECONE_CAPACITY"] = str(args.pinecone_capacity)
+    import main as service
+    from benchmarks.serve import install_fake_pinecone
+
+    install_fake_pinecone(service)
+    server = BackgroundServer(service.app, port=port).start(timeout=args.startup_timeout)
+    return service, server
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    if args.tracemalloc:
+        tracemalloc.start(args.traceback_frames)
+    fake_stats = FakeStats()
+    gemini, elevenlabs = start_fakes(args, fake_stats)
+    flush_redis(args)
+    port = free_port()
+    service, server = boot_service(args, gemini.url, elevenlabs.url, port)
+
+    redis_client = None
+    if args.redis_url:
+        import redis.asyncio as redis
+        redis_client = redis.from_url(args.redis_url)
+
+    scenarios, weights = zip(*args.mix.items())
+    window: Dict[str, List[float]] = defaultdict(list)
+    window_errors: Dict[str, int] = defaultdict(int)
+    samples: List[Dict[str, Any]] = []
+    started = time.time()
+    deadline = started + args.duration
+    baseline_snapshot = None
+    result: Dict[str, Any] = {}
+
+    async def worker(client: httpx.AsyncClient, worker_id: int):
+        rng = random.Random(f"{args.seed}:soak:{worker_id}")
+        while time.time() < deadline:
+            scenario = rng.choices(scenarios, weights)[0]
+            method, path, kwargs = SCENARIOS[scenario](rng, args)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, path, **kwargs)
+                failed = response.status_code >= 400
+            except httpx.HTTPError:
+                failed = True
+            window[scenario].append(time.perf_counter() - start)
+            window_errors[scenario] += int(failed)
+
+    async def sample():
+        nonlocal baseline_snapshot
+        elapsed = time.time() - started
+        metrics: Dict[str, float] = {"rss_mb": round(rss_mb(), 2)}
+        if args.tracemalloc:
+            traced, _ = tracemalloc.get_traced_memory()
+            metrics["heap_mb"] = round(traced / 1_048_576, 2)
+        for attribute in SERVICE_ATTRIBUTES:
+            instance = getattr(service, attribute, None)
+            if instance is not None:
+                metrics.update(container_sizes(instance, attribute))
+        if redis_client is not None:
+            try:
+                metrics.update(await redis_sizes(redis_client, args.zset_patterns))
+            except Exception as e:
+                print(f"⚠️ Could not sample Redis: {e}")
+
+        allocators: List[Dict[str, Any]] = []
+        if args.tracemalloc and len(samples) % args.snapshot_every == 0:
+            # Snapshots are expensive, so only every few samples
+            if baseline_snapshot is None and elapsed >= args.warmup:
+                baseline_snapshot = filtered_snapshot()
+            elif baseline_snapshot is not None:
+                allocators = top_allocators(filtered_snapshot(), baseline_snapshot, args.top)
+        traffic = {
+            scenario: {**summarize(latencies), "errors": window_errors[scenario]}
+            for scenario, latencies in window.items()
+        }
+        window.clear()
+        window_errors.clear()
+        # The fakes keep per-call latencies; drop them so they don't show up as growth
+        fake_stats.reset()
+
+        samples.append({
+            "elapsed": round(elapsed, 1),
+            "metrics": metrics,
+            "traffic": traffic,
+            "top_allocators": allocators
+        })
+        requests = sum(t["count"] for t in traffic.values())
+        print(
+            f"[{elapsed / 60:7.1f}m] rss {metrics['rss_mb']:8.1f}MB  heap {metrics.get('heap_mb', 0):8.1f}MB  "
+            f"{requests / args.sample_interval:7.1f} req/s"
+        )
+
+        result.update(summarize_run(samples, args))
+        if args.output:
+            write_results(args.output, result)
+
+    async def sampler():
+        while time.time() < deadline:
+            await asyncio.sleep(min(args.sample_interval, max(deadline - time.time(), 0)))
+            await sample()
+
+    result.update({"benchmark": "soak", "environment": environment(), "config": _config(args)})
+    try:
+        limits = httpx.Limits(max_connections=args.concurrency * 2)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=args.timeout, limits=limits) as client:
+            rng = random.Random(args.seed)
+            for _ in range(args.seed_memories):
+                method, path, kwargs = SCENARIOS["memory_write"](rng, args)
+                await client.request(method, path, **kwargs)
+            await sample()
+            await asyncio.gather(sampler(), *(worker(client, i) for i in range(args.concurrency)))
+    finally:
+        server.stop()
+        gemini.stop()
+        elevenlabs.stop()
+        if redis_client is not None:
+            await redis_client.aclose()
+        if args.tracemalloc:
+            tracemalloc.stop()
+
+    return result
+
+
+def summarize_run(samples: List[Dict[str, Any]], args: argparse.Namespace) -> Dict[str, Any]:
+    """Growth slopes after warmup and the metrics that exceed their limit."""
+    series: Dict[str, List[Tuple[float, float]]] = defaultdict(list)
+    for s in samples:
+        if s["elapsed"] >= args.warmup:
+            for metric, value in s["metrics"].items():
+                series[metric].append((s["elapsed"], value))
+
+    slopes = {}
+    violations = []
+    for metric, points in sorted(series.items()):
+        slope = slope_per_hour(points)
+        if slope is None:
+            continue
+        limit = slope_limit(metric, args)
+        slopes[metric] = {"per_hour": round(slope, 3), "limit": limit, "first": points[0][1], "last": points[-1][1]}
+        if slope > limit:
+            violations.append(metric)
+
+    return {"samples": samples, "slopes": slopes, "violations": violations, "passed": not violations}
+
+
+def _config(args: argparse.Namespace) -> Dict[str, Any]:
+    return {
+        "duration": args.duration,
+        "concurrency": args.concurrency,
+        "mix": args.mix,
+        "sample_interval": args.sample_interval,
+        "warmup": args.warmup,
+        "max_rss_slope": args.max_rss_slope,
+        "max_heap_slope": args.max_heap_slope,
+        "max_size_slope": args.max_size_slope,
+        "max_redis_slope": args.max_redis_slope,
+        "redis": bool(args.redis_url)
+    }
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3600.0, help="Seconds of traffic")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Scenario weights as name=weight,...")
+    parser.add_argument("--sample-interval", type=float, default=60.0, help="Seconds between samples")
+    parser.add_argument("--warmup", type=float, default=300.0, help="Seconds excluded from slope fitting")
+    parser.add_argument("--max-rss-slope", type=float, default=64.0, help="Allowed RSS growth in MB/hour")
+    parser.add_argument("--max-heap-slope", type=float, default=32.0, help="Allowed traced heap growth in MB/hour")
+    parser.add_argument("--max-size-slope", type=float, default=5000.0, help="Allowed entries/hour per container")
+    parser.add_argument("--max-redis-slope", type=float, default=50000.0, help="Allowed keys or members/hour per Redis series")
+    parser.add_argument("--zset-patterns", default=DEFAULT_ZSET_PATTERNS, help="Comma-separated ZSET key patterns")
+    parser.add_argument("--tracemalloc", action=argparse.BooleanOptionalAction, default=True,
+                        help="Trace Python allocations; slows the service, so disable to measure RSS at full speed")
+    parser.add_argument("--snapshot-every", type=int, default=5, help="Samples between allocation snapshots")
+    parser.add_argument("--top", type=int, default=15, help="Top growing allocation sites per snapshot")
+    parser.add_argument("--traceback-frames", type=int, default=1, help="Frames kept per traced allocation")
+    parser.add_argument("--pinecone-capacity", type=int, default=2000, help="Vectors the fake index keeps per agent")
+    parser.add_argument("--seed", type=int, default=0)
+    add_service_arguments(parser)
+    parser.add_argument("--seed-memories", type=int, default=200, help="Memories written before sampling starts")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument("--output", default=None, help="Write samples and slopes as JSON, updated every sample")
+    args = parser.parse_args(argv)
+
+    mix = {}
+    for item in args.mix.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            parser.error(f"Unknown scenario in --mix: {name}")
+        mix[name] = float(weight or 1)
+    args.mix = mix
+    args.zset_patterns = [p for p in args.zset_patterns.split(",") if p]
+    return args
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    result = asyncio.run(run(args))
+
+    print(f"\n{'metric':<60} {'first':>10} {'last':>10} {'per hour':>12} {'limit':>10}")
+    for metric, slope in result.get("slopes", {}).items():
+        flag = "  EXCEEDED" if metric in result["violations"] else ""
+        print(f"{metric:<60} {slope['first']:>10.1f} {slope['last']:>10.1f} {slope['per_hour']:>12.1f} {slope['limit']:>10.1f}{flag}")
+
+    if result.get("violations"):
+        print(f"\n❌ Growth above limit: {', '.join(result['violations'])}")
+        return 1
+    print("\n✅ No growth above limits")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,6 +2,25 @@
 
 # This module contains utility services and libraries for the GenesisOS agent service.
 
-from .memory_service import MemoryService, get_memory_service
-from .gemini_service import GeminiService, get_gemini_service
-from .voice_service import VoiceService, get_voice_service
\ No newline at end of file
+import importlib
+
+# Services are imported on first access rather than with the package, so
+# importing a light module such as lib.text_processing (e.g. in a process
+# pool worker) does not load every service and its dependencies
+_EXPORTS = {
+    "MemoryService": "memory_service",
+    "get_memory_service": "memory_service",
+    "GeminiService": "gemini_service",
+    "get_gemini_service": "gemini_service",
+    "VoiceService": "voice_service",
+    "get_voice_service": "voice_service",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    module_name = _EXPORTS.get(name)
+    if module_name is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return getattr(importlib.import_module(f".{module_name}", __name__), name)
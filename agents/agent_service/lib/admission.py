@@ -0,0 +1,244 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+ADMISSION_CONTROL_ENABLED = os.getenv("ADMISSION_CONTROL_ENABLED", "true").lower() == "true"
+ADMISSION_WINDOW_SECONDS = int(os.getenv("ADMISSION_WINDOW_SECONDS", "60"))
+# Limits per window; 0 disables a limit
+ADMISSION_GUILD_REQUESTS = int(os.getenv("ADMISSION_GUILD_REQUESTS", "120"))
+ADMISSION_GUILD_TOKENS = int(os.getenv("ADMISSION_GUILD_TOKENS", "200000"))
+ADMISSION_USER_REQUESTS = int(os.getenv("ADMISSION_USER_REQUESTS", "60"))
+ADMISSION_USER_TOKENS = int(os.getenv("ADMISSION_USER_TOKENS", "100000"))
+# What happens to over-budget requests: reject, delay or downgrade
+ADMISSION_POLICY = os.getenv("ADMISSION_POLICY", "downgrade")
+ADMISSION_SIMULATION_POLICY = os.getenv("ADMISSION_SIMULATION_POLICY", "reject")
+ADMISSION_MAX_DELAY = float(os.getenv("ADMISSION_MAX_DELAY", "10"))
+# Downgraded requests are still rejected beyond this multiple of the budget
+ADMISSION_DOWNGRADE_CEILING = float(os.getenv("ADMISSION_DOWNGRADE_CEILING", "2.0"))
+
+POLICIES = ("reject", "delay", "downgrade")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a tenant is over budget and the policy rejects the request."""
+
+    def __init__(self, tenant: str, metric: str, retry_after: float):
+        super().__init__(f"{tenant} is over its {metric} budget, retry after {retry_after:.1f}s")
+        self.tenant = tenant
+        self.metric = metric
+        self.retry_after = retry_after
+
+
+class AdmissionTicket:
+    """An admitted request, used to settle its token reservation afterwards."""
+
+    def __init__(self, keys: List[Tuple[str, int]], reserved_tokens: int, downgraded: bool = False):
+        self.keys = keys
+        self.reserved_tokens = reserved_tokens
+        self.downgraded = downgraded
+
+
+class AdmissionController:
+    """Per-tenant request and token budgets over a sliding window.
+
+    Each tenant (guild or user) has a request counter and a token counter
+    per fixed window. The sliding-window estimate weights the previous
+    window by how much of it still overlaps, so usage does not reset at
+    window boundaries. Tokens are reserved up front from an estimate and
+    settled with the actual count once the response arrives.
+
+    Counters live in Redis when a client is attached, so budgets hold
+    across workers; otherwise they are kept in process.
+    """
+
+    def __init__(
+        self,
+        window: int = ADMISSION_WINDOW_SECONDS,
+        limits: Optional[Dict[str, Dict[str, int]]] = None,
+        policy: str = ADMISSION_POLICY,
+        simulation_policy: str = ADMISSION_SIMULATION_POLICY,
+        max_delay: float = ADMISSION_MAX_DELAY,
+        downgrade_ceiling: float = ADMISSION_DOWNGRADE_CEILING,
+        key_prefix: str = "admission"
+    ):
+        """Initialize the admission controller.
+
+        Args:
+            window: Window length in seconds.
+            limits: Per tenant kind, {"requests": n, "tokens": n} per window.
+            policy: Policy for over-budget requests: reject, delay or downgrade.
+            simulation_policy: Policy for requests made by simulations.
+            max_delay: Longest a delayed request waits before being rejected.
+            downgrade_ceiling: Multiple of the budget beyond which downgraded
+                requests are rejected too.
+            key_prefix: Redis key prefix.
+        """
+        self.window = window
+        self.limits = limits if limits is not None else {
+            "guild": {"requests": ADMISSION_GUILD_REQUESTS, "tokens": ADMISSION_GUILD_TOKENS},
+            "user": {"requests": ADMISSION_USER_REQUESTS, "tokens": ADMISSION_USER_TOKENS}
+        }
+        for name in (policy, simulation_policy):
+            if name not in POLICIES:
+                raise ValueError(f"Unknown admission policy: {name}")
+        self.policy = policy
+        self.simulation_policy = simulation_policy
+        self.max_delay = max_delay
+        self.downgrade_ceiling = downgrade_ceiling
+        self.key_prefix = key_prefix
+        self.redis_client = None
+        self._local: Dict[str, Tuple[float, int]] = {}
+        self.stats = {"admitted": 0, "rejected": 0, "delayed": 0, "downgraded": 0}
+
+    async def admit(
+        self,
+        tenants: Dict[str, Optional[str]],
+        estimated_tokens: int,
+        simulation: bool = False
+    ) -> Optional[AdmissionTicket]:
+        """Admit a request or apply the over-budget policy.
+
+        Args:
+            tenants: Tenant ids by kind, e.g. {"guild": "g1", "user": None}.
+            estimated_tokens: Tokens to reserve for the request.
+            simulation: Whether the request comes from a simulation.
+
+        Returns:
+            A ticket to settle, with ``downgraded`` set when the request must
+            use a cheaper model, or None when no budget applies.
+
+        Raises:
+            AdmissionRejected: If the request is not admitted.
+        """
+        tenants = {kind: tenant_id for kind, tenant_id in tenants.items() if tenant_id and kind in self.limits}
+        if not ADMISSION_CONTROL_ENABLED or not tenants:
+            return None
+
+        policy = self.simulation_policy if simulation else self.policy
+        deadline = time.time() + self.max_delay
+        while True:
+            keys, over = await self._reserve(tenants, estimated_tokens, 1.0)
+            if over is None:
+                self.stats["admitted"] += 1
+                return AdmissionTicket(keys, estimated_tokens)
+
+            tenant, metric, retry_after = over
+            if policy == "downgrade":
+                keys, ceiling_over = await self._reserve(tenants, estimated_tokens, self.downgrade_ceiling)
+                if ceiling_over is None:
+                    self.stats["downgraded"] += 1
+                    return AdmissionTicket(keys, estimated_tokens, downgraded=True)
+                tenant, metric, retry_after = ceiling_over
+            elif policy == "delay" and time.time() + retry_after <= deadline:
+                self.stats["delayed"] += 1
+                logger.info(f"⏳ {tenant} over its {metric} budget, delaying {retry_after:.1f}s")
+                await asyncio.sleep(retry_after)
+                continue
+
+            self.stats["rejected"] += 1
+            logger.warning(f"⚠️ Rejected request from {tenant}: over its {metric} budget")
+            raise AdmissionRejected(tenant, metric, retry_after)
+
+    async def settle(self, ticket: Optional[AdmissionTicket], actual_tokens: int):
+        """Replace a ticket's token reservation with the actual count."""
+        if ticket is None:
+            return
+        delta = actual_tokens - ticket.reserved_tokens
+        if delta == 0:
+            return
+        for key, window_index in ticket.keys:
+            await self._incr(f"{key}:tokens:{window_index}", delta)
+
+    async def _reserve(
+        self,
+        tenants: Dict[str, str],
+        tokens: int,
+        scale: float
+    ) -> Tuple[List[Tuple[str, int]], Optional[Tuple[str, str, float]]]:
+        """Count a request against every tenant, undoing it if any is over budget.
+
+        Returns:
+            Tuple of (counter keys with window index, over) where over is
+            (tenant, metric, retry_after) for the first exceeded budget.
+        """
+        now = time.time()
+        window_index = int(now // self.window)
+        overlap = 1 - (now % self.window) / self.window
+        reserved: List[Tuple[str, int, str, int]] = []
+        over = None
+
+        for kind, tenant_id in tenants.items():
+            key = f"{self.key_prefix}:{kind}:{tenant_id}"
+            for metric, amount in (("requests", 1), ("tokens", tokens)):
+                limit = self.limits[kind].get(metric, 0) * scale
+                if not limit:
+                    continue
+                current = await self._incr(f"{key}:{metric}:{window_index}", amount)
+                reserved.append((key, window_index, metric, amount))
+                previous = await self._get(f"{key}:{metric}:{window_index - 1}")
+                if previous * overlap + current > limit:
+                    # Wait until enough of the previous window has slid out
+                    excess = previous * overlap + current - limit
+                    retry_after = min(self.window, excess / previous * self.window) if previous else self.window - now % self.window
+                    over = (f"{kind} {tenant_id}", metric, max(retry_after, 0.1))
+                    break
+            if over:
+                break
+
+        if over:
+            for key, index, metric, amount in reserved:
+                await self._incr(f"{key}:{metric}:{index}", -amount)
+            return [], over
+
+        return list({(key, index) for key, index, _, _ in reserved}), None
+
+    async def _incr(self, key: str, amount: int) -> int:
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                pipe.incrby(key, amount)
+                pipe.expire(key, self.window * 2)
+                value, _ = await pipe.execute()
+                return int(value)
+            except Exception as e:
+                logger.error(f"❌ Error updating admission counter: {str(e)}")
+
+        now = time.time()
+        expires_at, value = self._local.get(key, (now + self.window * 2, 0))
+        if expires_at <= now:
+            expires_at, value = now + self.window * 2, 0
+        self._local[key] = (expires_at, value + amount)
+        if len(self._local) > 10000:
+            self._local = {k: v for k, v in self._local.items() if v[0] > now}
+        return value + amount
+
+    async def _get(self, key: str) -> int:
+        if self.redis_client:
+            try:
+                value = await self.redis_client.get(key)
+                return int(value) if value else 0
+            except Exception as e:
+                logger.error(f"❌ Error reading admission counter: {str(e)}")
+
+        expires_at, value = self._local.get(key, (0, 0))
+        return value if expires_at > time.time() else 0
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Admission configuration and counters."""
+        return {
+            "enabled": ADMISSION_CONTROL_ENABLED,
+            "window_seconds": self.window,
+            "limits": self.limits,
+            "policy": self.policy,
+            "simulation_policy": self.simulation_policy,
+            **self.stats
+        }
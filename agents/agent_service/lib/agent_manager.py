@@ -2,7 +2,7 @@ import os
 import json
 import logging
 import asyncio
-import re
+import time
 from typing import Dict, Any, List, Optional, Tuple, Callable
 import httpx
 from uuid import uuid4
@@ -10,6 +10,12 @@ from dotenv import load_dotenv
 from .memory_service import get_memory_service
 from .gemini_service import get_gemini_service
 from .voice_service import get_voice_service
+from .context_packer import ContextPacker
+from .token_counter import get_model_input_limit
+from .request_context import request_context
+from .metrics import get_metrics
+from .offload import offload, offload_cpu
+from .text_processing import extract_keywords, sanitize_input
 
 # Load environment variables
 load_dotenv()
@@ -26,9 +32,11 @@ ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")
 
 # Agent configuration
-DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "gemini-flash")
+DEFAULT_MODEL = os.getenv("DEFAULT_MODEL", "auto")  # "auto" uses the Gemini default model, or the router's choice when enabled
 AGENT_MEMORY_ENABLED = os.getenv("AGENT_MEMORY_ENABLED", "true").lower() == "true"
 VOICE_ENABLED = os.getenv("VOICE_ENABLED", "true").lower() == "true"
+AGENT_CONTEXT_TOKEN_BUDGET = int(os.getenv("AGENT_CONTEXT_TOKEN_BUDGET", "1500"))  # Max memory tokens per prompt
+AGENT_PROMPT_TOKEN_RESERVE = int(os.getenv("AGENT_PROMPT_TOKEN_RESERVE", "64"))  # Headroom for prompt scaffolding
 
 class AgentManager:
     """Manager for handling agent operations and execution."""
@@ -39,6 +47,7 @@ class AgentManager:
         self.memory_service = get_memory_service()
         self.gemini_service = get_gemini_service()
         self.voice_service = get_voice_service()
+        self.context_packer = ContextPacker(self.gemini_service.token_counter.estimate)
         logger.info("🤖 Agent Manager initialized")
         
         # Define specialized agent handlers
@@ -85,29 +94,43 @@ class AgentManager:
         logger.info(f"🤖 Executing agent {agent_id}")
         
         # Log request details at debug level
-        logger.debug(f"Input text: {input_text[:100]}...")
-        logger.debug(f"Context: {json.dumps(context)[:100]}...")
+        if logger.isEnabledFor(logging.DEBUG):
+            # Serializing a large context is too costly to do for a discarded message
+            logger.debug(f"Input text: {input_text[:100]}...")
+            logger.debug(f"Context: {json.dumps(context)[:100]}...")
         
-        # Process input with safety filters
-        processed_input = self._preprocess_input(input_text)
+        # Process input with safety filters, off the event loop for large inputs
+        processed_input = await offload_cpu(sanitize_input, input_text, size=len(input_text))
         
         # Determine agent type and execution strategy
+        start_time = time.perf_counter()
         agent_config = await self._get_agent_config(agent_id, context)
         
         # Determine which specialized handler to use
         agent_type = self._determine_agent_type(agent_id, agent_config)
+        get_metrics().observe_stage("config_resolution", time.perf_counter() - start_time, agent_type=agent_type)
         
         # Log the selected agent type
         logger.info(f"Agent type determined: {agent_type}")
+        agent_config["type"] = agent_type
         
         # Execute the appropriate specialized agent
         handler = self._get_agent_handler(agent_type)
         
-        result, thought_process = await handler(
-            processed_input,
-            context,
-            agent_config
-        )
+        # Model calls made by the handler are attributed to this agent and guild
+        with request_context(
+            agent_id=agent_id,
+            agent_type=agent_type,
+            guild_id=context.get("guild_id") or context.get("guildId"),
+            user_id=context.get("user_id") or context.get("userId"),
+            execution_id=context.get("executionId"),
+            simulation=bool(context.get("isSimulation"))
+        ), get_metrics().stage("agent_handler", model=agent_config.get("model")):
+            result, thought_process = await handler(
+                processed_input,
+                context,
+                agent_config
+            )
         
         # Post-process the result
         final_result = self._postprocess_output(result, agent_config)
@@ -177,16 +200,9 @@ class AgentManager:
         Returns:
             Processed input text.
         """
-        # Basic sanitation
-        text = input_text.strip()
-        
         # Remove any unsafe patterns (just a basic example)
         # In a real implementation, this would be more sophisticated
-        text = re.sub(r'(?i)(?:https?://|www\.)(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', 
-                     '[URL removed for security]', 
-                     text)
-        
-        return text
+        return sanitize_input(input_text)
         
     def _postprocess_output(self, output_text: str, agent_config: Dict[str, Any]) -> str:
         """Post-process agent output for consistency and safety.
@@ -271,6 +287,111 @@ class AgentManager:
         
         return temperature_map.get(agent_type, 0.5)  # Default is 0.5 (balanced)
     
+    async def _retrieve_memories(
+        self,
+        agent_config: Dict[str, Any],
+        input_text: str,
+        limit: int,
+        memory_type: Optional[str] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        include_search: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Retrieve a ranked, deduplicated list of memories for the prompt context.
+        
+        Args:
+            agent_config: The agent configuration.
+            input_text: The text input used for relevance ranking.
+            limit: Maximum number of memories.
+            memory_type: Optional type filter for recent memories.
+            metadata_filter: Optional metadata filter for recent memories.
+            include_search: Whether to include search results as candidates.
+            
+        Returns:
+            List of memory objects, most useful first.
+        """
+        if not agent_config['memory']:
+            return []
+        
+        try:
+            return await self.memory_service.retrieve_context_memories(
+                agent_config['id'],
+                input_text,
+                limit=limit,
+                memory_type=memory_type,
+                metadata_filter=metadata_filter,
+                include_search=include_search
+            )
+        except Exception as e:
+            logger.error(f"❌ Error retrieving memories: {str(e)}")
+            return []
+    
+    def _build_memory_context(
+        self,
+        memories: List[Dict[str, Any]],
+        agent_config: Dict[str, Any],
+        input_text: str,
+        system_prompt: str,
+        header: str,
+        query_label: str = "Previous query",
+        response_label: str = "Response"
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Pack ranked memories into a prompt context that fits the token budget.
+        
+        The budget is the smaller of AGENT_CONTEXT_TOKEN_BUDGET and what the
+        model's input limit leaves after the output allowance, system prompt
+        and user input.
+        
+        Args:
+            memories: Memory objects ordered best first.
+            agent_config: The agent configuration.
+            input_text: The text input.
+            system_prompt: The system prompt sent with the request.
+            header: Heading placed above the memories.
+            query_label: Label for the user side of stored conversations.
+            response_label: Label for the agent side of stored conversations.
+            
+        Returns:
+            Tuple of (memory_context, context_usage)
+        """
+        with get_metrics().stage("prompt_build"):
+            estimate = self.gemini_service.token_counter.estimate
+            base_tokens = estimate(system_prompt) + estimate(input_text)
+            model_room = (
+                get_model_input_limit(agent_config.get("model") or self.gemini_service.model)
+                - agent_config.get("max_tokens", 1024)
+                - base_tokens
+                - AGENT_PROMPT_TOKEN_RESERVE
+            )
+            budget = max(0, min(AGENT_CONTEXT_TOKEN_BUDGET, model_room))
+        
+            memory_context, context_usage = self.context_packer.pack(
+                memories,
+                budget,
+                header=header,
+                query_label=query_label,
+                response_label=response_label
+            )
+            context_usage["prompt_tokens"] = base_tokens + context_usage["context_tokens"]
+        
+        logger.info(
+            f"Prompt context for agent {agent_config['id']}: {context_usage['prompt_tokens']} tokens "
+            f"({context_usage['memories_included']}/{context_usage['memories_available']} memories, "
+            f"{context_usage['context_tokens']}/{budget} context tokens)"
+        )
+        return memory_context, context_usage
+    
+    def _append_context_usage(self, chain_of_thought: str, context_usage: Dict[str, Any]) -> str:
+        """Append prompt token usage to the chain of thought."""
+        return chain_of_thought + (
+            f"\nPrompt Tokens: {context_usage['prompt_tokens']} "
+            f"(memory context: {context_usage['context_tokens']}/{context_usage['context_budget']} tokens, "
+            f"{context_usage['memories_included']}/{context_usage['memories_available']} memories)\n"
+        )
+    
+    async def _extract_keywords(self, text: str) -> List[str]:
+        """Extract keywords, on the CPU offloader for large inputs."""
+        return await offload_cpu(extract_keywords, text, size=len(text))
+    
     async def _execute_generic_agent(
         self, 
         input_text: str, 
@@ -301,58 +422,20 @@ class AgentManager:
         Think step-by-step and explain your reasoning process.
         """
         
-        # Fetch recent memories if memory is enabled
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(agent_config['id'], limit=3)
-            
-            # Add important memories too
-            important_memories = await self.memory_service.retrieve_important_memories(agent_config['id'], limit=3)
-            
-            # Combine and deduplicate memories
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in important_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Search for relevant memories based on the input
-        relevant_memories = []
-        if agent_config['memory'] and input_text:
-            try:
-                search_results = await self.memory_service.search_memories(
-                    agent_config['id'],
-                    input_text,
-                    limit=3,
-                    use_semantic=True
-                )
-                
-                # Add search results that aren't already in memories
-                for memory in search_results:
-                    if memory['id'] not in memory_ids:
-                        relevant_memories.append(memory)
-            except Exception as e:
-                logger.error(f"❌ Error searching memories: {str(e)}")
-        
-        # Append memories to the prompt if available
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant context from previous interactions:\n"
-            for i, memory in enumerate(memories, 1):
-                memory_context += f"{i}. {memory['content']}\n"
+        # Fetch recent, important and relevant memories as one ranked list
+        memories = await self._retrieve_memories(agent_config, input_text, limit=9)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant context from previous interactions:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}"
         
         if memory_context:
-            full_prompt += f"\n\nRelevant context from previous interactions:\n{memory_context}"
-            
-        if relevant_memories:
-            relevant_context = "\nRelevant information that might help with this request:\n"
-            for i, memory in enumerate(relevant_memories, 1):
-                relevant_context += f"{i}. {memory['content']}\n"
-            
-            full_prompt += f"\n{relevant_context}"
+            full_prompt += f"\n{memory_context}"
         
         # Use Gemini to generate response
         model = agent_config.get("model", DEFAULT_MODEL)
@@ -364,9 +447,14 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=temperature,
             max_tokens=max_tokens
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store this interaction in memory if enabled
         if agent_config['memory']:
@@ -380,7 +468,7 @@ class AgentManager:
             # Store with appropriate metadata
             memory_id = await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "conversation",
@@ -477,56 +565,15 @@ class AgentManager:
         """
         
         # Get relevant memories for SEO context
-        memories = []
-        if agent_config['memory']:
-            # Get both recent and important memories
-            recent_memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'],
-                limit=3,
-                memory_type="interaction"
-            )
-            important_memories = await self.memory_service.retrieve_important_memories(
-                agent_config['id'],
-                limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in recent_memories)
-            for memory in important_memories:
-                if memory['id'] not in memory_ids:
-                    recent_memories.append(memory)
-            
-            memories = recent_memories
-            
-            # Also try to search for relevant memories based on the input
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context for SEO specific details
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant SEO context from previous interactions:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and (content.startswith('{') or content.startswith('{')):
-                    # Try to parse JSON content
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Response: {mem_data['agent_response'][:100]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(
+            agent_config, input_text, limit=7, memory_type="interaction"
+        )
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant SEO context from previous interactions:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -535,8 +582,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.4  # Lower temperature for more deterministic SEO advice
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -545,17 +597,17 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "seo",
-                    "query_keywords": extract_keywords(input_text)
+                    "query_keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "seo_conversation",
-                    "keywords": extract_keywords(input_text),
+                    "keywords": await self._extract_keywords(input_text),
                     "execution_id": context.get("executionId", str(uuid4())),
                     "tokens": await self.gemini_service.count_tokens(output_text)
                 },
@@ -615,44 +667,14 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            # Get both recent and important memories
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=5
-            )
-            
-            # Also search for topic-specific memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=3
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant business context from previous interactions:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    # Try to parse JSON content
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Key insights: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=8)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant business context from previous interactions:",
+            response_label="Key insights"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -661,8 +683,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt, 
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.3  # Lower temperature for more precise business analysis
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -671,13 +698,13 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "business_analysis",
-                    "topic_keywords": extract_keywords(input_text)
+                    "topic_keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={"type": "business_conversation"},
                 importance=0.9,  # Higher importance for business analysis
@@ -729,44 +756,15 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            # For customer support, recent interactions are important
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Also search for issue-specific memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nPrevious customer interactions:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    # Try to parse JSON content
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Customer: {mem_data['user_input']}\n"
-                            memory_context += f"   Support: {mem_data['agent_response'][:100]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:100]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:100]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:100]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Previous customer interactions:",
+            query_label="Customer",
+            response_label="Support"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -775,8 +773,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.6  # Moderate temperature for creative but consistent support
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -785,13 +788,13 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "customer_support",
-                    "issue_keywords": extract_keywords(input_text)
+                    "issue_keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={"type": "support_conversation"},
                 importance=0.75,  # Moderate importance for support interactions
@@ -850,55 +853,14 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            # For data science, both recent and topic-specific memories matter
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Also get important memories
-            important_memories = await self.memory_service.retrieve_important_memories(
-                agent_config['id'], limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in important_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-            
-            # Also search for topic-specific memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2,
-                use_semantic=True  # Use semantic search for data science
-            )
-            
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant data analysis context from previous interactions:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    # Try to parse JSON content
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Key findings: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=7)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant data analysis context from previous interactions:",
+            response_label="Key findings"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -907,8 +869,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt, 
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.3  # Lower temperature for precise data analysis
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -917,13 +884,13 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "data_science",
-                    "analysis_keywords": extract_keywords(input_text)
+                    "analysis_keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={"type": "data_analysis"},
                 importance=0.85,  # Higher importance for data analysis
@@ -978,42 +945,14 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Search for technical memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant technical context from previous interactions:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Technical solution: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant technical context from previous interactions:",
+            response_label="Technical solution"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1022,8 +961,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.3  # Lower temperature for precise technical responses
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -1032,13 +976,13 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "development",
-                    "technical_keywords": extract_keywords(input_text)
+                    "technical_keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={"type": "technical_conversation"},
                 importance=0.85,  # Higher importance for technical solutions
@@ -1132,42 +1076,13 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Search for sales-related memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant sales context:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Response: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant sales context:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1176,8 +1091,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.5  # Balanced temperature for sales responses
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -1186,17 +1106,17 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "sales",
-                    "keywords": extract_keywords(input_text)
+                    "keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "sales_conversation",
-                    "keywords": extract_keywords(input_text),
+                    "keywords": await self._extract_keywords(input_text),
                     "execution_id": context.get("executionId", str(uuid4())),
                     "tokens": await self.gemini_service.count_tokens(output_text)
                 },
@@ -1241,42 +1161,13 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Search for marketing-related memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant marketing context:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Response: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant marketing context:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1285,8 +1176,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.7  # Slightly higher temperature for creative marketing responses
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -1295,17 +1191,17 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "marketing",
-                    "keywords": extract_keywords(input_text)
+                    "keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "marketing_conversation",
-                    "keywords": extract_keywords(input_text),
+                    "keywords": await self._extract_keywords(input_text),
                     "execution_id": context.get("executionId", str(uuid4())),
                     "tokens": await self.gemini_service.count_tokens(output_text)
                 },
@@ -1349,42 +1245,13 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Search for legal-related memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant legal context:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Response: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant legal context:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1393,8 +1260,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.3  # Lower temperature for precise legal responses
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -1403,17 +1275,17 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "legal",
-                    "keywords": extract_keywords(input_text)
+                    "keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "legal_conversation",
-                    "keywords": extract_keywords(input_text),
+                    "keywords": await self._extract_keywords(input_text),
                     "execution_id": context.get("executionId", str(uuid4())),
                     "tokens": await self.gemini_service.count_tokens(output_text)
                 },
@@ -1457,42 +1329,13 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Search for finance-related memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant financial context:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Response: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant financial context:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1501,8 +1344,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.3  # Lower temperature for precise financial responses
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -1511,17 +1359,17 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "finance",
-                    "keywords": extract_keywords(input_text)
+                    "keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "finance_conversation",
-                    "keywords": extract_keywords(input_text),
+                    "keywords": await self._extract_keywords(input_text),
                     "execution_id": context.get("executionId", str(uuid4())),
                     "tokens": await self.gemini_service.count_tokens(output_text)
                 },
@@ -1565,42 +1413,13 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Search for HR-related memories
-            search_memories = await self.memory_service.search_memories(
-                agent_config['id'], input_text, limit=2
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in search_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant HR context:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous query: {mem_data['user_input']}\n"
-                            memory_context += f"   Response: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        memories = await self._retrieve_memories(agent_config, input_text, limit=5)
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant HR context:"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1609,8 +1428,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.5  # Balanced temperature for HR responses
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         # Store the interaction in memory
         if agent_config['memory']:
@@ -1619,17 +1443,17 @@ class AgentManager:
                 "agent_response": output_text,
                 "context": {
                     "type": "hr",
-                    "keywords": extract_keywords(input_text)
+                    "keywords": await self._extract_keywords(input_text)
                 }
             }
             
             await self.memory_service.store_memory(
                 agent_id=agent_config['id'],
-                content=json.dumps(conversation_memory),
+                content=await offload(json.dumps, conversation_memory, size=len(input_text) + len(output_text)),
                 memory_type="interaction",
                 metadata={
                     "type": "hr_conversation",
-                    "keywords": extract_keywords(input_text),
+                    "keywords": await self._extract_keywords(input_text),
                     "execution_id": context.get("executionId", str(uuid4())),
                     "tokens": await self.gemini_service.count_tokens(output_text)
                 },
@@ -1685,45 +1509,20 @@ class AgentManager:
         """
         
         # Get relevant memories
-        memories = []
-        if agent_config['memory']:
-            # For creative agents, previous examples and feedback are important
-            memories = await self.memory_service.retrieve_recent_memories(
-                agent_config['id'], limit=3, 
-                metadata_filter={"type": "feedback"}  # Prioritize feedback
-            )
-            
-            # Get some important memories too
-            important_memories = await self.memory_service.retrieve_important_memories(
-                agent_config['id'], limit=3
-            )
-            
-            # Combine and deduplicate
-            memory_ids = set(memory['id'] for memory in memories)
-            for memory in important_memories:
-                if memory['id'] not in memory_ids:
-                    memories.append(memory)
-                    memory_ids.add(memory['id'])
-        
-        # Format memory context
-        memory_context = ""
-        if memories:
-            memory_context = "\nRelevant creative context from previous work:\n"
-            for i, memory in enumerate(memories, 1):
-                content = memory['content']
-                if isinstance(content, str) and content.startswith('{'):
-                    # Try to parse JSON content
-                    try:
-                        mem_data = json.loads(content)
-                        if 'user_input' in mem_data and 'agent_response' in mem_data:
-                            memory_context += f"{i}. Previous request: {mem_data['user_input']}\n"
-                            memory_context += f"   Response excerpt: {mem_data['agent_response'][:150]}...\n"
-                        else:
-                            memory_context += f"{i}. {content[:150]}...\n"
-                    except:
-                        memory_context += f"{i}. {content[:150]}...\n"
-                else:
-                    memory_context += f"{i}. {content[:150]}...\n"
+        # For creative agents, previous examples and feedback are important
+        memories = await self._retrieve_memories(
+            agent_config, input_text, limit=6,
+            metadata_filter={"type": "feedback"},  # Prioritize feedback
+            include_search=False
+        )
+        
+        # Pack memories into the prompt within the token budget
+        memory_context, context_usage = self._build_memory_context(
+            memories, agent_config, input_text, system_prompt,
+            header="Relevant creative context from previous work:",
+            query_label="Previous request",
+            response_label="Response excerpt"
+        )
         
         # Construct the full prompt
         full_prompt = f"{input_text}\n\n{memory_context}"
@@ -1732,8 +1531,13 @@ class AgentManager:
         output_text, chain_of_thought = await self.gemini_service.generate_content(
             prompt=full_prompt,
             system_instruction=system_prompt,
+            agent_type=agent_config.get("type"),
+            semantic_text=input_text,
+            cache_scope=agent_config['id'],
+            model=agent_config.get("model"),
             temperature=0.6  # Moderate temperature for realistic simulation
         )
+        chain_of_thought = self._append_context_usage(chain_of_thought, context_usage)
         
         return output_text, chain_of_thought
     
@@ -1744,81 +1548,6 @@ class AgentManager:
         await self.voice_service.close()
 
 
-# Helper function to extract keywords from text
-def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
-    """Extract key terms from a text string.
-    
-    Args:
-        text: The input text.
-        max_keywords: Maximum number of keywords to extract.
-        
-    Returns:
-        List of extracted keywords.
-    """
-    # Simple implementation - split by spaces, remove common words, punctuation
-    common_words = {
-        "the", "a", "an", "and", "or", "but", "is", "are", "was", "were",
-        "in", "on", "at", "to", "for", "with", "by", "about", "like",
-        "from", "of", "as", "my", "our", "your", "their", "his", "her", "its",
-        "i", "we", "you", "they", "he", "she", "it", "this", "that",
-        "what", "which", "who", "whom", "whose", "when", "where", "why", "how",
-        "can", "could", "would", "should", "will", "shall", "may", "might",
-        "must", "have", "has", "had", "do", "does", "did", "am", "is", "are",
-        "was", "were", "be", "been", "being"
-    }
-    
-    # Tokenize and filter
-    # More robust tokenization
-    words = re.findall(r'\b[a-z0-9_\']+\b', text.lower())
-    words = [word.strip(".,;:!?\"'()[]{}-") for word in words if len(word) > 2]
-    keywords = [word for word in words if word and len(word) > 2 and word not in common_words]
-    
-    # Deduplicate
-    unique_keywords = list(set(keywords))
-    
-    # Extract phrases (bigrams) for better context
-    phrases = []
-    for i in range(len(words) - 1):
-        if words[i] not in common_words and words[i+1] not in common_words:
-            phrases.append(f"{words[i]} {words[i+1]}")
-    
-    unique_phrases = list(set(phrases))
-    
-    # Get top keywords (by frequency)
-    keyword_counts = {}
-    
-    # Count single words
-    for word in unique_keywords:
-        keyword_counts[word] = keywords.count(word)
-        
-    # Add phrases with a slight boost
-    for phrase in unique_phrases:
-        phrase_words = phrase.split()
-        # Only include phrases that appear multiple times or contain important words
-        if text.lower().count(phrase) > 1 or any(keywords.count(word) > 2 for word in phrase_words):
-            keyword_counts[phrase] = text.lower().count(phrase) * 1.5  # Boost phrases
-    
-    sorted_keywords = sorted(unique_keywords, key=lambda x: keyword_counts[x], reverse=True)
-    sorted_phrases = sorted(unique_phrases, key=lambda x: keyword_counts.get(x, 0), reverse=True)
-    
-    # Combine and deduplicate (prefer phrases over single words if they contain the same word)
-    final_keywords = []
-    for phrase in sorted_phrases[:max_keywords//2]:  # Use up to half the slots for phrases
-        final_keywords.append(phrase)
-        
-    # Fill remaining slots with single words not already in phrases
-    remaining_slots = max_keywords - len(final_keywords)
-    if remaining_slots > 0:
-        for word in sorted_keywords:
-            if not any(word in phrase for phrase in final_keywords):
-                final_keywords.append(word)
-                remaining_slots -= 1
-                if remaining_slots <= 0:
-                    break
-    
-    return final_keywords
-
-
 # Create a singleton instance for the agent manager
 _agent_manager = None
 
@@ -0,0 +1,368 @@
+import os
+import time
+import asyncio
+import inspect
+import logging
+import threading
+from typing import Any, Awaitable, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+CIRCUIT_BREAKER_ENABLED = os.getenv("CIRCUIT_BREAKER_ENABLED", "true").lower() == "true"
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_BREAKER_FAILURE_THRESHOLD", "5"))
+CIRCUIT_BREAKER_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_BREAKER_RECOVERY_TIMEOUT", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class CircuitOpenError(Exception):
+    """Raised when a call is rejected because its circuit breaker is open."""
+
+    def __init__(self, name: str):
+        super().__init__(f"Circuit breaker '{name}' is open")
+        self.name = name
+
+
+class CircuitBreaker:
+    """Closed/open/half-open circuit breaker for one external dependency.
+
+    After ``failure_threshold`` consecutive failures the breaker opens and
+    callers are rejected immediately. Once ``recovery_timeout`` has passed,
+    the breaker goes half-open: with a probe configured, the probe runs in
+    the background and closes the breaker when it succeeds; without one, a
+    single trial request is let through.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+        recovery_timeout: float = CIRCUIT_BREAKER_RECOVERY_TIMEOUT,
+        probe: Optional[Callable[[], Awaitable[Any]]] = None
+    ):
+        """Initialize the circuit breaker.
+
+        Args:
+            name: Dependency name, used in logs and status.
+            failure_threshold: Consecutive failures that open the breaker.
+            recovery_timeout: Seconds to stay open before probing for recovery.
+            probe: Optional coroutine function that raises or returns False
+                while the dependency is still down.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.probe = probe
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._probe_task: Optional[asyncio.Task] = None
+        self._lock = threading.Lock()
+        self.stats = {"failures": 0, "successes": 0, "rejected": 0, "opened": 0}
+
+    @property
+    def state(self) -> str:
+        return self._state
+
+    def set_probe(self, probe: Callable[[], Awaitable[Any]]):
+        """Set the recovery probe if none is configured yet."""
+        if self.probe is None:
+            self.probe = probe
+
+    def is_open(self) -> bool:
+        """Whether calls would be rejected right now, without side effects.
+
+        Unlike allow_request, this neither counts a rejection nor moves an
+        open breaker to half-open, so it is safe to call on every check.
+        Once the recovery timeout has passed it returns False, so the next
+        actual call goes through allow_request and starts the recovery.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return False
+
+        with self._lock:
+            if self._state == CLOSED:
+                return False
+            if self._state == OPEN:
+                return time.time() - self._opened_at < self.recovery_timeout
+            # Half-open: a probe or the single trial request is in flight
+            return self.probe is not None or self._trial_in_flight
+
+    def allow_request(self) -> bool:
+        """Whether a call to the dependency may go ahead now.
+
+        Counts a rejection and may start recovery, so call it once per call
+        that would be made; use is_open for plain checks.
+        """
+        if not CIRCUIT_BREAKER_ENABLED:
+            return True
+
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+
+            if self._state == OPEN and time.time() - self._opened_at >= self.recovery_timeout:
+                self._state = HALF_OPEN
+                if self.probe is not None:
+                    self._schedule_probe()
+                else:
+                    self._trial_in_flight = False
+
+            if self._state == HALF_OPEN and self.probe is None and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+
+            self.stats["rejected"] += 1
+            return False
+
+    def record_success(self):
+        """Record a successful call."""
+        with self._lock:
+            self.stats["successes"] += 1
+            self._failures = 0
+            if self._state != CLOSED and self.probe is None:
+                self._close()
+
+    def record_failure(self):
+        """Record a failed call."""
+        with self._lock:
+            self.stats["failures"] += 1
+            self._failures += 1
+            if self._state == HALF_OPEN and self.probe is None:
+                self._open()
+            elif self._state == CLOSED and self._failures >= self.failure_threshold:
+                self._open()
+
+    def record_status(self, status_code: int):
+        """Record an HTTP response; only 5xx and 429 count as dependency failures."""
+        if status_code >= 500 or status_code == 429:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    async def call(self, func: Callable[..., Awaitable[Any]], *args, **kwargs) -> Any:
+        """Call a coroutine function through the breaker.
+
+        Raises:
+            CircuitOpenError: If the breaker is open.
+        """
+        if not self.allow_request():
+            raise CircuitOpenError(self.name)
+        try:
+            result = await func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"state": self._state, "consecutive_failures": self._failures, **self.stats}
+
+    def _open(self):
+        if self._state != OPEN:
+            logger.warning(f"⚠️ Circuit breaker '{self.name}' opened after {self._failures} consecutive failures")
+            self.stats["opened"] += 1
+        self._state = OPEN
+        self._opened_at = time.time()
+
+    def _close(self):
+        logger.info(f"✅ Circuit breaker '{self.name}' closed, dependency recovered")
+        self._state = CLOSED
+        self._failures = 0
+
+    def _schedule_probe(self):
+        if self._probe_task is not None and not self._probe_task.done():
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Called from a worker thread; the next call on the event loop starts the probe
+            self._state = OPEN
+            return
+        self._probe_task = loop.create_task(self._run_probe())
+
+    async def _run_probe(self):
+        try:
+            healthy = await self.probe()
+        except Exception as e:
+            logger.info(f"Circuit breaker '{self.name}' probe failed: {str(e)}")
+            healthy = False
+
+        with self._lock:
+            if healthy is not False:
+                self._close()
+            else:
+                self._state = OPEN
+                self._opened_at = time.time()
+
+
+class BreakerProxy:
+    """Wraps a client so every method call goes through a circuit breaker.
+
+    A call the breaker does not allow raises CircuitOpenError without
+    reaching the client; other calls are recorded as successes or failures.
+    Pipelines the client creates are wrapped in a BreakerPipeline.
+    """
+
+    def __init__(self, target: Any, breaker: CircuitBreaker):
+        self._target = target
+        self._breaker = breaker
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+        if name == "pipeline":
+            # Creating a pipeline is local; its execute() goes through the breaker
+            return lambda *args, **kwargs: BreakerPipeline(attr(*args, **kwargs), self._breaker)
+
+        def wrapper(*args, **kwargs):
+            if not self._breaker.allow_request():
+                raise CircuitOpenError(self._breaker.name)
+            try:
+                result = attr(*args, **kwargs)
+            except Exception:
+                self._breaker.record_failure()
+                raise
+            if inspect.isawaitable(result):
+                return self._await(result)
+            self._breaker.record_success()
+            return result
+
+        return wrapper
+
+    async def _await(self, awaitable: Awaitable[Any]) -> Any:
+        try:
+            result = await awaitable
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        self._breaker.record_success()
+        return result
+
+
+class BreakerPipeline(BreakerProxy):
+    """Wraps a client pipeline so only execute() goes through the circuit breaker.
+
+    Queued commands are buffered locally and pass straight through.
+    """
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(self._target, name)
+        if not callable(attr):
+            return attr
+
+        def wrapper(*args, **kwargs):
+            result = attr(*args, **kwargs)
+            # Queueing returns the pipeline itself, for chaining
+            return self if result is self._target else result
+
+        return wrapper
+
+    async def execute(self, *args, **kwargs) -> Any:
+        if not self._breaker.allow_request():
+            raise CircuitOpenError(self._breaker.name)
+        try:
+            result = self._target.execute(*args, **kwargs)
+        except Exception:
+            self._breaker.record_failure()
+            raise
+        return await self._await(result)
+
+    async def __aenter__(self):
+        await self._target.__aenter__()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        return await self._target.__aexit__(*exc_info)
+
+
+class BreakerGuarded:
+    """Descriptor for a client attribute guarded by a named circuit breaker.
+
+    Reads return None while the breaker is open, so existing
+    ``if self.client:`` checks go straight to their fallback. Reads only
+    check the breaker's state; rejections are counted, and recovery is
+    started, by the calls made through the client's BreakerProxy. Assigned
+    clients are wrapped in a BreakerProxy, and the probe factory, if given,
+    is used to check the client for recovery.
+    """
+
+    def __init__(self, breaker_name: str, probe: Optional[Callable[[Any], Awaitable[Any]]] = None):
+        self.breaker_name = breaker_name
+        self.probe = probe
+        self.attr = None
+
+    def __set_name__(self, owner, name):
+        self.attr = f"_{name}"
+
+    def __get__(self, obj, objtype=None):
+        if obj is None:
+            return self
+        client = obj.__dict__.get(self.attr)
+        if client is None:
+            return None
+        return None if get_circuit_breaker(self.breaker_name).is_open() else client
+
+    def __set__(self, obj, value):
+        if value is None:
+            obj.__dict__[self.attr] = None
+            return
+        if isinstance(value, BreakerProxy):
+            value = value._target
+        breaker = get_circuit_breaker(self.breaker_name)
+        if self.probe is not None:
+            breaker.set_probe(lambda: self.probe(value))
+        obj.__dict__[self.attr] = BreakerProxy(value, breaker)
+
+
+def unguarded(obj: Any, name: str) -> Any:
+    """Get the client behind a BreakerGuarded attribute whatever its breaker's state.
+
+    For calls that must reach the client even during an outage, such as
+    closing its connections on shutdown.
+
+    Args:
+        obj: The object holding the attribute.
+        name: Name of the BreakerGuarded attribute.
+
+    Returns:
+        The client, or None if none was assigned.
+    """
+    client = obj.__dict__.get(f"_{name}")
+    return client._target if isinstance(client, BreakerProxy) else client
+
+
+# Breakers are shared per dependency across all services in the process
+_circuit_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def get_circuit_breaker(name: str, **kwargs) -> CircuitBreaker:
+    """Get the shared circuit breaker for a dependency, creating it if needed.
+
+    Args:
+        name: Dependency name (e.g. "gemini", "redis").
+        **kwargs: CircuitBreaker arguments used when the breaker is created.
+
+    Returns:
+        CircuitBreaker instance.
+    """
+    if name not in _circuit_breakers:
+        _circuit_breakers[name] = CircuitBreaker(name, **kwargs)
+    elif kwargs.get("probe") is not None:
+        _circuit_breakers[name].set_probe(kwargs["probe"])
+    return _circuit_breakers[name]
+
+
+def get_circuit_breakers() -> Dict[str, CircuitBreaker]:
+    """Get all circuit breakers created so far."""
+    return dict(_circuit_breakers)
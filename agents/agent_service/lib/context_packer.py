@@ -0,0 +1,170 @@
+import json
+import logging
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .token_counter import estimate_tokens
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class ContextPacker:
+    """Packs ranked memories into a prompt context under a token budget."""
+
+    def __init__(self, token_counter: Callable[[str], int] = estimate_tokens, max_dp_cells: int = 200000):
+        """Initialize the context packer.
+
+        Args:
+            token_counter: Synchronous function returning the token count of a string.
+            max_dp_cells: Upper bound on knapsack table size; token weights are
+                bucketed more coarsely for large budgets to stay under it.
+        """
+        self.count_tokens = token_counter
+        self.max_dp_cells = max_dp_cells
+
+    def pack(
+        self,
+        memories: List[Dict[str, Any]],
+        budget: int,
+        header: str = "Relevant context from previous interactions:",
+        query_label: str = "Previous query",
+        response_label: str = "Response"
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Select and format memories to fill a token budget.
+
+        Memories are chosen with a 0/1 knapsack that maximizes total rank
+        value within the budget. Leftover budget is filled with a truncated
+        copy of the best memory that did not fit whole. Selected memories keep
+        their rank order in the output.
+
+        Args:
+            memories: Memory objects ordered best first.
+            budget: Maximum tokens for the formatted context, including the header.
+            header: Heading line placed above the memories.
+            query_label: Label for the user side of stored conversations.
+            response_label: Label for the agent side of stored conversations.
+
+        Returns:
+            Tuple of (context_text, usage) where usage reports the tokens used,
+            the budget and how many memories were included or truncated.
+        """
+        usage = {
+            "context_tokens": 0,
+            "context_budget": max(budget, 0),
+            "memories_available": len(memories),
+            "memories_included": 0,
+            "memories_truncated": 0
+        }
+        if not memories or budget <= 0:
+            return "", usage
+
+        header_text = f"\n{header}\n"
+        # Entry numbers are at most a few tokens; reserve them up front
+        available = budget - self.count_tokens(header_text) - 2 * len(memories)
+        if available <= 0:
+            return "", usage
+
+        entries = [self._format_entry(memory, query_label, response_label) for memory in memories]
+        weights = [self.count_tokens(entry) for entry in entries]
+        values = [self._rank_value(memory, rank) for rank, memory in enumerate(memories)]
+
+        chosen = self._knapsack(weights, values, available)
+        remaining = available - sum(weights[i] for i in chosen)
+
+        truncated_index = None
+        for i in range(len(entries)):
+            if i in chosen:
+                continue
+            truncated = self._truncate_entry(memories[i], query_label, response_label, remaining)
+            if truncated:
+                entries[i] = truncated
+                truncated_index = i
+            break
+
+        selected = sorted(chosen | ({truncated_index} if truncated_index is not None else set()))
+        context = header_text + "".join(f"{n}. {entries[i]}" for n, i in enumerate(selected, 1))
+
+        usage["context_tokens"] = self.count_tokens(context)
+        usage["memories_included"] = len(selected)
+        usage["memories_truncated"] = 1 if truncated_index is not None else 0
+        return context, usage
+
+    def _format_entry(
+        self,
+        memory: Dict[str, Any],
+        query_label: str,
+        response_label: str,
+        response_chars: Optional[int] = None
+    ) -> str:
+        """Format a single memory as a context entry (without its number)."""
+        content = memory.get("content", "") or ""
+        if isinstance(content, str) and content.startswith("{"):
+            try:
+                mem_data = json.loads(content)
+                if "user_input" in mem_data and "agent_response" in mem_data:
+                    response = str(mem_data["agent_response"])
+                    if response_chars is not None and len(response) > response_chars:
+                        response = response[:response_chars] + "..."
+                    return (
+                        f"{query_label}: {mem_data['user_input']}\n"
+                        f"   {response_label}: {response}\n"
+                    )
+            except (ValueError, TypeError):
+                pass
+
+        content = str(content)
+        if response_chars is not None and len(content) > response_chars:
+            content = content[:response_chars] + "..."
+        return f"{content}\n"
+
+    def _truncate_entry(
+        self,
+        memory: Dict[str, Any],
+        query_label: str,
+        response_label: str,
+        token_budget: int
+    ) -> Optional[str]:
+        """Shorten a memory entry until it fits the remaining token budget."""
+        # Below this an excerpt carries too little to be worth including
+        if token_budget < 24:
+            return None
+
+        chars = token_budget * 4
+        while chars >= 40:
+            entry = self._format_entry(memory, query_label, response_label, response_chars=chars)
+            if self.count_tokens(entry) <= token_budget:
+                return entry
+            chars = int(chars * 0.75)
+        return None
+
+    def _rank_value(self, memory: Dict[str, Any], rank: int) -> float:
+        """Value of including a memory: its re-rank score if present, else rank decay."""
+        score = memory.get("relevance")
+        if score is None:
+            score = 1.0 / (rank + 1)
+        # Keep values positive and strictly decreasing with rank on ties
+        return max(float(score), 0.0) + 1e-3 / (rank + 1)
+
+    def _knapsack(self, weights: List[int], values: List[float], capacity: int) -> set:
+        """Solve 0/1 knapsack, returning the chosen item indices."""
+        scale = max(1, -(-(len(weights) * capacity) // self.max_dp_cells))
+        capacity_units = capacity // scale
+        # Round weights up so the scaled solution never exceeds the real budget
+        units = [-(-weight // scale) for weight in weights]
+
+        best = [0.0] * (capacity_units + 1)
+        keep = [[False] * (capacity_units + 1) for _ in weights]
+        for i, (weight, value) in enumerate(zip(units, values)):
+            for c in range(capacity_units, weight - 1, -1):
+                candidate = best[c - weight] + value
+                if candidate > best[c]:
+                    best[c] = candidate
+                    keep[i][c] = True
+
+        chosen = set()
+        c = capacity_units
+        for i in range(len(weights) - 1, -1, -1):
+            if keep[i][c]:
+                chosen.add(i)
+                c -= units[i]
+        return chosen
@@ -1,11 +1,25 @@
 import os
 import time
 import json
+import hashlib
 import logging
 import asyncio
-from typing import Dict, Any, List, Optional, Tuple, Union
+from typing import Dict, Any, AsyncIterator, List, Optional, Tuple, Union
 import httpx
+from uuid import uuid4
 from dotenv import load_dotenv
+from .token_counter import TokenCounter, estimate_tokens
+from .semantic_cache import SemanticCache
+from .model_router import ModelRouter, AUTO_MODEL_NAMES
+from .hedging import HedgePolicy
+from .circuit_breaker import BreakerGuarded, CircuitOpenError, get_circuit_breaker, unguarded
+from .json_stream import IncrementalJSONParser, JSONStreamError
+from .usage_tracker import get_usage_tracker
+from .admission import AdmissionController
+from .request_context import get_request_context
+from .metrics import get_metrics
+from .tracing import mark_span_error, start_span
+from .record_replay import get_transport, replay_api_key
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -31,10 +45,218 @@ GEMINI_TIMEOUT = float(os.getenv("GEMINI_TIMEOUT", "60.0"))
 GEMINI_REQUEST_CACHE_ENABLED = os.getenv("GEMINI_REQUEST_CACHE_ENABLED", "true").lower() == "true"
 GEMINI_REQUEST_CACHE_TTL = int(os.getenv("GEMINI_REQUEST_CACHE_TTL", "3600"))
 GEMINI_FALLBACK_TO_MOCK = os.getenv("GEMINI_FALLBACK_TO_MOCK", "true").lower() == "true"
+GEMINI_TOKEN_COUNT_API = os.getenv("GEMINI_TOKEN_COUNT_API", "true").lower() == "true"
+GEMINI_TOKEN_COUNT_CACHE_SIZE = int(os.getenv("GEMINI_TOKEN_COUNT_CACHE_SIZE", "10000"))
+GEMINI_TOKEN_COUNT_CACHE_TTL = int(os.getenv("GEMINI_TOKEN_COUNT_CACHE_TTL", "86400"))
+GEMINI_SEMANTIC_CACHE_ENABLED = os.getenv("GEMINI_SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+# Per agent type similarity thresholds; only agent types listed here use the semantic cache
+GEMINI_SEMANTIC_CACHE_THRESHOLDS = os.getenv("GEMINI_SEMANTIC_CACHE_THRESHOLDS", "data:0.95,finance:0.95,legal:0.96")
+GEMINI_SEMANTIC_CACHE_MAX_TEMPERATURE = float(os.getenv("GEMINI_SEMANTIC_CACHE_MAX_TEMPERATURE", "0.3"))
+GEMINI_SEMANTIC_CACHE_TTL = int(os.getenv("GEMINI_SEMANTIC_CACHE_TTL", "3600"))
+GEMINI_SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_SEMANTIC_CACHE_MAX_ENTRIES", "1000"))
+# Off by default: routing moves traffic from pro to flash, and the cascade's
+# escalation threshold has not been validated against real traffic yet
+GEMINI_ROUTER_ENABLED = os.getenv("GEMINI_ROUTER_ENABLED", "false").lower() == "true"
+GEMINI_ROUTER_STRONG_AGENT_TYPES = os.getenv("GEMINI_ROUTER_STRONG_AGENT_TYPES", "legal,finance")
+GEMINI_ROUTER_LONG_INPUT_TOKENS = int(os.getenv("GEMINI_ROUTER_LONG_INPUT_TOKENS", "8000"))
+GEMINI_ROUTER_LONG_OUTPUT_TOKENS = int(os.getenv("GEMINI_ROUTER_LONG_OUTPUT_TOKENS", "2048"))
+GEMINI_ROUTER_MAX_ERROR_RATE = float(os.getenv("GEMINI_ROUTER_MAX_ERROR_RATE", "0.5"))
+GEMINI_CASCADE_ENABLED = os.getenv("GEMINI_CASCADE_ENABLED", "true").lower() == "true"
+GEMINI_CASCADE_MIN_AVG_LOGPROB = float(os.getenv("GEMINI_CASCADE_MIN_AVG_LOGPROB", "-1.0"))
+GEMINI_HEDGE_ENABLED = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+GEMINI_HEDGE_PERCENTILE = float(os.getenv("GEMINI_HEDGE_PERCENTILE", "95"))
+GEMINI_HEDGE_BUDGET = float(os.getenv("GEMINI_HEDGE_BUDGET", "0.05"))  # Max extra requests as a fraction of traffic
+GEMINI_HEDGE_MIN_SAMPLES = int(os.getenv("GEMINI_HEDGE_MIN_SAMPLES", "20"))
+GEMINI_HEDGE_MIN_DELAY = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "0.5"))
+# Off by default: the agent system prompts are far below the minimum cacheable size
+GEMINI_CONTEXT_CACHE_ENABLED = os.getenv("GEMINI_CONTEXT_CACHE_ENABLED", "false").lower() == "true"
+GEMINI_CACHED_CONTENTS_URL = os.getenv("GEMINI_CACHED_CONTENTS_URL", GEMINI_API_URL.rsplit("/models", 1)[0] + "/cachedContents")
+# The API rejects cached contents below a model-specific minimum size
+GEMINI_CONTEXT_CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CONTEXT_CACHE_MIN_TOKENS", "1024"))
+GEMINI_CONTEXT_CACHE_TTL = int(os.getenv("GEMINI_CONTEXT_CACHE_TTL", "3600"))
+GEMINI_CONTEXT_CACHE_REFRESH_MARGIN = int(os.getenv("GEMINI_CONTEXT_CACHE_REFRESH_MARGIN", "300"))
+GEMINI_CONTEXT_CACHE_RETRY_AFTER = int(os.getenv("GEMINI_CONTEXT_CACHE_RETRY_AFTER", "3600"))
+# Structured output needs gemini-1.5 or later; disable for older models
+GEMINI_JSON_MODE_ENABLED = os.getenv("GEMINI_JSON_MODE_ENABLED", "true").lower() == "true"
+GEMINI_BLUEPRINT_ATTEMPTS = int(os.getenv("GEMINI_BLUEPRINT_ATTEMPTS", "2"))
+GEMINI_BLUEPRINT_CACHE_ENABLED = os.getenv("GEMINI_BLUEPRINT_CACHE_ENABLED", "true").lower() == "true"
+GEMINI_BLUEPRINT_CACHE_TTL = int(os.getenv("GEMINI_BLUEPRINT_CACHE_TTL", "86400"))
+GEMINI_BLUEPRINT_CACHE_STALE_AFTER = int(os.getenv("GEMINI_BLUEPRINT_CACHE_STALE_AFTER", "3600"))
+GEMINI_BLUEPRINT_CACHE_SIMILARITY = float(os.getenv("GEMINI_BLUEPRINT_CACHE_SIMILARITY", "0.97"))
+GEMINI_BLUEPRINT_CACHE_MAX_ENTRIES = int(os.getenv("GEMINI_BLUEPRINT_CACHE_MAX_ENTRIES", "500"))
+# Serve stale or near-duplicate blueprints immediately and regenerate in the background
+GEMINI_BLUEPRINT_CACHE_SWR = os.getenv("GEMINI_BLUEPRINT_CACHE_SWR", "false").lower() == "true"
+GEMINI_BLUEPRINT_PATCH_MAX_TOKENS = int(os.getenv("GEMINI_BLUEPRINT_PATCH_MAX_TOKENS", "512"))
+
+BLUEPRINT_AGENT_KEYS = ("name", "role", "description", "tools_needed")
+BLUEPRINT_WORKFLOW_KEYS = ("name", "description", "trigger_type")
+
+BLUEPRINT_SYSTEM_INSTRUCTION = """
+You are GenesisOS Blueprint Generator, an expert AI system architect specialized in designing 
+AI agent-based systems. Your role is to analyze user goals and create 
+structured blueprints for autonomous digital workforces.
+
+Your output must follow this exact JSON structure:
+{
+    "id": "blueprint-[unique_id]",
+    "user_input": "[original user input]",
+    "interpretation": "[your understanding of the user's goal]",
+    "suggested_structure": {
+        "guild_name": "[appropriate name for this guild]",
+        "guild_purpose": "[clear purpose statement]",
+        "agents": [
+            {
+                "name": "[agent name]",
+                "role": "[specific role]",
+                "description": "[detailed description]",
+                "tools_needed": ["[tool1]", "[tool2]", "..."]
+            }
+        ],
+        "workflows": [
+            {
+                "name": "[workflow name]",
+                "description": "[detailed description]",
+                "trigger_type": "[manual|schedule|webhook|event]"
+            }
+        ]
+    }
+}
+
+Create coherent, business-focused blueprints with:
+- 2-5 specialized agents with distinct roles
+- 1-3 well-defined workflows
+- Appropriate tools for each agent
+- Realistic integrations (Slack, Email, Google Sheets, etc.)
+"""
+
+_BLUEPRINT_AGENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "name": {"type": "STRING"},
+        "role": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "tools_needed": {"type": "ARRAY", "items": {"type": "STRING"}}
+    },
+    "required": list(BLUEPRINT_AGENT_KEYS),
+    "propertyOrdering": list(BLUEPRINT_AGENT_KEYS)
+}
+
+_BLUEPRINT_WORKFLOW_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "name": {"type": "STRING"},
+        "description": {"type": "STRING"},
+        "trigger_type": {"type": "STRING", "enum": ["manual", "schedule", "webhook", "event"]}
+    },
+    "required": list(BLUEPRINT_WORKFLOW_KEYS),
+    "propertyOrdering": list(BLUEPRINT_WORKFLOW_KEYS)
+}
+
+# Gemini responseSchema for blueprints. propertyOrdering makes the model
+# write the short fields first, so they can be streamed before the agents.
+BLUEPRINT_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "id": {"type": "STRING"},
+        "user_input": {"type": "STRING"},
+        "interpretation": {"type": "STRING"},
+        "suggested_structure": {
+            "type": "OBJECT",
+            "properties": {
+                "guild_name": {"type": "STRING"},
+                "guild_purpose": {"type": "STRING"},
+                "agents": {
+                    "type": "ARRAY",
+                    "items": _BLUEPRINT_AGENT_SCHEMA
+                },
+                "workflows": {
+                    "type": "ARRAY",
+                    "items": _BLUEPRINT_WORKFLOW_SCHEMA
+                }
+            },
+            "required": ["guild_name", "guild_purpose", "agents", "workflows"],
+            "propertyOrdering": ["guild_name", "guild_purpose", "agents", "workflows"]
+        }
+    },
+    "required": ["id", "user_input", "interpretation", "suggested_structure"],
+    "propertyOrdering": ["id", "user_input", "interpretation", "suggested_structure"]
+}
+
+BLUEPRINT_PATCH_SYSTEM_INSTRUCTION = """
+You are GenesisOS Blueprint Editor. You are given an existing blueprint for a guild of AI agents,
+the goal it was designed for and an edited version of that goal. Return only the changes needed
+for the blueprint to serve the edited goal:
+- "interpretation", "guild_name" and "guild_purpose" only if they should change
+- for "agents" and "workflows": "update" replaces the entry at an existing index with a complete
+  new entry, "add" lists complete new entries, "remove" lists indexes of entries to delete
+
+Keep every agent and workflow that still fits the edited goal exactly as it is and do not repeat
+unchanged entries. If nothing needs to change, return empty lists.
+"""
+
+
+def _patch_list_schema(item_schema: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "type": "OBJECT",
+        "properties": {
+            "update": {
+                "type": "ARRAY",
+                "items": {
+                    "type": "OBJECT",
+                    "properties": {"index": {"type": "INTEGER"}, "value": item_schema},
+                    "required": ["index", "value"]
+                }
+            },
+            "add": {"type": "ARRAY", "items": item_schema},
+            "remove": {"type": "ARRAY", "items": {"type": "INTEGER"}}
+        },
+        "required": ["update", "add", "remove"]
+    }
+
+
+# Gemini responseSchema for incremental blueprint edits
+BLUEPRINT_PATCH_RESPONSE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "interpretation": {"type": "STRING"},
+        "guild_name": {"type": "STRING"},
+        "guild_purpose": {"type": "STRING"},
+        "agents": _patch_list_schema(_BLUEPRINT_AGENT_SCHEMA),
+        "workflows": _patch_list_schema(_BLUEPRINT_WORKFLOW_SCHEMA)
+    },
+    "required": ["agents", "workflows"],
+    "propertyOrdering": ["interpretation", "guild_name", "guild_purpose", "agents", "workflows"]
+}
+
+# Blueprint fields streamed to clients as soon as they are complete
+_BLUEPRINT_STREAM_FIELDS = {
+    ("interpretation",): "interpretation",
+    ("suggested_structure", "guild_name"): "guild_name",
+    ("suggested_structure", "guild_purpose"): "guild_purpose",
+    ("suggested_structure", "agents", "*"): "agent",
+    ("suggested_structure", "workflows", "*"): "workflow"
+}
+
+
+def _parse_thresholds(value: str) -> Dict[str, float]:
+    """Parse "type:threshold,type:threshold" into a dict, skipping bad entries."""
+    thresholds = {}
+    for item in value.split(","):
+        name, _, threshold = item.partition(":")
+        try:
+            thresholds[name.strip()] = float(threshold)
+        except ValueError:
+            if item.strip():
+                logger.warning(f"⚠️ Ignoring invalid semantic cache threshold: {item}")
+    return thresholds
+
 
 class GeminiService:
     """Service for interacting with Google's Gemini AI models."""
     
+    # Cache reads are skipped while the shared Redis circuit breaker is open
+    redis_client = BreakerGuarded("redis", probe=lambda client: client.ping())
+    
     def __init__(self, 
                  api_key: Optional[str] = None, 
                  model: str = GEMINI_DEFAULT_MODEL, 
@@ -50,9 +272,9 @@ class GeminiService:
             retry_attempts: Number of retry attempts for failed requests.
             retry_delay: Delay between retry attempts in seconds.
         """
-        self.api_key = api_key or GEMINI_API_KEY
+        self.api_key = replay_api_key(api_key or GEMINI_API_KEY)
         self.model = model
-        self.client = httpx.AsyncClient(timeout=timeout)
+        self.client = httpx.AsyncClient(timeout=timeout, transport=get_transport("gemini"))
         self.redis_client = None
         self.retry_attempts = retry_attempts
         self.retry_delay = retry_delay
@@ -63,6 +285,65 @@ class GeminiService:
         else:
             self.use_mock = False
             logger.info(f"🧠 Gemini service initialized with model: {model} (timeout: {timeout}s, retries: {retry_attempts})")
+        
+        self.token_counter = TokenCounter(
+            api_url=GEMINI_API_URL,
+            api_key=None if self.use_mock else self.api_key,
+            http_client=self.client,
+            model=model,
+            use_api=GEMINI_TOKEN_COUNT_API,
+            cache_size=GEMINI_TOKEN_COUNT_CACHE_SIZE,
+            cache_ttl=GEMINI_TOKEN_COUNT_CACHE_TTL
+        )
+        
+        self.semantic_cache_thresholds = _parse_thresholds(GEMINI_SEMANTIC_CACHE_THRESHOLDS)
+        self.semantic_cache = SemanticCache(
+            ttl=GEMINI_SEMANTIC_CACHE_TTL,
+            max_entries=GEMINI_SEMANTIC_CACHE_MAX_ENTRIES,
+            key_prefix="gemini_semantic"
+        )
+        
+        self.model_router = ModelRouter(
+            fast_model=GEMINI_FLASH_MODEL,
+            strong_model=GEMINI_PRO_MODEL,
+            strong_agent_types=[t.strip() for t in GEMINI_ROUTER_STRONG_AGENT_TYPES.split(",") if t.strip()],
+            long_input_tokens=GEMINI_ROUTER_LONG_INPUT_TOKENS,
+            long_output_tokens=GEMINI_ROUTER_LONG_OUTPUT_TOKENS,
+            max_error_rate=GEMINI_ROUTER_MAX_ERROR_RATE,
+            cascade=GEMINI_ROUTER_ENABLED and GEMINI_CASCADE_ENABLED,
+            min_avg_logprob=GEMINI_CASCADE_MIN_AVG_LOGPROB
+        )
+        
+        self.hedge_policy = HedgePolicy(
+            percentile=GEMINI_HEDGE_PERCENTILE,
+            budget=GEMINI_HEDGE_BUDGET,
+            min_samples=GEMINI_HEDGE_MIN_SAMPLES,
+            min_delay=GEMINI_HEDGE_MIN_DELAY
+        ) if GEMINI_HEDGE_ENABLED else None
+        
+        self.usage_tracker = get_usage_tracker()
+        self.metrics = get_metrics()
+        self.admission = AdmissionController()
+        
+        # Shared with other callers of the Gemini API, e.g. memory embeddings
+        self.circuit_breaker = get_circuit_breaker("gemini", probe=self._probe_api)
+        
+        # cachedContents by hash of model and system instruction
+        self._context_caches: Dict[str, Dict[str, Any]] = {}
+        self._context_cache_locks: Dict[str, asyncio.Lock] = {}
+        
+        # Blueprints by normalized input and by input embedding. The version
+        # hashes the instruction and schema, so changing either one starts
+        # a fresh namespace and old entries just expire.
+        self.blueprint_cache = SemanticCache(
+            ttl=GEMINI_BLUEPRINT_CACHE_TTL,
+            max_entries=GEMINI_BLUEPRINT_CACHE_MAX_ENTRIES,
+            key_prefix="gemini_blueprint_semantic"
+        )
+        self.blueprint_cache_version = hashlib.sha256(
+            f"{BLUEPRINT_SYSTEM_INSTRUCTION}:{json.dumps(BLUEPRINT_RESPONSE_SCHEMA, sort_keys=True)}:{GEMINI_JSON_MODE_ENABLED}".encode()
+        ).hexdigest()[:16]
+        self._blueprint_refreshes: Dict[str, asyncio.Task] = {}
             
     async def initialize_cache(self, redis_url: Optional[str] = None):
         """Initialize Redis cache for request caching.
@@ -83,6 +364,11 @@ class GeminiService:
             import redis.asyncio as redis
             self.redis_client = redis.from_url(redis_url)
             await self.redis_client.ping()
+            self.token_counter.redis_client = self.redis_client
+            self.semantic_cache.redis_client = self.redis_client
+            self.blueprint_cache.redis_client = self.redis_client
+            self.usage_tracker.redis_client = self.redis_client
+            self.admission.redis_client = self.redis_client
             logger.info("✅ Connected to Redis for Gemini request caching")
         except Exception as e:
             logger.error(f"❌ Failed to connect to Redis: {str(e)}")
@@ -98,7 +384,11 @@ class GeminiService:
         top_p: float = 0.95, 
         top_k: int = 40,
         cache_key: Optional[str] = None,
-        fallback_to_mock: Optional[bool] = None
+        fallback_to_mock: Optional[bool] = None,
+        agent_type: Optional[str] = None,
+        semantic_text: Optional[str] = None,
+        cache_scope: Optional[str] = None,
+        model: Optional[str] = None
     ) -> Tuple[str, str]:
         """Generate text content using Gemini model.
         
@@ -111,35 +401,118 @@ class GeminiService:
             top_k: Top-k sampling parameter.
             cache_key: Optional key for caching. If None, will be generated from prompt.
             fallback_to_mock: Whether to fall back to mock responses if API fails.
+            agent_type: Optional agent type, used to opt into the semantic cache.
+            semantic_text: The user's own text within the prompt, embedded for semantic
+                cache lookups and used for mock responses. Defaults to the prompt.
+            cache_scope: Optional scope, e.g. an agent id, that semantic cache hits must share.
+            model: Optional model. None or "auto" lets the model router choose and
+                escalate low-confidence output to the strong model.
             
         Returns:
             Tuple of (generated_text, chain_of_thought)
+            
+        Raises:
+            AdmissionRejected: If the caller's guild or user is over budget and
+                the admission policy rejects the request.
         """
         # Use mock if API key isn't valid or explicitly requested
         if self.use_mock or (fallback_to_mock is not None and fallback_to_mock):
-            return self._generate_mock_response(prompt, system_instruction)
+            return self._generate_mock_response(semantic_text or prompt, system_instruction)
+        
+        model, route_reason = self._select_model(model, agent_type, prompt, system_instruction, max_tokens)
         
         # Check cache if enabled
         if self.redis_client and GEMINI_REQUEST_CACHE_ENABLED:
-            cache_result = await self._check_cache(prompt, system_instruction, cache_key)
+            cache_result = await self._check_cache(prompt, system_instruction, cache_key, model)
+            self.metrics.record_cache("gemini_exact", "hit" if cache_result else "miss")
             if cache_result:
                 logger.info("✅ Retrieved response from cache")
+                self.usage_tracker.record(model, cache="exact")
                 return cache_result
         
+        # Skip straight to the fallback while Gemini is failing
+        if not self.circuit_breaker.allow_request():
+            if GEMINI_FALLBACK_TO_MOCK:
+                logger.warning("⚠️ Gemini circuit breaker is open, using mock response")
+                return self._generate_mock_response(semantic_text or prompt, system_instruction)
+            raise CircuitOpenError("gemini")
+        
+        # Near-duplicate prompts to deterministic agents can reuse an earlier answer
+        semantic_namespace = None
+        semantic_embedding = None
+        threshold = self._semantic_cache_threshold(agent_type, temperature)
+        if threshold is not None:
+            semantic_namespace = self._semantic_cache_namespace(agent_type, system_instruction, max_tokens, cache_scope, model)
+            semantic_embedding = await self._embed_for_cache(semantic_text or prompt)
+            if semantic_embedding is not None:
+                hit = await self.semantic_cache.lookup(semantic_namespace, semantic_embedding, threshold)
+                self.metrics.record_cache("gemini_semantic", "hit" if hit else "miss")
+                if hit:
+                    cached, similarity = hit
+                    logger.info(f"✅ Retrieved response from semantic cache (similarity {similarity:.3f})")
+                    self.usage_tracker.record(model, cache="semantic")
+                    return (
+                        cached["output_text"],
+                        f"cache: semantic (similarity {similarity:.3f})\n{cached['chain_of_thought']}"
+                    )
+        
+        # Enforce the tenant's budgets; cache hits above cost nothing and skip this
+        context = get_request_context()
+        ticket = await self.admission.admit(
+            {"guild": context.get("guild_id"), "user": context.get("user_id")},
+            self.token_counter.estimate(prompt) + self.token_counter.estimate(system_instruction) + max_tokens,
+            simulation=bool(context.get("simulation"))
+        )
+        admission_note = ""
+        if ticket and ticket.downgraded and model != GEMINI_FLASH_MODEL:
+            logger.warning(f"⚠️ Over budget, downgrading {model} to {GEMINI_FLASH_MODEL}")
+            model, route_reason = GEMINI_FLASH_MODEL, "requested"
+            admission_note = "Admission: downgraded, tenant over budget\n"
+        
+        actual_tokens = 0
         try:
-            output_text, chain_of_thought = await self._make_api_request(
+            output_text, chain_of_thought, response_meta = await self._make_api_request(
                 prompt=prompt,
                 system_instruction=system_instruction,
                 temperature=temperature,
                 max_tokens=max_tokens,
                 top_p=top_p,
-                top_k=top_k
+                top_k=top_k,
+                model=model
             )
+            actual_tokens += response_meta.get("total_tokens") or 0
+            chain_of_thought = f"{admission_note}Routing: {model} ({route_reason})\n" + chain_of_thought
+            
+            # Cascade: retry output that looks unusable on the strong model
+            escalation = self.model_router.escalation_model(model) if route_reason != "requested" else None
+            if escalation and self.model_router.should_escalate(
+                output_text, response_meta.get("finish_reason"), response_meta.get("avg_logprobs")
+            ):
+                self.model_router.escalations += 1
+                logger.warning(f"⚠️ Low-confidence response from {model}, escalating to {escalation}")
+                output_text, escalated_thought, response_meta = await self._make_api_request(
+                    prompt=prompt,
+                    system_instruction=system_instruction,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    top_p=top_p,
+                    top_k=top_k,
+                    model=escalation
+                )
+                actual_tokens += response_meta.get("total_tokens") or 0
+                chain_of_thought = f"Routing: escalated from {model} to {escalation}\n" + escalated_thought
             
-            # Store in cache if enabled
+            # Store in cache if enabled, under the routed model so the next lookup finds it
             if self.redis_client and GEMINI_REQUEST_CACHE_ENABLED:
                 await self._store_in_cache(
-                    prompt, system_instruction, output_text, chain_of_thought, cache_key
+                    prompt, system_instruction, output_text, chain_of_thought, cache_key, model
+                )
+            
+            if semantic_embedding is not None and output_text:
+                await self.semantic_cache.store(
+                    semantic_namespace,
+                    semantic_embedding,
+                    {"output_text": output_text, "chain_of_thought": chain_of_thought}
                 )
             
             return output_text, chain_of_thought
@@ -147,6 +520,8 @@ class GeminiService:
             logger.error(f"❌ Error calling Gemini API: {str(error)}")
             
             # If fallback is enabled, use mock response
+            if GEMINI_FALLBACK_TO_MOCK and isinstance(error, CircuitOpenError):
+                return self._generate_mock_response(semantic_text or prompt, system_instruction)
             if GEMINI_FALLBACK_TO_MOCK:
                 return (
                     f"I encountered an error while processing your request but I'll try to help based on my general knowledge.",
@@ -154,17 +529,114 @@ class GeminiService:
                 )
             else:
                 raise
+        finally:
+            await self.admission.settle(ticket, actual_tokens)
                 
-    async def _make_api_request(
+    async def _probe_api(self) -> bool:
+        """Check whether the Gemini API is reachable, for circuit breaker recovery."""
+        response = await self.client.get(f"{GEMINI_API_URL}/{self.model}?key={self.api_key}")
+        return response.status_code < 500 and response.status_code != 429
+    
+    def _select_model(
         self,
+        model: Optional[str],
+        agent_type: Optional[str],
         prompt: str,
-        system_instruction: Optional[str] = None,
-        temperature: float = 0.7,
-        max_tokens: int = 1024,
-        top_p: float = 0.95,
-        top_k: int = 40
+        system_instruction: Optional[str],
+        max_tokens: int
     ) -> Tuple[str, str]:
-        """Make an API request to Gemini with retry logic.
+        """Resolve the model for a request.
+        
+        Args:
+            model: Model requested by the caller, if any.
+            agent_type: Agent type of the caller.
+            prompt: The prompt text.
+            system_instruction: The system instruction, if any.
+            max_tokens: Requested output allowance.
+            
+        Returns:
+            Tuple of (model, reason).
+        """
+        if not GEMINI_ROUTER_ENABLED:
+            if model and model.lower() not in AUTO_MODEL_NAMES:
+                return model, "requested"
+            return self.model, "default"
+        
+        input_tokens = self.token_counter.estimate(prompt) + self.token_counter.estimate(system_instruction)
+        return self.model_router.choose(model, agent_type, input_tokens, max_tokens)
+    
+    def _semantic_cache_threshold(self, agent_type: Optional[str], temperature: float) -> Optional[float]:
+        """Get the similarity threshold for a request, or None if it should not use the semantic cache.
+        
+        Args:
+            agent_type: Agent type of the caller.
+            temperature: Sampling temperature of the request.
+            
+        Returns:
+            Cosine similarity threshold, or None.
+        """
+        if not GEMINI_SEMANTIC_CACHE_ENABLED or not agent_type:
+            return None
+        # Reusing answers is only sound where the model is near-deterministic anyway
+        if temperature > GEMINI_SEMANTIC_CACHE_MAX_TEMPERATURE:
+            return None
+        return self.semantic_cache_thresholds.get(agent_type)
+    
+    def _semantic_cache_namespace(
+        self,
+        agent_type: str,
+        system_instruction: Optional[str],
+        max_tokens: int,
+        cache_scope: Optional[str] = None,
+        model: Optional[str] = None
+    ) -> str:
+        """Build the semantic cache namespace for a request.
+        
+        The system instruction and scope are matched exactly through the
+        namespace, so only prompts to the same agent are compared by similarity.
+        """
+        instruction_hash = hashlib.sha256((system_instruction or "").encode()).hexdigest()[:16]
+        return f"{agent_type}:{cache_scope or '*'}:{model or self.model}:{max_tokens}:{instruction_hash}"
+    
+    async def _embed_for_cache(self, text: str) -> Optional[List[float]]:
+        """Embed text for a semantic cache lookup.
+        
+        Unlike generate_embeddings this never substitutes a random embedding,
+        which could produce false cache hits.
+        
+        Args:
+            text: Text to embed.
+            
+        Returns:
+            Embedding vector, or None if embedding failed.
+        """
+        try:
+            url = f"{GEMINI_API_URL}/{GEMINI_EMBEDDING_MODEL}:embedContent?key={self.api_key}"
+            response = await self.client.post(url, json={
+                "model": f"models/{GEMINI_EMBEDDING_MODEL}",
+                "content": {"parts": [{"text": text}]}
+            })
+            self.circuit_breaker.record_status(response.status_code)
+            if response.status_code != 200:
+                logger.warning(f"⚠️ Semantic cache embedding failed: {response.status_code}")
+                return None
+            return response.json()["embedding"]["values"]
+        except Exception as e:
+            logger.warning(f"⚠️ Semantic cache embedding failed: {str(e)}")
+            return None
+    
+    async def _build_request_body(
+        self,
+        prompt: str,
+        system_instruction: Optional[str],
+        temperature: float,
+        max_tokens: int,
+        top_p: float,
+        top_k: int,
+        model: str,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Tuple[Dict[str, Any], Optional[str]]:
+        """Build a generateContent request body.
         
         Args:
             prompt: The text prompt to send to the model.
@@ -173,12 +645,13 @@ class GeminiService:
             max_tokens: Maximum tokens to generate.
             top_p: Nucleus sampling parameter.
             top_k: Top-k sampling parameter.
-        
+            model: Model the request is for.
+            response_schema: Optional schema; the response is then constrained to JSON.
+            
         Returns:
-            Tuple of (generated_text, chain_of_thought)
+            Tuple of (request_body, cached_content) where cached_content is the
+            context cache name used for the system instruction, if any.
         """
-        url = f"{GEMINI_API_URL}/{self.model}:generateContent?key={self.api_key}"
-        
         # Construct request body
         request_body = {
             "contents": [{"parts": [{"text": prompt}]}],
@@ -208,25 +681,107 @@ class GeminiService:
             ]
         }
         
-        # Add system instruction if provided
-        if system_instruction:
+        # Add system instruction if provided, from a context cache when it is large enough
+        cached_content = await self._get_cached_content(system_instruction, model)
+        if cached_content:
+            request_body["cachedContent"] = cached_content
+        elif system_instruction:
             request_body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+        
+        # Structured output: the model can only produce JSON matching the schema
+        if response_schema is not None and GEMINI_JSON_MODE_ENABLED:
+            request_body["generationConfig"]["responseMimeType"] = "application/json"
+            request_body["generationConfig"]["responseSchema"] = response_schema
+        
+        return request_body, cached_content
+    
+    async def _make_api_request(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        top_p: float = 0.95,
+        top_k: int = 40,
+        model: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> Tuple[str, str, Dict[str, Any]]:
+        """Make an API request to Gemini with retry logic.
+        
+        Args:
+            prompt: The text prompt to send to the model.
+            system_instruction: Optional system instruction.
+            temperature: Controls randomness.
+            max_tokens: Maximum tokens to generate.
+            top_p: Nucleus sampling parameter.
+            top_k: Top-k sampling parameter.
+            model: Model to call. Defaults to the service model.
+            response_schema: Optional schema constraining the output to JSON.
+        
+        Returns:
+            Tuple of (generated_text, chain_of_thought, response_meta) where
+            response_meta holds the model, finish reason, avgLogprobs and
+            total token count.
+        """
+        model = model or self.model
+        url = f"{GEMINI_API_URL}/{model}:generateContent?key={self.api_key}"
+        response_meta: Dict[str, Any] = {"model": model, "finish_reason": None, "avg_logprobs": None, "total_tokens": None}
+        
+        request_body, cached_content = await self._build_request_body(
+            prompt, system_instruction, temperature, max_tokens, top_p, top_k, model, response_schema
+        )
             
         # Implement retry logic
         for attempt in range(self.retry_attempts):
+            # Stop retrying as soon as the breaker opens
+            if attempt > 0 and not self.circuit_breaker.allow_request():
+                raise CircuitOpenError("gemini")
+            
             try:
                 # Make API request
                 start_time = time.time()
-                response = await self.client.post(
-                    url,
-                    json=request_body
-                )
+                with start_span(
+                    "gemini.generate_content",
+                    **{"gen_ai.request.model": model, "genesis.attempt": attempt + 1, "genesis.cached_content": bool(cached_content)}
+                ) as span:
+                    try:
+                        if self.hedge_policy:
+                            response = await self.hedge_policy.run(
+                                lambda: self.client.post(url, json=request_body),
+                                self.model_router.model_stats(model),
+                                is_success=lambda r: r.status_code == 200
+                            )
+                        else:
+                            response = await self.client.post(
+                                url,
+                                json=request_body
+                            )
+                    except Exception:
+                        self.model_router.record(model, time.time() - start_time, False)
+                        self.circuit_breaker.record_failure()
+                        self.usage_tracker.record(model, latency=time.time() - start_time, error=True)
+                        self.metrics.observe_stage("gemini_call", time.time() - start_time, True, model)
+                        raise
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    if response.status_code != 200:
+                        mark_span_error(span, f"Gemini API error: {response.status_code}")
                 response_time = time.time() - start_time
+                self.model_router.record(model, response_time, response.status_code == 200)
+                self.metrics.observe_stage("gemini_call", response_time, response.status_code != 200, model)
+                self.circuit_breaker.record_status(response.status_code)
                 
                 if response.status_code != 200:
+                    self.usage_tracker.record(model, latency=response_time, error=True)
                     error_msg = f"❌ Gemini API error: {response.status_code} {response.text[:1000]}"
                     logger.error(error_msg)
                     
+                    # A cache deleted or expired behind our back; resend the instruction inline
+                    if cached_content and response.status_code in (400, 403, 404):
+                        await self._invalidate_cached_content(system_instruction, model)
+                        request_body.pop("cachedContent", None)
+                        request_body["systemInstruction"] = {"parts": [{"text": system_instruction}]}
+                        cached_content = None
+                    
                     if attempt < self.retry_attempts - 1:
                         wait_time = self.retry_delay * (attempt + 1)  # Exponential backoff
                         logger.info(f"Retrying in {wait_time:.1f}s (attempt {attempt + 1}/{self.retry_attempts})")
@@ -264,11 +819,28 @@ class GeminiService:
                     # If finishReason is present, add it to chain of thought
                     if "finishReason" in candidate:
                         chain_of_thought += f"\nFinish Reason: {candidate['finishReason']}\n"
+                    response_meta["finish_reason"] = candidate.get("finishReason")
+                    response_meta["avg_logprobs"] = candidate.get("avgLogprobs")
                     
                     # Add model details
-                    chain_of_thought += f"\nModel: {self.model}\n"
+                    chain_of_thought += f"\nModel: {model}\n"
                     chain_of_thought += f"Temperature: {temperature}\n"
                     chain_of_thought += f"Max Tokens: {max_tokens}\n"
+                    if cached_content:
+                        chain_of_thought += f"Context Cache: {cached_content}\n"
+                    
+                    # Token usage comes free with the response; keep it for counting and calibration
+                    usage = response_data.get("usageMetadata", {})
+                    self._track_usage(model, usage, response_time)
+                    response_meta["total_tokens"] = usage.get("totalTokenCount")
+                    if usage:
+                        await self._record_usage(usage, prompt, system_instruction, output_text)
+                        chain_of_thought += (
+                            f"Token Usage: prompt {usage.get('promptTokenCount', 0)}, "
+                            f"cached {usage.get('cachedContentTokenCount', 0)}, "
+                            f"output {usage.get('candidatesTokenCount', 0)}, "
+                            f"total {usage.get('totalTokenCount', 0)}\n"
+                        )
                 else:
                     logger.warning("⚠️ Unexpected Gemini API response format")
                     if attempt < self.retry_attempts - 1:
@@ -280,9 +852,11 @@ class GeminiService:
                         output_text = "I'm sorry, I encountered an issue processing your request."
                         chain_of_thought = f"Unexpected API response format: {str(response_data)[:500]}"
                 
-                logger.info(f"✅ Gemini response generated in {response_time:.2f}s")
-                return output_text, chain_of_thought
+                logger.info(f"✅ Gemini response generated by {model} in {response_time:.2f}s")
+                return output_text, chain_of_thought, response_meta
                 
+            except CircuitOpenError:
+                raise
             except Exception as e:
                 logger.error(f"❌ Error in attempt {attempt + 1}/{self.retry_attempts}: {str(e)}")
                 if attempt < self.retry_attempts - 1:
@@ -294,12 +868,233 @@ class GeminiService:
         
         # This should not be reached due to the exception in the last retry attempt
         raise Exception("All retry attempts failed")
+    
+    async def _stream_api_request(
+        self,
+        prompt: str,
+        system_instruction: Optional[str] = None,
+        temperature: float = 0.7,
+        max_tokens: int = 1024,
+        top_p: float = 0.95,
+        top_k: int = 40,
+        model: Optional[str] = None,
+        response_schema: Optional[Dict[str, Any]] = None
+    ) -> AsyncIterator[str]:
+        """Stream generated text from Gemini as it is produced.
+        
+        Uses streamGenerateContent with server-sent events. There is no retry
+        here: a failure can happen after text has been yielded, so callers
+        decide how to start over.
+        
+        Args:
+            prompt: The text prompt to send to the model.
+            system_instruction: Optional system instruction.
+            temperature: Controls randomness.
+            max_tokens: Maximum tokens to generate.
+            top_p: Nucleus sampling parameter.
+            top_k: Top-k sampling parameter.
+            model: Model to call. Defaults to the service model.
+            response_schema: Optional schema constraining the output to JSON.
+            
+        Yields:
+            Chunks of generated text.
+        """
+        model = model or self.model
+        url = f"{GEMINI_API_URL}/{model}:streamGenerateContent?alt=sse&key={self.api_key}"
+        request_body, cached_content = await self._build_request_body(
+            prompt, system_instruction, temperature, max_tokens, top_p, top_k, model, response_schema
+        )
+        
+        if not self.circuit_breaker.allow_request():
+            raise CircuitOpenError("gemini")
+        
+        start_time = time.time()
+        status_recorded = False
+        output_text = ""
+        usage: Dict[str, Any] = {}
+        # Not the current span: this generator may resume in another context
+        with start_span("gemini.stream_generate_content", current=False, **{"gen_ai.request.model": model}) as span:
+            try:
+                async with self.client.stream("POST", url, json=request_body) as response:
+                    self.circuit_breaker.record_status(response.status_code)
+                    span.set_attribute("http.response.status_code", response.status_code)
+                    status_recorded = True
+                
+                    if response.status_code != 200:
+                        error_text = (await response.aread()).decode("utf-8", errors="replace")
+                        if cached_content and response.status_code in (400, 403, 404):
+                            await self._invalidate_cached_content(system_instruction, model)
+                        raise Exception(f"Gemini API error: {response.status_code} {error_text[:1000]}")
+                
+                    async for line in response.aiter_lines():
+                        if not line.startswith("data:"):
+                            continue
+                        chunk = json.loads(line[5:])
+                        usage = chunk.get("usageMetadata", usage)
+                        for candidate in chunk.get("candidates", [])[:1]:
+                            for part in candidate.get("content", {}).get("parts", []):
+                                if "text" in part:
+                                    output_text += part["text"]
+                                    yield part["text"]
+            except Exception:
+                self.model_router.record(model, time.time() - start_time, False)
+                if not status_recorded:
+                    self.circuit_breaker.record_failure()
+                self.usage_tracker.record(model, latency=time.time() - start_time, error=True)
+                self.metrics.observe_stage("gemini_stream", time.time() - start_time, True, model)
+                raise
+        
+        response_time = time.time() - start_time
+        self.model_router.record(model, response_time, True)
+        self.metrics.observe_stage("gemini_stream", response_time, False, model)
+        self._track_usage(model, usage, response_time)
+        if usage:
+            await self._record_usage(usage, prompt, system_instruction, output_text)
+        logger.info(f"✅ Gemini stream from {model} completed in {response_time:.2f}s")
 
+    def _context_cache_key(self, system_instruction: str, model: str) -> str:
+        return hashlib.sha256(f"{model}:{system_instruction}".encode()).hexdigest()
+    
+    async def _get_cached_content(self, system_instruction: Optional[str], model: str) -> Optional[str]:
+        """Get the name of a cachedContents resource holding a system instruction.
+        
+        Caches are created on first use, shared across workers through Redis,
+        and have their TTL extended when they are about to expire. If creation
+        fails (e.g. the instruction is below the model's minimum), the
+        instruction is sent inline until GEMINI_CONTEXT_CACHE_RETRY_AFTER passes.
+        
+        Args:
+            system_instruction: The system instruction for the request.
+            model: The model the request goes to; caches are model specific.
+            
+        Returns:
+            The cachedContents resource name, or None to send the instruction inline.
+        """
+        if not GEMINI_CONTEXT_CACHE_ENABLED or not system_instruction:
+            return None
+        if self.token_counter.estimate(system_instruction) < GEMINI_CONTEXT_CACHE_MIN_TOKENS:
+            return None
+        
+        key = self._context_cache_key(system_instruction, model)
+        entry = self._context_caches.get(key)
+        if entry and entry["expires_at"] - time.time() > GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+            return entry.get("name")
+        
+        lock = self._context_cache_locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            entry = self._context_caches.get(key) or await self._load_context_cache_entry(key)
+            now = time.time()
+            if entry and entry["expires_at"] - now > GEMINI_CONTEXT_CACHE_REFRESH_MARGIN:
+                self._context_caches[key] = entry
+                return entry.get("name")
+            
+            try:
+                if entry and entry.get("name") and entry["expires_at"] > now:
+                    response = await self.client.patch(
+                        f"{GEMINI_CACHED_CONTENTS_URL}/{entry['name'].split('/')[-1]}?updateMask=ttl&key={self.api_key}",
+                        json={"ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s"}
+                    )
+                    action = "Refreshed"
+                else:
+                    response = await self.client.post(
+                        f"{GEMINI_CACHED_CONTENTS_URL}?key={self.api_key}",
+                        json={
+                            "model": f"models/{model}",
+                            "systemInstruction": {"parts": [{"text": system_instruction}]},
+                            "ttl": f"{GEMINI_CONTEXT_CACHE_TTL}s"
+                        }
+                    )
+                    action = "Created"
+                if response.status_code != 200:
+                    raise Exception(f"{response.status_code} {response.text[:200]}")
+                
+                entry = {"name": response.json()["name"], "expires_at": now + GEMINI_CONTEXT_CACHE_TTL}
+                logger.info(f"✅ {action} Gemini context cache {entry['name']}")
+            except Exception as e:
+                if entry and entry.get("name") and entry["expires_at"] > now:
+                    # Refresh failed but the cache is still live; retry on a later request
+                    logger.warning(f"⚠️ Failed to refresh Gemini context cache: {str(e)}")
+                    return entry["name"]
+                logger.warning(f"⚠️ Gemini context cache unavailable, sending system instruction inline: {str(e)}")
+                entry = {"name": None, "expires_at": now + GEMINI_CONTEXT_CACHE_RETRY_AFTER}
+            
+            self._context_caches[key] = entry
+            await self._store_context_cache_entry(key, entry)
+            return entry["name"]
+    
+    async def _invalidate_cached_content(self, system_instruction: str, model: str):
+        """Forget the context cache for a system instruction so it is recreated."""
+        key = self._context_cache_key(system_instruction, model)
+        self._context_caches.pop(key, None)
+        if self.redis_client:
+            try:
+                await self.redis_client.delete(f"gemini_context_cache:{key}")
+            except Exception as e:
+                logger.error(f"❌ Error invalidating context cache entry: {str(e)}")
+    
+    async def _load_context_cache_entry(self, key: str) -> Optional[Dict[str, Any]]:
+        if not self.redis_client:
+            return None
+        try:
+            data = await self.redis_client.get(f"gemini_context_cache:{key}")
+            return json.loads(data) if data else None
+        except Exception as e:
+            logger.error(f"❌ Error reading context cache entry: {str(e)}")
+            return None
+    
+    async def _store_context_cache_entry(self, key: str, entry: Dict[str, Any]):
+        if not self.redis_client:
+            return
+        try:
+            ttl = max(1, int(entry["expires_at"] - time.time()))
+            await self.redis_client.setex(f"gemini_context_cache:{key}", ttl, json.dumps(entry))
+        except Exception as e:
+            logger.error(f"❌ Error storing context cache entry: {str(e)}")
+    
+    def _track_usage(self, model: str, usage: Dict[str, Any], latency: float):
+        """Queue a usage record for a completed model call."""
+        self.usage_tracker.record(
+            model,
+            prompt_tokens=usage.get("promptTokenCount", 0),
+            output_tokens=usage.get("candidatesTokenCount", 0),
+            cached_tokens=usage.get("cachedContentTokenCount", 0),
+            latency=latency
+        )
+    
+    async def _record_usage(
+        self,
+        usage: Dict[str, Any],
+        prompt: str,
+        system_instruction: Optional[str],
+        output_text: str
+    ):
+        """Feed usageMetadata from a generate response into the token counter.
+        
+        The output count primes the token count cache, so counting the
+        response afterwards needs no extra API call. The prompt count
+        calibrates the local estimate.
+        
+        Args:
+            usage: The usageMetadata object from the response.
+            prompt: The prompt text sent.
+            system_instruction: The system instruction sent, if any.
+            output_text: The generated text.
+        """
+        output_tokens = usage.get("candidatesTokenCount")
+        if output_text and output_tokens:
+            await self.token_counter.record(output_text, output_tokens)
+        
+        prompt_tokens = usage.get("promptTokenCount")
+        if prompt_tokens:
+            prompt_text = f"{system_instruction or ''}\n{prompt}"
+            self.token_counter.calibrate(estimate_tokens(prompt_text), prompt_tokens)
+    
     async def _check_cache(
         self,
         prompt: str,
         system_instruction: Optional[str] = None,
-        cache_key: Optional[str] = None
+        cache_key: Optional[str] = None,
+        model: Optional[str] = None
     ) -> Optional[Tuple[str, str]]:
         """Check if a response is cached.
         
@@ -307,6 +1102,7 @@ class GeminiService:
             prompt: The prompt text.
             system_instruction: Optional system instruction.
             cache_key: Optional explicit cache key.
+            model: Model the response is for. Defaults to the service model.
             
         Returns:
             Cached response tuple or None if not found.
@@ -317,7 +1113,7 @@ class GeminiService:
         try:
             # Generate cache key if not provided
             if cache_key is None:
-                cache_key = f"gemini:{self.model}:{prompt}"
+                cache_key = f"gemini:{model or self.model}:{prompt}"
                 if system_instruction:
                     cache_key += f":{system_instruction}"
 
@@ -342,7 +1138,8 @@ class GeminiService:
         system_instruction: Optional[str],
         output_text: str,
         chain_of_thought: str,
-        cache_key: Optional[str] = None
+        cache_key: Optional[str] = None,
+        model: Optional[str] = None
     ):
         """Store a response in the cache.
         
@@ -352,6 +1149,7 @@ class GeminiService:
             output_text: The generated text response.
             chain_of_thought: The chain of thought explanation.
             cache_key: Optional explicit cache key.
+            model: Model the response is for. Defaults to the service model.
         """
         if not self.redis_client:
             return
@@ -359,7 +1157,7 @@ class GeminiService:
         try:
             # Generate cache key if not provided
             if cache_key is None:
-                cache_key = f"gemini:{self.model}:{prompt}"
+                cache_key = f"gemini:{model or self.model}:{prompt}"
                 if system_instruction:
                     cache_key += f":{system_instruction}"
             
@@ -385,101 +1183,466 @@ class GeminiService:
         except Exception as e:
             logger.error(f"❌ Error storing in cache: {str(e)}")
     
-    async def generate_blueprint(self, user_input: str) -> Dict[str, Any]:
+    async def generate_blueprint(
+        self,
+        user_input: str,
+        stale_while_revalidate: Optional[bool] = None
+    ) -> Dict[str, Any]:
         """Generate a GenesisOS blueprint from user input.
         
         Args:
             user_input: The user's description of what they want to build.
+            stale_while_revalidate: Serve stale or near-duplicate cached
+                blueprints while regenerating in the background. Defaults to
+                GEMINI_BLUEPRINT_CACHE_SWR.
             
         Returns:
             A blueprint dictionary with guild structure.
         """
-        if self.use_mock:
-            return self._generate_mock_blueprint(user_input)
+        blueprint, _ = await self.generate_blueprint_with_status(user_input, stale_while_revalidate)
+        return blueprint
+    
+    async def generate_blueprint_with_status(
+        self,
+        user_input: str,
+        stale_while_revalidate: Optional[bool] = None
+    ) -> Tuple[Dict[str, Any], str]:
+        """Generate a blueprint and report how the blueprint cache served it.
         
-        try:
-            # System instruction specific to blueprint generation
-            system_instruction = """
-            You are GenesisOS Blueprint Generator, an expert AI system architect specialized in designing 
-            AI agent-based systems. Your role is to analyze user goals and create 
-            structured blueprints for autonomous digital workforces.
-            
-            Your output must follow this exact JSON structure:
-            {
-                "id": "blueprint-[unique_id]",
-                "user_input": "[original user input]",
-                "interpretation": "[your understanding of the user's goal]",
-                "suggested_structure": {
-                    "guild_name": "[appropriate name for this guild]",
-                    "guild_purpose": "[clear purpose statement]",
-                    "agents": [
-                        {
-                            "name": "[agent name]",
-                            "role": "[specific role]",
-                            "description": "[detailed description]",
-                            "tools_needed": ["[tool1]", "[tool2]", "..."]
-                        }
-                    ],
-                    "workflows": [
-                        {
-                            "name": "[workflow name]",
-                            "description": "[detailed description]",
-                            "trigger_type": "[manual|schedule|webhook|event]"
-                        }
-                    ]
-                }
-            }
-            
-            Create coherent, business-focused blueprints with:
-            - 2-5 specialized agents with distinct roles
-            - 1-3 well-defined workflows
-            - Appropriate tools for each agent
-            - Realistic integrations (Slack, Email, Google Sheets, etc.)
-            """
-            
-            # Design the prompt for Gemini
-            prompt = f"""
-            Create a complete blueprint for an AI-powered digital workforce based on this user goal:
-            
-            "{user_input}"
+        Args:
+            user_input: The user's description of what they want to build.
+            stale_while_revalidate: See generate_blueprint.
             
-            Design a system of intelligent AI agents working together to achieve this goal.
-            Include specialized agents with clear roles, appropriate tools, and workflow automations.
-            """
+        Returns:
+            Tuple of (blueprint, cache_status) where cache_status is "hit",
+            "similar", "stale", "miss" or "disabled".
+        """
+        try:
+            async for event in self.stream_blueprint(user_input, stale_while_revalidate):
+                if event["event"] == "blueprint":
+                    return event["data"], event["cache"]
+        except Exception as e:
+            logger.error(f"❌ Blueprint generation error: {str(e)}")
+        return self._generate_mock_blueprint(user_input), "miss"
+    
+    async def stream_blueprint(
+        self,
+        user_input: str,
+        stale_while_revalidate: Optional[bool] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Generate a blueprint, yielding its parts as soon as each is complete.
+        
+        Cached blueprints are looked up first by normalized input, then by
+        input embedding similarity. On a miss the model is asked for JSON
+        constrained by BLUEPRINT_RESPONSE_SCHEMA and its output is parsed
+        while it streams in. Malformed JSON or an incomplete agent or
+        workflow aborts the attempt at once and a new one starts, on the
+        escalation model when the router has one. After the last attempt the
+        mock blueprint is streamed instead.
+        
+        Args:
+            user_input: The user's description of what they want to build.
+            stale_while_revalidate: See generate_blueprint.
             
-            # Get response from Gemini
-            output_text, chain_of_thought = await self.generate_content(
+        Yields:
+            Event dicts with "event" set to one of "interpretation",
+            "guild_name", "guild_purpose", "agent", "workflow", "retry" or
+            "blueprint", and the value in "data". Agents and workflows also
+            carry their "index". After "retry", parts already sent must be
+            discarded. "blueprint" is always last, holds the full blueprint
+            and its "cache" status (see generate_blueprint_with_status).
+        """
+        if stale_while_revalidate is None:
+            stale_while_revalidate = GEMINI_BLUEPRINT_CACHE_SWR
+        
+        cache_enabled = GEMINI_BLUEPRINT_CACHE_ENABLED and not self.use_mock
+        cache_status = "disabled"
+        embedding = None
+        if cache_enabled:
+            cached, cache_status, embedding = await self._lookup_blueprint(user_input)
+            self.metrics.record_cache("blueprint", cache_status)
+            if cached is not None and (cache_status != "stale" or stale_while_revalidate):
+                if cache_status != "hit" and stale_while_revalidate:
+                    self._schedule_blueprint_refresh(user_input, embedding)
+                logger.info(f"✅ Blueprint served from cache ({cache_status})")
+                for event in self._blueprint_events(cached, cache=cache_status):
+                    yield event
+                return
+        
+        async for event in self._stream_generated_blueprint(user_input):
+            if event["event"] == "blueprint":
+                if event.pop("source") == "gemini" and cache_enabled:
+                    await self._store_blueprint(user_input, embedding, event["data"])
+                event["cache"] = cache_status if cache_status == "disabled" else "miss"
+            yield event
+    
+    async def _stream_generated_blueprint(self, user_input: str) -> AsyncIterator[Dict[str, Any]]:
+        """Generate a blueprint with the model; see stream_blueprint.
+        
+        The final "blueprint" event has "source" set to "gemini" or "mock".
+        """
+        if self.use_mock or not self.circuit_breaker.allow_request():
+            for event in self._blueprint_events(self._generate_mock_blueprint(user_input), source="mock"):
+                yield event
+            return
+        
+        # Design the prompt for Gemini
+        prompt = f"""
+        Create a complete blueprint for an AI-powered digital workforce based on this user goal:
+        
+        "{user_input}"
+        
+        Design a system of intelligent AI agents working together to achieve this goal.
+        Include specialized agents with clear roles, appropriate tools, and workflow automations.
+        """
+        
+        model, _ = self._select_model(None, None, prompt, BLUEPRINT_SYSTEM_INSTRUCTION, 2048)
+        for attempt in range(GEMINI_BLUEPRINT_ATTEMPTS):
+            parser = IncrementalJSONParser(_BLUEPRINT_STREAM_FIELDS, lenient=not GEMINI_JSON_MODE_ENABLED)
+            stream = self._stream_api_request(
                 prompt=prompt,
-                system_instruction=system_instruction,
+                system_instruction=BLUEPRINT_SYSTEM_INSTRUCTION,
                 temperature=0.7,
-                max_tokens=2048
+                max_tokens=2048,
+                model=model,
+                response_schema=BLUEPRINT_RESPONSE_SCHEMA
             )
+            try:
+                async for chunk in stream:
+                    for path, value in parser.feed(chunk):
+                        event = self._blueprint_stream_event(path, value)
+                        if event is None:
+                            raise JSONStreamError(f"Incomplete {path[1]} entry at index {path[2]}")
+                        yield event
+                
+                blueprint = parser.close()
+                if not isinstance(blueprint, dict) or not self._validate_blueprint(blueprint):
+                    raise JSONStreamError("Blueprint is missing required fields")
+                
+                logger.info(f"✅ Blueprint generated successfully with {len(blueprint['suggested_structure']['agents'])} agents")
+                yield {"event": "blueprint", "data": blueprint, "source": "gemini"}
+                return
+            except CircuitOpenError:
+                break
+            except Exception as e:
+                logger.warning(f"⚠️ Blueprint attempt {attempt + 1}/{GEMINI_BLUEPRINT_ATTEMPTS} from {model} failed: {str(e)}")
+                if isinstance(e, JSONStreamError) and self.model_router.escalation_model(model):
+                    self.model_router.escalations += 1
+                    model = self.model_router.escalation_model(model)
+                if attempt < GEMINI_BLUEPRINT_ATTEMPTS - 1:
+                    yield {"event": "retry", "data": {"reason": str(e), "model": model}}
+            finally:
+                # Stops the model generating output nobody will read
+                await stream.aclose()
+        
+        logger.warning("⚠️ Falling back to mock blueprint")
+        yield {"event": "retry", "data": {"reason": "Blueprint generation failed", "model": "mock"}}
+        for event in self._blueprint_events(self._generate_mock_blueprint(user_input), source="mock"):
+            yield event
+    
+    def _blueprint_stream_event(self, path: Tuple[Any, ...], value: Any) -> Optional[Dict[str, Any]]:
+        """Turn a completed blueprint field into a stream event.
+        
+        Returns:
+            The event, or None if an agent or workflow is missing required keys.
+        """
+        event_type = _BLUEPRINT_STREAM_FIELDS[path[:2] + ("*",) if len(path) == 3 else path]
+        if event_type == "agent" or event_type == "workflow":
+            keys = BLUEPRINT_AGENT_KEYS if event_type == "agent" else BLUEPRINT_WORKFLOW_KEYS
+            if not isinstance(value, dict) or not all(key in value for key in keys):
+                return None
+            return {"event": event_type, "index": path[2], "data": value}
+        return {"event": event_type, "data": value}
+    
+    def _blueprint_events(self, blueprint: Dict[str, Any], **extra: Any) -> List[Dict[str, Any]]:
+        """Stream events for an already complete blueprint.
+        
+        Args:
+            blueprint: The blueprint.
+            **extra: Additional keys for the final "blueprint" event.
+        """
+        structure = blueprint["suggested_structure"]
+        events = [
+            {"event": "interpretation", "data": blueprint["interpretation"]},
+            {"event": "guild_name", "data": structure["guild_name"]},
+            {"event": "guild_purpose", "data": structure["guild_purpose"]}
+        ]
+        events += [{"event": "agent", "index": i, "data": agent} for i, agent in enumerate(structure["agents"])]
+        events += [{"event": "workflow", "index": i, "data": workflow} for i, workflow in enumerate(structure["workflows"])]
+        events.append({"event": "blueprint", "data": blueprint, **extra})
+        return events
+    
+    @staticmethod
+    def _normalize_blueprint_input(user_input: str) -> str:
+        """Normalize a goal sentence for exact cache matching."""
+        return " ".join(user_input.lower().split()).rstrip(".!?")
+    
+    def _blueprint_cache_key(self, user_input: str) -> str:
+        digest = hashlib.sha256(self._normalize_blueprint_input(user_input).encode()).hexdigest()
+        return f"gemini_blueprint:{self.blueprint_cache_version}:{digest}"
+    
+    async def _lookup_blueprint(
+        self,
+        user_input: str
+    ) -> Tuple[Optional[Dict[str, Any]], str, Optional[List[float]]]:
+        """Look up a cached blueprint for a goal.
+        
+        Args:
+            user_input: The user's description of what they want to build.
             
-            # Extract JSON from response
+        Returns:
+            Tuple of (blueprint, status, embedding). The blueprint is None on a
+            miss and otherwise a copy with a new ID; status is "hit" or "similar", or "stale" once the entry is
+            older than GEMINI_BLUEPRINT_CACHE_STALE_AFTER. The input
+            embedding, if computed, is returned for storing the result.
+        """
+        entry = None
+        status = "miss"
+        embedding = None
+        
+        if self.redis_client:
             try:
-                # Look for JSON structure in the response
-                json_start = output_text.find('{')
-                json_end = output_text.rfind('}') + 1
-                if json_start >= 0 and json_end > json_start:
-                    json_str = output_text[json_start:json_end]
-                    blueprint = json.loads(json_str)
-                    
-                    # Validate the blueprint has the required structure
-                    if not self._validate_blueprint(blueprint):
-                        logger.warning("⚠️ Generated blueprint is missing required fields")
-                        blueprint = self._generate_mock_blueprint(user_input)
-                    
-                    logger.info(f"✅ Blueprint generated successfully with {len(blueprint['suggested_structure']['agents'])} agents")
-                    return blueprint
-                else:
-                    logger.warning("⚠️ No valid JSON found in Gemini response")
-                    return self._generate_mock_blueprint(user_input)
-            except json.JSONDecodeError:
-                logger.error(f"❌ Failed to parse JSON from Gemini response: {output_text[:200]}...")
-                return self._generate_mock_blueprint(user_input)
+                cached_data = await self.redis_client.get(self._blueprint_cache_key(user_input))
+                if cached_data:
+                    entry = json.loads(cached_data)
+                    status = "hit"
+            except Exception as e:
+                logger.error(f"❌ Error checking blueprint cache: {str(e)}")
+        
+        if entry is None and self.circuit_breaker.allow_request():
+            embedding = await self._embed_for_cache(self._normalize_blueprint_input(user_input))
+            if embedding is not None:
+                match = await self.blueprint_cache.lookup(
+                    self.blueprint_cache_version, embedding, GEMINI_BLUEPRINT_CACHE_SIMILARITY
+                )
+                if match:
+                    entry, similarity = match
+                    status = "hit" if entry["normalized_input"] == self._normalize_blueprint_input(user_input) else "similar"
+                    logger.info(f"Blueprint cache {status} match with similarity {similarity:.3f}")
+        
+        if entry is None:
+            return None, status, embedding
+        
+        if time.time() - entry["created_at"] > GEMINI_BLUEPRINT_CACHE_STALE_AFTER:
+            status = "stale"
+        
+        # Near-duplicates were generated for a different sentence, and each
+        # caller gets its own ID since blueprints are stored by ID downstream
+        blueprint = dict(entry["blueprint"], id=f"blueprint-{uuid4()}", user_input=user_input)
+        return blueprint, status, embedding
+    
+    async def _store_blueprint(
+        self,
+        user_input: str,
+        embedding: Optional[List[float]],
+        blueprint: Dict[str, Any]
+    ):
+        """Store a generated blueprint under its normalized input and embedding."""
+        entry = {
+            "blueprint": blueprint,
+            "normalized_input": self._normalize_blueprint_input(user_input),
+            "created_at": time.time()
+        }
+        
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(
+                    self._blueprint_cache_key(user_input),
+                    GEMINI_BLUEPRINT_CACHE_TTL,
+                    json.dumps(entry)
+                )
+            except Exception as e:
+                logger.error(f"❌ Error storing blueprint in cache: {str(e)}")
+        
+        if embedding is None and self.circuit_breaker.allow_request():
+            embedding = await self._embed_for_cache(entry["normalized_input"])
+        if embedding is not None:
+            await self.blueprint_cache.store(
+                self.blueprint_cache_version,
+                embedding,
+                entry,
+                entry_id=self._blueprint_cache_key(user_input).rsplit(":", 1)[1]
+            )
+    
+    def _schedule_blueprint_refresh(self, user_input: str, embedding: Optional[List[float]]):
+        """Regenerate a blueprint in the background, once per normalized input."""
+        key = self._normalize_blueprint_input(user_input)
+        if key in self._blueprint_refreshes:
+            return
+        
+        task = asyncio.create_task(self._refresh_blueprint(user_input, embedding))
+        self._blueprint_refreshes[key] = task
+        task.add_done_callback(lambda _: self._blueprint_refreshes.pop(key, None))
+    
+    async def _refresh_blueprint(self, user_input: str, embedding: Optional[List[float]]):
+        try:
+            async for event in self._stream_generated_blueprint(user_input):
+                if event["event"] == "blueprint" and event["source"] == "gemini":
+                    await self._store_blueprint(user_input, embedding, event["data"])
+                    logger.info("✅ Blueprint cache refreshed in the background")
         except Exception as e:
-            logger.error(f"❌ Blueprint generation error: {str(e)}")
-            return self._generate_mock_blueprint(user_input)
+            logger.error(f"❌ Background blueprint refresh failed: {str(e)}")
+    
+    async def regenerate_blueprint(self, previous: Dict[str, Any], user_input: str) -> Dict[str, Any]:
+        """Update an existing blueprint for an edited goal.
+        
+        The model sees the previous blueprint and both goals and returns only
+        the changed fields and entries, within GEMINI_BLUEPRINT_PATCH_MAX_TOKENS.
+        Unchanged agents and workflows keep their index and the blueprint
+        keeps its id. If no usable patch comes back, a full blueprint is
+        generated and diffed against the previous one instead.
+        
+        Args:
+            previous: The blueprint generated for the earlier goal.
+            user_input: The edited goal.
+            
+        Returns:
+            Dict with the "patch", the patched "blueprint" and the "mode" used,
+            "patch" or "full".
+            
+        Raises:
+            ValueError: If the previous blueprint is malformed.
+        """
+        if not self._validate_blueprint(previous):
+            raise ValueError("Previous blueprint is missing required fields")
+        
+        if self._normalize_blueprint_input(user_input) == self._normalize_blueprint_input(previous["user_input"]):
+            patch = self._empty_blueprint_patch(previous, user_input)
+            return {"patch": patch, "blueprint": self._apply_blueprint_patch(previous, patch), "mode": "patch"}
+        
+        if not self.use_mock and self.circuit_breaker.allow_request():
+            structure = previous["suggested_structure"]
+            # Entries keyed by index, which is what the patch refers to
+            current = {
+                "interpretation": previous["interpretation"],
+                "guild_name": structure["guild_name"],
+                "guild_purpose": structure["guild_purpose"],
+                "agents": dict(enumerate(structure["agents"])),
+                "workflows": dict(enumerate(structure["workflows"]))
+            }
+            prompt = (
+                f"Existing blueprint:\n{json.dumps(current)}\n\n"
+                f"Previous goal: \"{previous['user_input']}\"\n"
+                f"Edited goal: \"{user_input}\""
+            )
+            
+            model, _ = self._select_model(None, None, prompt, BLUEPRINT_PATCH_SYSTEM_INSTRUCTION, GEMINI_BLUEPRINT_PATCH_MAX_TOKENS)
+            models = [model]
+            escalation = self.model_router.escalation_model(model)
+            if escalation:
+                models.append(escalation)
+            
+            for attempt_model in models:
+                try:
+                    output_text, _, _ = await self._make_api_request(
+                        prompt=prompt,
+                        system_instruction=BLUEPRINT_PATCH_SYSTEM_INSTRUCTION,
+                        temperature=0.2,
+                        max_tokens=GEMINI_BLUEPRINT_PATCH_MAX_TOKENS,
+                        model=attempt_model,
+                        response_schema=BLUEPRINT_PATCH_RESPONSE_SCHEMA
+                    )
+                    parser = IncrementalJSONParser(lenient=True)
+                    parser.feed(output_text)
+                    patch = self._empty_blueprint_patch(previous, user_input)
+                    for key, value in parser.close().items():
+                        if key in ("agents", "workflows"):
+                            patch[key].update(value)
+                        elif key in ("interpretation", "guild_name", "guild_purpose"):
+                            patch[key] = value
+                    blueprint = self._apply_blueprint_patch(previous, patch)
+                    logger.info(
+                        f"✅ Blueprint patched: {self._blueprint_patch_size(patch)} changed entries "
+                        f"in {len(output_text)} output characters"
+                    )
+                    return {"patch": patch, "blueprint": blueprint, "mode": "patch"}
+                except CircuitOpenError:
+                    break
+                except Exception as e:
+                    logger.warning(f"⚠️ Blueprint patch from {attempt_model} was unusable: {str(e)}")
+                    if attempt_model != models[-1]:
+                        self.model_router.escalations += 1
+        
+        # Fall back to a full regeneration, still reported as a patch
+        logger.warning("⚠️ Regenerating the full blueprint")
+        fresh = await self.generate_blueprint(user_input)
+        patch = self._diff_blueprints(previous, fresh)
+        return {"patch": patch, "blueprint": self._apply_blueprint_patch(previous, patch), "mode": "full"}
+    
+    @staticmethod
+    def _empty_blueprint_patch(previous: Dict[str, Any], user_input: str) -> Dict[str, Any]:
+        return {
+            "id": previous["id"],
+            "user_input": user_input,
+            "agents": {"update": [], "add": [], "remove": []},
+            "workflows": {"update": [], "add": [], "remove": []}
+        }
+    
+    @staticmethod
+    def _blueprint_patch_size(patch: Dict[str, Any]) -> int:
+        return sum(
+            len(patch[section][op])
+            for section in ("agents", "workflows")
+            for op in ("update", "add", "remove")
+        )
+    
+    def _diff_blueprints(self, previous: Dict[str, Any], fresh: Dict[str, Any]) -> Dict[str, Any]:
+        """Express a freshly generated blueprint as a patch to the previous one, by position."""
+        patch = self._empty_blueprint_patch(previous, fresh["user_input"])
+        if fresh["interpretation"] != previous["interpretation"]:
+            patch["interpretation"] = fresh["interpretation"]
+        
+        old_structure = previous["suggested_structure"]
+        new_structure = fresh["suggested_structure"]
+        for field in ("guild_name", "guild_purpose"):
+            if new_structure[field] != old_structure[field]:
+                patch[field] = new_structure[field]
+        
+        for section in ("agents", "workflows"):
+            old_entries = old_structure[section]
+            new_entries = new_structure[section]
+            for index, entry in enumerate(new_entries[:len(old_entries)]):
+                if entry != old_entries[index]:
+                    patch[section]["update"].append({"index": index, "value": entry})
+            patch[section]["add"] = new_entries[len(old_entries):]
+            patch[section]["remove"] = list(range(len(new_entries), len(old_entries)))
+        return patch
+    
+    def _apply_blueprint_patch(self, previous: Dict[str, Any], patch: Dict[str, Any]) -> Dict[str, Any]:
+        """Apply a blueprint patch.
+        
+        Updates are applied in place, then removals, then additions are
+        appended, so untouched entries ahead of any removal keep their index.
+        
+        Raises:
+            ValueError: If the patch references missing entries or the result is invalid.
+        """
+        blueprint = json.loads(json.dumps(previous))
+        blueprint["user_input"] = patch["user_input"]
+        if patch.get("interpretation"):
+            blueprint["interpretation"] = patch["interpretation"]
+        
+        structure = blueprint["suggested_structure"]
+        for field in ("guild_name", "guild_purpose"):
+            if patch.get(field):
+                structure[field] = patch[field]
+        
+        for section in ("agents", "workflows"):
+            ops = patch.get(section) or {}
+            entries = structure[section]
+            for update in ops.get("update", []):
+                if not 0 <= update["index"] < len(entries):
+                    raise ValueError(f"Patch updates missing {section} entry {update['index']}")
+                entries[update["index"]] = update["value"]
+            for index in sorted(set(ops.get("remove", [])), reverse=True):
+                if not 0 <= index < len(entries):
+                    raise ValueError(f"Patch removes missing {section} entry {index}")
+                del entries[index]
+            entries.extend(ops.get("add", []))
+        
+        if not self._validate_blueprint(blueprint):
+            raise ValueError("Patched blueprint is missing required fields")
+        return blueprint
     
     async def generate_embeddings(self, texts: Union[str, List[str]]) -> List[List[float]]:
         """Generate embeddings for text using Gemini API.
@@ -490,7 +1653,7 @@ class GeminiService:
         Returns:
             List of embedding vectors (list of floats).
         """
-        if self.use_mock:
+        if self.use_mock or not self.circuit_breaker.allow_request():
             return self._generate_mock_embeddings(texts)
         
         # Convert single string to list for consistent processing
@@ -512,6 +1675,7 @@ class GeminiService:
                 }
                 
                 response = await self.client.post(url, json=request_body)
+                self.circuit_breaker.record_status(response.status_code)
                 
                 if response.status_code != 200:
                     logger.error(f"❌ Gemini embedding API error: {response.status_code} {response.text}")
@@ -530,6 +1694,7 @@ class GeminiService:
         
         except Exception as e:
             logger.error(f"❌ Error generating embeddings: {str(e)}")
+            self.circuit_breaker.record_failure()
             # Return mock embeddings as fallback
             return [self._generate_single_mock_embedding() for _ in texts]
     
@@ -585,8 +1750,7 @@ class GeminiService:
             return False
         
         for agent in agents:
-            agent_keys = ["name", "role", "description", "tools_needed"]
-            if not all(key in agent for key in agent_keys):
+            if not all(key in agent for key in BLUEPRINT_AGENT_KEYS):
                 return False
         
         # Check workflows
@@ -595,8 +1759,7 @@ class GeminiService:
             return False
         
         for workflow in workflows:
-            workflow_keys = ["name", "description", "trigger_type"]
-            if not all(key in workflow for key in workflow_keys):
+            if not all(key in workflow for key in BLUEPRINT_WORKFLOW_KEYS):
                 return False
         
         return True
@@ -769,24 +1932,26 @@ class GeminiService:
     async def count_tokens(self, text: str) -> int:
         """Count the number of tokens in a text string.
         
-        Note: This is a simple approximation. In a real implementation,
-        we would use the tokenizer from the model provider.
+        Uses the Gemini countTokens API behind an LRU/Redis cache. Responses
+        generated by this service are already cached from usageMetadata.
+        Falls back to a calibrated local estimate when offline.
         
         Args:
             text: Text to count tokens for.
         
         Returns:
-            Estimated token count.
+            Token count.
         """
-        # Simple approximation: 1 token ≈ 4 chars for English text
-        return len(text) // 4 + 1
+        return await self.token_counter.count(text)
 
     async def close(self):
         """Close the HTTP client."""
         await self.client.aclose()
         
-        if self.redis_client:
-            await self.redis_client.close()
+        # Closed even while the Redis circuit breaker is open
+        redis_client = unguarded(self, "redis_client")
+        if redis_client:
+            await redis_client.close()
             logger.info("✅ Redis client closed")
 
 
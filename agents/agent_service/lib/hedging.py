@@ -0,0 +1,133 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+from .model_router import ModelStats
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class HedgePolicy:
+    """Decides when to send a backup copy of a slow request.
+
+    A hedge is sent once a request has been outstanding longer than a
+    percentile of recent latencies for its model. Hedges are capped at a
+    fraction of all requests so a general slowdown cannot double the load.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 95.0,
+        budget: float = 0.05,
+        min_samples: int = 20,
+        min_delay: float = 0.5,
+        window: int = 1000
+    ):
+        """Initialize the hedge policy.
+
+        Args:
+            percentile: Latency percentile after which a hedge is sent.
+            budget: Maximum hedges as a fraction of requests.
+            min_samples: Latency samples needed before hedging a model.
+            min_delay: Lower bound on the hedge delay in seconds.
+            window: Request count after which budget counters are halved, so
+                the budget tracks recent traffic.
+        """
+        self.percentile = percentile
+        self.budget = budget
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.window = window
+        self._budget_requests = 0.0
+        self._budget_hedges = 0.0
+        self.stats = {
+            "requests": 0,
+            "hedges_sent": 0,
+            "hedge_wins": 0,
+            "primary_wins": 0,
+            "losers_cancelled": 0,
+            "budget_denied": 0
+        }
+
+    def delay(self, model_stats: ModelStats) -> Optional[float]:
+        """Seconds to wait before hedging, or None if there is not enough data."""
+        if len(model_stats.latencies) < self.min_samples:
+            return None
+        return max(self.min_delay, model_stats.percentile(self.percentile))
+
+    def try_acquire(self) -> bool:
+        """Reserve budget for one hedge."""
+        if self._budget_hedges + 1 > self.budget * self._budget_requests:
+            self.stats["budget_denied"] += 1
+            return False
+        self._budget_hedges += 1
+        self.stats["hedges_sent"] += 1
+        return True
+
+    async def run(
+        self,
+        request: Callable[[], Awaitable[Any]],
+        model_stats: ModelStats,
+        is_success: Callable[[Any], bool] = lambda result: True
+    ) -> Any:
+        """Run a request, hedging it if it is slow.
+
+        The first successful result wins and the other request is cancelled.
+        If both fail, the primary's outcome is returned or raised.
+
+        Args:
+            request: Factory returning a new awaitable for each copy of the request.
+            model_stats: Latency statistics of the target model.
+            is_success: Whether a result counts as a success.
+
+        Returns:
+            The winning result.
+        """
+        self._count_request()
+        primary = asyncio.ensure_future(request())
+        delay = self.delay(model_stats)
+        if delay is None:
+            return await primary
+
+        try:
+            done, _ = await asyncio.wait({primary}, timeout=delay)
+        except asyncio.CancelledError:
+            # asyncio.wait doesn't cancel what it waits on; don't leave the call running orphaned
+            primary.cancel()
+            raise
+        if done or not self.try_acquire():
+            return await primary
+
+        logger.info(f"⏱️ No response after {delay:.2f}s, sending hedged request")
+        hedge = asyncio.ensure_future(request())
+        pending = {primary, hedge}
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None and is_success(task.result()):
+                        self.stats["hedge_wins" if task is hedge else "primary_wins"] += 1
+                        return task.result()
+            # Neither copy succeeded; surface the primary's error
+            return primary.result()
+        finally:
+            for task in (primary, hedge):
+                if not task.done():
+                    task.cancel()
+                    self.stats["losers_cancelled"] += 1
+
+    def _count_request(self):
+        self.stats["requests"] += 1
+        self._budget_requests += 1
+        if self._budget_requests >= self.window:
+            self._budget_requests /= 2
+            self._budget_hedges /= 2
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Hedge configuration and counters."""
+        return {
+            "percentile": self.percentile,
+            "budget": self.budget,
+            **self.stats
+        }
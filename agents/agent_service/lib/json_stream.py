@@ -0,0 +1,212 @@
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+_WHITESPACE = " \t\n\r"
+_SCALAR_CHARS = frozenset("0123456789+-.eEtrufalsn")
+
+Path = Tuple[Any, ...]
+
+
+class JSONStreamError(ValueError):
+    """Raised as soon as streamed text can no longer be valid JSON."""
+
+
+class IncrementalJSONParser:
+    """Parses a JSON document as it arrives and reports completed values.
+
+    Text is fed in arbitrary chunks. Whenever a value whose path matches one
+    of the watched patterns is complete, it is decoded and returned from
+    ``feed``, so e.g. each element of an array can be used before the whole
+    document has arrived. Syntax errors raise JSONStreamError at the first
+    offending character rather than at the end of the stream.
+
+    Paths are tuples of object keys and array indexes; ``"*"`` in a pattern
+    matches any single key or index, e.g. ``("agents", "*")``.
+    """
+
+    def __init__(self, watch: Iterable[Path] = (), lenient: bool = False):
+        """Initialize the parser.
+
+        Args:
+            watch: Path patterns of values to report as they complete.
+            lenient: Skip any text before the document starts and after it
+                ends, e.g. prose or markdown fences around model output.
+        """
+        self.watch = [tuple(pattern) for pattern in watch]
+        self.lenient = lenient
+        self._root_start: Optional[int] = None
+        self._root_end: Optional[int] = None
+        self._buffer = ""
+        self._pos = 0
+        self._stack: List[Dict[str, Any]] = []
+        self._root_done = False
+        self._string_start: Optional[int] = None
+        self._string_is_key = False
+        self._escape = False
+        self._scalar_start: Optional[int] = None
+        self._value_path: Optional[Path] = None
+
+    @property
+    def text(self) -> str:
+        """All text fed so far."""
+        return self._buffer
+
+    def feed(self, chunk: str) -> List[Tuple[Path, Any]]:
+        """Consume a chunk of text.
+
+        Args:
+            chunk: The next piece of the document.
+
+        Returns:
+            List of (path, value) for watched values completed by this chunk.
+
+        Raises:
+            JSONStreamError: If the text so far cannot be the start of valid JSON.
+        """
+        self._buffer += chunk
+        events: List[Tuple[Path, Any]] = []
+        while self._pos < len(self._buffer):
+            self._step(self._buffer[self._pos], events)
+            self._pos += 1
+        return events
+
+    def close(self) -> Any:
+        """Finish parsing and return the whole decoded document.
+
+        Raises:
+            JSONStreamError: If the document is incomplete or invalid.
+        """
+        if self._scalar_start is not None and not self._stack:
+            self._end_scalar(self._pos, [])
+        if not self._root_done:
+            raise JSONStreamError("Incomplete JSON document")
+        try:
+            return json.loads(self._buffer[self._root_start:self._root_end])
+        except json.JSONDecodeError as e:
+            raise JSONStreamError(str(e)) from e
+
+    def _step(self, ch: str, events: List[Tuple[Path, Any]]):
+        if self._string_start is not None:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._end_string(self._pos, events)
+            elif ch < " ":
+                self._fail("control character in string")
+            return
+
+        if self._scalar_start is not None:
+            if ch in _SCALAR_CHARS:
+                return
+            self._end_scalar(self._pos, events)
+
+        if ch in _WHITESPACE:
+            return
+
+        if self._root_done:
+            if self.lenient:
+                return
+            self._fail("unexpected data after document")
+
+        if not self._stack:
+            if ch != "{" and ch != "[":
+                if self.lenient:
+                    return
+                self._fail("document must be an object or array")
+            self._root_start = self._pos
+            self._begin_value(ch, ())
+            return
+
+        frame = self._stack[-1]
+        state = frame["state"]
+
+        if frame["kind"] == "{":
+            if state in ("key_or_end", "key"):
+                if ch == '"':
+                    self._string_start = self._pos
+                    self._string_is_key = True
+                elif ch == "}" and state == "key_or_end":
+                    self._end_container(events)
+                else:
+                    self._fail("expected object key")
+            elif state == "colon":
+                if ch != ":":
+                    self._fail("expected ':'")
+                frame["state"] = "value"
+            elif state == "value":
+                self._begin_value(ch, frame["path"] + (frame["key"],))
+            elif state == "comma_or_end":
+                if ch == ",":
+                    frame["state"] = "key"
+                elif ch == "}":
+                    self._end_container(events)
+                else:
+                    self._fail("expected ',' or '}'")
+        else:
+            if state in ("value_or_end", "value"):
+                if ch == "]" and state == "value_or_end":
+                    self._end_container(events)
+                else:
+                    self._begin_value(ch, frame["path"] + (frame["index"],))
+            elif state == "comma_or_end":
+                if ch == ",":
+                    frame["index"] += 1
+                    frame["state"] = "value"
+                elif ch == "]":
+                    self._end_container(events)
+                else:
+                    self._fail("expected ',' or ']'")
+
+    def _begin_value(self, ch: str, path: Path):
+        if ch == "{":
+            self._stack.append({"kind": "{", "path": path, "start": self._pos, "state": "key_or_end", "key": None})
+        elif ch == "[":
+            self._stack.append({"kind": "[", "path": path, "start": self._pos, "state": "value_or_end", "index": 0})
+        elif ch == '"':
+            self._string_start = self._pos
+            self._string_is_key = False
+            self._value_path = path
+        elif ch in _SCALAR_CHARS:
+            self._scalar_start = self._pos
+            self._value_path = path
+        else:
+            self._fail(f"unexpected character {ch!r}")
+
+    def _end_string(self, end: int, events: List[Tuple[Path, Any]]):
+        start, self._string_start = self._string_start, None
+        if self._string_is_key:
+            frame = self._stack[-1]
+            frame["key"] = json.loads(self._buffer[start:end + 1])
+            frame["state"] = "colon"
+        else:
+            self._complete(self._value_path, start, end + 1, events)
+
+    def _end_scalar(self, end: int, events: List[Tuple[Path, Any]]):
+        start, self._scalar_start = self._scalar_start, None
+        try:
+            json.loads(self._buffer[start:end])
+        except json.JSONDecodeError:
+            self._fail(f"invalid literal {self._buffer[start:end]!r}")
+        self._complete(self._value_path, start, end, events)
+
+    def _end_container(self, events: List[Tuple[Path, Any]]):
+        frame = self._stack.pop()
+        self._complete(frame["path"], frame["start"], self._pos + 1, events)
+
+    def _complete(self, path: Path, start: int, end: int, events: List[Tuple[Path, Any]]):
+        if any(self._matches(pattern, path) for pattern in self.watch):
+            events.append((path, json.loads(self._buffer[start:end])))
+        if self._stack:
+            self._stack[-1]["state"] = "comma_or_end"
+        else:
+            self._root_done = True
+            self._root_end = end
+
+    @staticmethod
+    def _matches(pattern: Path, path: Path) -> bool:
+        return len(pattern) == len(path) and all(p == "*" or p == k for p, k in zip(pattern, path))
+
+    def _fail(self, reason: str):
+        raise JSONStreamError(f"Malformed JSON at offset {self._pos}: {reason}")
@@ -0,0 +1,156 @@
+import os
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from collections import deque
+from typing import Any, Dict, List, Optional
+from dotenv import load_dotenv
+
+from .metrics import get_metrics
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+LOOP_MONITOR_ENABLED = os.getenv("LOOP_MONITOR_ENABLED", "true").lower() == "true"
+LOOP_MONITOR_INTERVAL_MS = float(os.getenv("LOOP_MONITOR_INTERVAL_MS", "100"))
+# Stalls longer than this are logged with the stack that was blocking the loop
+LOOP_MONITOR_THRESHOLD_MS = float(os.getenv("LOOP_MONITOR_THRESHOLD_MS", "250"))
+LOOP_MONITOR_MAX_STALLS = int(os.getenv("LOOP_MONITOR_MAX_STALLS", "50"))
+
+
+class LoopMonitor:
+    """Detects callbacks that block the event loop and records what they were doing.
+
+    A heartbeat task on the loop wakes every interval and measures how late
+    it woke; that lag is how long the loop could not run anything else. A
+    watchdog thread checks the heartbeat and, once it is overdue by half the
+    threshold, captures the stack of the loop thread while the blocking
+    callback is still running. When the heartbeat resumes, the stall is
+    logged with that stack, kept in a bounded list and recorded as the
+    event_loop_stall stage.
+
+    Cost is one wakeup per interval on the loop and one in the watchdog, so
+    it can stay on in production, unlike asyncio debug mode.
+    """
+
+    def __init__(
+        self,
+        interval: float = LOOP_MONITOR_INTERVAL_MS / 1000,
+        threshold: float = LOOP_MONITOR_THRESHOLD_MS / 1000,
+        max_stalls: int = LOOP_MONITOR_MAX_STALLS
+    ):
+        """Initialize the monitor.
+
+        Args:
+            interval: Seconds between heartbeats.
+            threshold: Lag in seconds above which a stall is recorded.
+            max_stalls: Recent stalls kept.
+        """
+        self.interval = interval
+        self.threshold = threshold
+        self.stalls: deque = deque(maxlen=max_stalls)
+        self.stats = {"beats": 0, "stalls": 0, "max_lag_ms": 0.0, "total_stall_ms": 0.0}
+        self._last_beat = time.perf_counter()
+        self._stack: Optional[List[str]] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+    def start(self):
+        """Start monitoring the running event loop."""
+        if self._task is not None:
+            return
+        self._loop_thread_id = threading.get_ident()
+        self._last_beat = time.perf_counter()
+        self._stop.clear()
+        self._task = asyncio.get_running_loop().create_task(self._heartbeat())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-monitor", daemon=True)
+        self._watchdog.start()
+        logger.info(f"✅ Event loop monitor started (threshold {self.threshold * 1000:.0f}ms)")
+
+    async def stop(self):
+        """Stop monitoring."""
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _heartbeat(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            now = time.perf_counter()
+            lag = max(0.0, now - before - self.interval)
+            self._last_beat = now
+            self.stats["beats"] += 1
+            self.stats["max_lag_ms"] = max(self.stats["max_lag_ms"], round(lag * 1000, 2))
+            stack, self._stack = self._stack, None
+            if lag >= self.threshold:
+                self._record_stall(lag, stack)
+
+    def _watch(self):
+        captured_for = None
+        # Checking several times per threshold catches stalls barely over it
+        while not self._stop.wait(min(self.interval, self.threshold / 4)):
+            last_beat = self._last_beat
+            overdue = time.perf_counter() - last_beat - self.interval
+            if last_beat == captured_for or overdue < self.threshold / 2:
+                continue
+            # Capture once per stall, while the blocking callback is still on the stack
+            frame = sys._current_frames().get(self._loop_thread_id)
+            if frame is not None:
+                self._stack = traceback.format_stack(frame)
+            captured_for = last_beat
+
+    def _record_stall(self, lag: float, stack: Optional[List[str]]):
+        self.stats["stalls"] += 1
+        self.stats["total_stall_ms"] = round(self.stats["total_stall_ms"] + lag * 1000, 2)
+        self.stalls.append({
+            "at": time.time(),
+            "lag_ms": round(lag * 1000, 2),
+            "stack": stack
+        })
+        get_metrics().observe_stage("event_loop_stall", lag)
+        if stack:
+            logger.warning(f"⚠️ Event loop blocked for {lag * 1000:.0f}ms in:\n{''.join(stack)}")
+        else:
+            logger.warning(f"⚠️ Event loop blocked for {lag * 1000:.0f}ms (stack not captured)")
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Settings, statistics and recent stalls, newest first."""
+        return {
+            "running": self._task is not None,
+            "interval_ms": self.interval * 1000,
+            "threshold_ms": self.threshold * 1000,
+            "stats": dict(self.stats),
+            "recent_stalls": list(reversed(self.stalls))
+        }
+
+
+# Global loop monitor instance
+_loop_monitor = None
+
+
+def get_loop_monitor() -> LoopMonitor:
+    """Get the global loop monitor instance.
+
+    Returns:
+        LoopMonitor instance.
+    """
+    global _loop_monitor
+
+    if _loop_monitor is None:
+        _loop_monitor = LoopMonitor()
+
+    return _loop_monitor
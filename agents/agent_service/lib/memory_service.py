@@ -4,6 +4,7 @@ import json
 import logging
 import pickle
 import hashlib
+from collections import Counter, OrderedDict
 from typing import Dict, Any, List, Optional, Tuple
 import httpx
 from uuid import uuid4
@@ -12,6 +13,19 @@ from dotenv import load_dotenv
 import redis.asyncio as redis
 import numpy as np
 from concurrent.futures import ThreadPoolExecutor
+from .retrieval import LexicalIndex, bm25_scores, query_terms, reciprocal_rank_fusion, rerank_memories, tokenize
+from .circuit_breaker import BreakerGuarded, get_circuit_breaker, unguarded
+from .metrics import get_metrics, timed
+from .offload import get_cpu_offloader, offload
+from .text_processing import local_embedding, local_embeddings
+from .record_replay import (
+    TRAFFIC_MODE,
+    RecordReplayPineconeIndex,
+    ReplayPineconeClient,
+    get_cassette,
+    get_transport,
+    wrap_pinecone_index
+)
 
 # Load environment variables
 load_dotenv()
@@ -26,13 +40,52 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENVIRONMENT")  # This is now optional in new Pinecone
 PINECONE_INDEX_NAME = os.getenv("PINECONE_INDEX_NAME", "genesis-memory")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+GEMINI_EMBEDDING_URL = os.getenv(
+    "GEMINI_EMBEDDING_URL",
+    "https://generativelanguage.googleapis.com/v1/models/embedding-001:embedContent"
+)
 MEMORY_CACHE_TTL = int(os.getenv("MEMORY_CACHE_TTL", "3600"))  # 1 hour default
 MEMORY_DEFAULT_DIMENSION = int(os.getenv("MEMORY_DEFAULT_DIMENSION", "768"))
 MEMORY_ENABLE_LOCAL_EMBEDDING = os.getenv("MEMORY_ENABLE_LOCAL_EMBEDDING", "true").lower() == "true"
+# semantic, hybrid or keyword; hybrid is opt-in until it ranks better than vector search on real traffic
+MEMORY_SEARCH_MODE = os.getenv("MEMORY_SEARCH_MODE", "semantic")
+MEMORY_RRF_K = int(os.getenv("MEMORY_RRF_K", "60"))
+MEMORY_HYBRID_CANDIDATES = int(os.getenv("MEMORY_HYBRID_CANDIDATES", "20"))  # Per-source candidates before fusion
+MEMORY_INDEX_BACKFILL_BATCH = int(os.getenv("MEMORY_INDEX_BACKFILL_BATCH", "200"))  # Memories read per backfill step
+MEMORY_VECTOR_CACHE_AGENTS = int(os.getenv("MEMORY_VECTOR_CACHE_AGENTS", "100"))  # Agents whose vectors stay loaded
+MEMORY_RERANK_SIMILARITY_WEIGHT = float(os.getenv("MEMORY_RERANK_SIMILARITY_WEIGHT", "0.5"))
+MEMORY_RERANK_RECENCY_WEIGHT = float(os.getenv("MEMORY_RERANK_RECENCY_WEIGHT", "0.15"))
+MEMORY_RERANK_IMPORTANCE_WEIGHT = float(os.getenv("MEMORY_RERANK_IMPORTANCE_WEIGHT", "0.15"))
+MEMORY_RERANK_MATCH_WEIGHT = float(os.getenv("MEMORY_RERANK_MATCH_WEIGHT", "0.2"))
+MEMORY_RERANK_HALF_LIFE_HOURS = float(os.getenv("MEMORY_RERANK_HALF_LIFE_HOURS", "72"))
+MEMORY_RERANK_MMR_LAMBDA = float(os.getenv("MEMORY_RERANK_MMR_LAMBDA", "0.7"))
+
+# Names of the executor's threads start with this, so profiles can pick them out
+MEMORY_EXECUTOR_THREAD_PREFIX = "memory-service"
+
+def _probe_pinecone(index):
+    """Check Pinecone health with a cheap stats call."""
+    return asyncio.get_running_loop().run_in_executor(None, index.describe_index_stats)
+
+def _unit_rows(vectors: List[np.ndarray]) -> np.ndarray:
+    """Stack vectors into a matrix of unit-length rows."""
+    matrix = np.stack(vectors).astype(np.float32, copy=False)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+def _retention_days(importance: float) -> int:
+    """Days a memory is kept by default, from 1 day at importance 0.0 to 90 days at 1.0."""
+    return int(1 + (90 - 1) * importance)
 
 class MemoryService:
     """Service for storing and retrieving agent memory."""
     
+    # Reads return None while the dependency's circuit breaker is open, so
+    # callers fall back to the in-memory store and keyword search immediately
+    redis_client = BreakerGuarded("redis", probe=lambda client: client.ping())
+    embedding_cache_client = BreakerGuarded("redis", probe=lambda client: client.ping())
+    pinecone_index = BreakerGuarded("pinecone", probe=_probe_pinecone)
+    
     def __init__(self):
         """Initialize the memory service."""
         # Main Redis client for memory storage
@@ -41,14 +94,20 @@ class MemoryService:
         self.embedding_cache_client = None
         self.pinecone_client = None
         self.pinecone_index = None
-        self.http_client = httpx.AsyncClient(timeout=30.0)
+        self.http_client = httpx.AsyncClient(timeout=30.0, transport=get_transport("gemini"))
         
         # In-memory fallback storage
         self.memory_cache = {}
         self.embedding_cache = {}
+        # BM25 index of the in-memory memories, per agent
+        self.lexical_indexes: Dict[str, LexicalIndex] = {}
+        # Background tasks indexing memories stored before the Redis lexical index, per agent
+        self.index_backfills: Dict[str, asyncio.Task] = {}
+        # Embeddings read from Redis for vector search without Pinecone, least recently searched agent first
+        self.vector_caches: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
         
         # Thread pool for synchronous operations
-        self.executor = ThreadPoolExecutor(max_workers=4)
+        self.executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix=MEMORY_EXECUTOR_THREAD_PREFIX)
         
         # Initialize Redis if URL is provided
         if REDIS_URL and not REDIS_URL.startswith("your_"):
@@ -63,15 +122,36 @@ class MemoryService:
         else:
             logger.info("⚠️ Redis URL not provided, using in-memory cache")
         
-        # Initialize Pinecone client if API key is provided
+        # Pinecone is connected by initialize(), off the event loop, if an API key is provided
         if PINECONE_API_KEY and not PINECONE_API_KEY.startswith("your_"):
             logger.info("✅ Pinecone API key found for long-term memory")
-            self.initialize_pinecone()
+        elif TRAFFIC_MODE == "replay":
+            # Pinecone calls are answered from the recorded traffic
+            replay_index = RecordReplayPineconeIndex("replay", get_cassette())
+            self.pinecone_client = ReplayPineconeClient(PINECONE_INDEX_NAME, replay_index)
+            self.pinecone_index = replay_index
+            logger.info("📼 Replaying recorded Pinecone traffic")
         else:
             logger.info("⚠️ Pinecone not configured, long-term memory will be limited")
     
+    async def initialize(self):
+        """Connect to Pinecone, if configured and not connected yet.
+        
+        Connecting lists indexes and may create one and wait for it to be
+        ready, all with blocking calls, so it runs on the executor. Until it
+        finishes, memories are kept in Redis or in memory only.
+        """
+        if self.pinecone_index is not None:
+            return
+        if PINECONE_API_KEY and not PINECONE_API_KEY.startswith("your_"):
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.initialize_pinecone)
+    
     def initialize_pinecone(self):
-        """Initialize connection to Pinecone vector database."""
+        """Initialize connection to Pinecone vector database.
+        
+        Blocks, for seconds when the index has to be created; call through
+        initialize() from async code.
+        """
         try:
             pinecone_api_key = os.getenv("PINECONE_API_KEY")
             if not pinecone_api_key or pinecone_api_key.startswith("your_"):
@@ -99,7 +179,7 @@ class MemoryService:
                     try:
                         # Connect to the index if it exists
                         if pinecone_index_name in existing_indexes:
-                            self.pinecone_index = self.pinecone_client.Index(pinecone_index_name)
+                            self.pinecone_index = wrap_pinecone_index(self.pinecone_client.Index(pinecone_index_name))
                             logger.info(f"✅ Connected to existing Pinecone index: {pinecone_index_name}")
                         else:
                             logger.info(f"Creating Pinecone index: {pinecone_index_name}")
@@ -136,7 +216,7 @@ class MemoryService:
                                 time.sleep(5)  # Give it time to initialize
                                 
                             # Connect to the newly created index
-                            self.pinecone_index = self.pinecone_client.Index(pinecone_index_name)
+                            self.pinecone_index = wrap_pinecone_index(self.pinecone_client.Index(pinecone_index_name))
                             logger.info(f"✅ Created and connected to Pinecone index: {pinecone_index_name}")
                     
                     except Exception as e:
@@ -157,6 +237,7 @@ class MemoryService:
             self.pinecone_client = None
             self.pinecone_index = None
     
+    @timed("embedding")
     async def generate_embedding(self, text: str) -> List[float]:
         """Generate embedding for text.
         
@@ -174,7 +255,7 @@ class MemoryService:
             try:
                 cached = await self.embedding_cache_client.get(cache_key)
                 if cached:
-                    return pickle.loads(cached)
+                    return await offload(pickle.loads, cached, size=len(cached))
             except Exception as e:
                 logger.error(f"❌ Error retrieving embedding from cache: {str(e)}")
         
@@ -184,14 +265,16 @@ class MemoryService:
         
         # If no valid Gemini API key or local embedding is enabled, use local method
         if MEMORY_ENABLE_LOCAL_EMBEDDING or not GEMINI_API_KEY or GEMINI_API_KEY.startswith("your_"):
-            embedding = self._generate_local_embedding(text)
+            embedding = await offload(local_embedding, text, MEMORY_DEFAULT_DIMENSION, size=len(text))
+        elif not get_circuit_breaker("gemini").allow_request():
+            embedding = await offload(local_embedding, text, MEMORY_DEFAULT_DIMENSION, size=len(text))
         else:
             # Use Gemini to generate embedding
             try:
                 embedding = await self._generate_gemini_embedding(text)
             except Exception as e:
                 logger.error(f"❌ Error generating embedding with Gemini: {str(e)}")
-                embedding = self._generate_local_embedding(text)
+                embedding = await offload(local_embedding, text, MEMORY_DEFAULT_DIMENSION, size=len(text))
         
         # Store in Redis cache
         if self.embedding_cache_client:
@@ -209,6 +292,37 @@ class MemoryService:
         
         return embedding
     
+    @timed("embedding_batch")
+    async def generate_embeddings(self, texts: List[str]) -> List[List[float]]:
+        """Generate embeddings for several texts.
+        
+        Local embeddings not in the local cache are computed in one batch,
+        on the CPU offloader's process pool when the batch is large enough.
+        They skip the Redis cache, which costs more than computing them.
+        Gemini embeddings go through generate_embedding one by one.
+        
+        Args:
+            texts: Texts to generate embeddings for.
+            
+        Returns:
+            Embedding vectors, in the order of texts.
+        """
+        if not (MEMORY_ENABLE_LOCAL_EMBEDDING or not GEMINI_API_KEY or GEMINI_API_KEY.startswith("your_")):
+            return list(await asyncio.gather(*(self.generate_embedding(text) for text in texts)))
+        
+        cache_keys = [f"embedding:{hashlib.md5(text.encode()).hexdigest()}" for text in texts]
+        missing = {key: text for key, text in zip(cache_keys, texts) if key not in self.embedding_cache}
+        if missing:
+            embeddings = await get_cpu_offloader().map_rows(
+                local_embeddings,
+                list(missing.values()),
+                MEMORY_DEFAULT_DIMENSION,
+                size=len(missing) * MEMORY_DEFAULT_DIMENSION
+            )
+            self.embedding_cache.update(zip(missing, embeddings))
+        
+        return [self.embedding_cache[key] for key in cache_keys]
+    
     async def _generate_gemini_embedding(self, text: str) -> List[float]:
         """Generate embedding using Google Gemini API.
         
@@ -218,14 +332,20 @@ class MemoryService:
         Returns:
             Embedding vector.
         """
-        url = f"https://generativelanguage.googleapis.com/v1/models/embedding-001:embedContent?key={GEMINI_API_KEY}"
+        url = f"{GEMINI_EMBEDDING_URL}?key={GEMINI_API_KEY}"
         
         payload = {
             "model": "models/embedding-001",
             "content": {"parts": [{"text": text}]}
         }
         
-        response = await self.http_client.post(url, json=payload)
+        breaker = get_circuit_breaker("gemini")
+        try:
+            response = await self.http_client.post(url, json=payload)
+        except Exception:
+            breaker.record_failure()
+            raise
+        breaker.record_status(response.status_code)
         
         if response.status_code != 200:
             raise Exception(f"Gemini API error: {response.status_code} {response.text}")
@@ -247,21 +367,9 @@ class MemoryService:
         """
         # Create a deterministic but simple embedding based on the text
         # This is NOT suitable for production, just for development/testing
-        text_bytes = text.encode('utf-8')
-        hash_object = hashlib.sha256(text_bytes)
-        hash_bytes = hash_object.digest()
-        
-        # Generate a fixed-length vector from the hash
-        np.random.seed(int.from_bytes(hash_bytes[:4], byteorder='big'))
-        vector = np.random.uniform(-1, 1, MEMORY_DEFAULT_DIMENSION)
-        
-        # Normalize to unit length (important for cosine similarity)
-        norm = np.linalg.norm(vector)
-        if norm > 0:
-            vector = vector / norm
-            
-        return vector.tolist()
+        return local_embedding(text, MEMORY_DEFAULT_DIMENSION)
     
+    @timed("memory_store")
     async def store_memory(
         self,
         agent_id: str,
@@ -332,6 +440,17 @@ class MemoryService:
                     {memory_id: importance}
                 )
                 
+                # Add to the lexical index used by hybrid search, which expires with the memory
+                try:
+                    await self._index_memory_in_redis(
+                        agent_id,
+                        memory,
+                        expiration or _retention_days(importance) * 24 * 60 * 60
+                    )
+                    await self._sweep_lexical_index_in_redis(agent_id)
+                except Exception as e:
+                    logger.warning(f"⚠️ Failed to index memory {memory_id} for hybrid search: {str(e)}")
+                
                 # Store in Pinecone if embedding is available
                 if self.pinecone_index and embedding:
                     try:
@@ -360,7 +479,7 @@ class MemoryService:
                 if not expiration:
                     # Default expiry based on importance (higher importance = longer retention)
                     # 0.0 importance: 1 day, 1.0 importance: 90 days
-                    days_to_keep = int(1 + (90 - 1) * importance)
+                    days_to_keep = _retention_days(importance)
                     
                     # Convert to seconds
                     expiry_seconds = days_to_keep * 24 * 60 * 60
@@ -382,6 +501,7 @@ class MemoryService:
         
         return memory_id
         
+    @timed("pinecone_upsert")
     async def _store_in_pinecone(self, id: str, vector: List[float], metadata: Dict[str, Any]):
         """Store a memory vector in Pinecone.
         
@@ -468,8 +588,10 @@ class MemoryService:
             self.memory_cache[agent_id] = {}
         
         self.memory_cache[agent_id][memory_id] = memory
+        self.lexical_indexes.setdefault(agent_id, LexicalIndex()).add(memory_id, memory.get("content", "") or "")
         logger.info(f"✅ Memory {memory_id} stored in-memory for agent {agent_id}")
     
+    @timed("memory_recent")
     async def retrieve_recent_memories(
         self, 
         agent_id: str,
@@ -534,6 +656,7 @@ class MemoryService:
         
         return memories
     
+    @timed("memory_important")
     async def retrieve_important_memories(
         self, 
         agent_id: str, 
@@ -609,28 +732,48 @@ class MemoryService:
         # Return limited number of memories
         return agent_memories[:limit]
     
+    @timed("memory_search")
     async def search_memories(
         self, 
         agent_id: str, 
         query: str, 
         limit: int = 5,
         min_similarity: float = 0.6,
-        use_semantic: bool = True
+        use_semantic: bool = True,
+        mode: Optional[str] = None,
+        stats: Optional[Dict[str, Any]] = None
     ) -> List[Dict[str, Any]]:
         """Search agent memories based on content similarity.
-        
+
         Args:
             agent_id: The ID of the agent.
             query: The search query.
             limit: Maximum number of results.
             min_similarity: Minimum similarity threshold (0-1).
             use_semantic: Whether to use semantic search with embeddings.
-            
+            mode: Retrieval mode ('semantic', 'hybrid' or 'keyword').
+                Defaults to MEMORY_SEARCH_MODE.
+            stats: Optional dict that hybrid search fills with per-source
+                latency and hit counts.
+
         Returns:
             List of memory objects.
         """
+        mode = (mode or MEMORY_SEARCH_MODE).lower() if use_semantic else "keyword"
+
+        if mode == "hybrid":
+            try:
+                memories, hybrid_stats = await self.hybrid_search(agent_id, query, limit, min_similarity)
+                if stats is not None:
+                    stats.update(hybrid_stats)
+                return memories
+            except Exception as e:
+                logger.error(f"❌ Hybrid search failed: {str(e)}")
+                logger.info("⚠️ Falling back to keyword search")
+                return await self._search_memories_with_keywords(agent_id, query, limit)
+
         # If we have Pinecone configured and semantic search is requested, use vector search
-        if self.pinecone_index and use_semantic:
+        if self.pinecone_index and mode == "semantic":
             try:
                 return await self._search_memories_with_pinecone(
                     agent_id, query, limit, min_similarity
@@ -641,7 +784,561 @@ class MemoryService:
         
         # Fall back to Redis text search or in-memory search
         return await self._search_memories_with_keywords(agent_id, query, limit)
-    
+
+    async def hybrid_search(
+        self,
+        agent_id: str,
+        query: str,
+        limit: int = 5,
+        min_similarity: float = 0.6
+    ) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+        """Search memories with vector and BM25 retrieval fused by reciprocal rank fusion.
+
+        Both retrievers run concurrently. Vector retrieval uses Pinecone when
+        configured and otherwise scores the embeddings kept in Redis with the
+        agent's index, or those of the memories held in memory without Redis.
+        BM25 runs on the agent's lexical index, which is kept up
+        to date as memories are stored and deleted, so a search reads only
+        the postings of its terms and the memories it returns. Each search
+        first sweeps expired memories from the index and, the first time,
+        backfills it in the background with memories stored before it.
+
+        Args:
+            agent_id: The agent ID.
+            query: Search query.
+            limit: Maximum results.
+            min_similarity: Minimum similarity threshold for vector matches.
+
+        Returns:
+            Tuple of (memories, stats) where stats holds per-source latency in
+            milliseconds and hit counts.
+        """
+        candidates = max(limit, MEMORY_HYBRID_CANDIDATES)
+        stats: Dict[str, Any] = {}
+
+        if self.redis_client:
+            try:
+                await self._maintain_lexical_index_in_redis(agent_id)
+            except Exception as e:
+                logger.warning(f"⚠️ Failed to maintain lexical index for agent {agent_id}: {str(e)}")
+
+        async def _timed(source: str, coro):
+            start_time = time.perf_counter()
+            error = False
+            try:
+                return await coro
+            except Exception:
+                error = True
+                raise
+            finally:
+                elapsed = time.perf_counter() - start_time
+                stats[f"{source}_ms"] = round(elapsed * 1000, 2)
+                get_metrics().observe_stage(f"memory_{source}", elapsed, error)
+
+        vector_results, lexical_results = await asyncio.gather(
+            _timed("vector", self._vector_candidates(agent_id, query, candidates, min_similarity)),
+            _timed("lexical", self._lexical_candidates(agent_id, query, candidates)),
+            return_exceptions=True
+        )
+
+        rankings = {}
+        by_id: Dict[str, Dict[str, Any]] = {}
+        for source, results in (("vector", vector_results), ("lexical", lexical_results)):
+            if isinstance(results, BaseException):
+                logger.error(f"❌ {source.capitalize()} retrieval failed: {str(results)}")
+                results = []
+            stats[f"{source}_hits"] = len(results)
+            rankings[source] = [memory["id"] for memory in results]
+            for memory in results:
+                by_id.setdefault(memory["id"], {}).update(memory)
+
+        start_time = time.perf_counter()
+        memories = []
+        for memory_id, score, sources in reciprocal_rank_fusion(rankings, k=MEMORY_RRF_K)[:limit]:
+            memory = by_id[memory_id]
+            memory["rrf_score"] = score
+            memory["retrieval_sources"] = sources
+            memories.append(memory)
+        stats["fusion_ms"] = round((time.perf_counter() - start_time) * 1000, 2)
+
+        logger.info(
+            f"✅ Found {len(memories)} memories via hybrid search "
+            f"(vector: {stats['vector_hits']} in {stats['vector_ms']}ms, "
+            f"lexical: {stats['lexical_hits']} in {stats['lexical_ms']}ms)"
+        )
+        return memories, stats
+
+    async def _vector_candidates(
+        self,
+        agent_id: str,
+        query: str,
+        limit: int,
+        min_similarity: float
+    ) -> List[Dict[str, Any]]:
+        """Retrieve vector search candidates for hybrid search.
+
+        Args:
+            agent_id: The agent ID.
+            query: Search query.
+            limit: Maximum candidates.
+            min_similarity: Minimum cosine similarity.
+
+        Returns:
+            List of memory objects ordered by similarity.
+        """
+        if self.pinecone_index:
+            return await self._search_memories_with_pinecone(agent_id, query, limit, min_similarity)
+
+        query_embedding = await self.generate_embedding(query)
+        if not query_embedding:
+            return []
+
+        if self.redis_client:
+            try:
+                return await self._search_vectors_in_redis(agent_id, query_embedding, limit, min_similarity)
+            except Exception as e:
+                logger.error(f"❌ Failed to search memory vectors in Redis: {str(e)}")
+
+        memories = [memory for memory in self.memory_cache.get(agent_id, {}).values() if memory.get("embedding")]
+        if not memories:
+            return []
+
+        def _score():
+            matrix = np.asarray([memory["embedding"] for memory in memories], dtype=np.float32)
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query_vector) or 1.0)
+            return matrix @ query_vector / np.where(norms > 0, norms, 1.0)
+
+        loop = asyncio.get_event_loop()
+        similarities = await loop.run_in_executor(self.executor, _score)
+
+        order = np.argsort(-similarities)[:limit]
+        return [
+            {**memories[i], "similarity": float(similarities[i])}
+            for i in order
+            if similarities[i] >= min_similarity
+        ]
+
+    async def _search_vectors_in_redis(
+        self,
+        agent_id: str,
+        query_embedding: List[float],
+        limit: int,
+        min_similarity: float
+    ) -> List[Dict[str, Any]]:
+        """Rank an agent's memories by cosine similarity using the embeddings in Redis.
+
+        Args:
+            agent_id: The agent ID.
+            query_embedding: Embedding of the search query.
+            limit: Maximum results.
+            min_similarity: Minimum cosine similarity.
+
+        Returns:
+            List of memory objects, without embeddings, ordered by similarity.
+        """
+        memory_ids, matrix = await self._load_vectors_from_redis(agent_id, len(query_embedding))
+        if matrix is None:
+            return []
+
+        def _score():
+            query_vector = np.asarray(query_embedding, dtype=np.float32)
+            similarities = matrix @ query_vector / (np.linalg.norm(query_vector) or 1.0)
+            order = np.argsort(-similarities)[:limit]
+            return [(memory_ids[i], float(similarities[i])) for i in order if similarities[i] >= min_similarity]
+
+        loop = asyncio.get_event_loop()
+        ranked = await loop.run_in_executor(self.executor, _score)
+        if not ranked:
+            return []
+
+        documents = await self.redis_client.hmget(f"lexical_documents:{agent_id}", [memory_id for memory_id, _ in ranked])
+        return [
+            {**json.loads(document), "similarity": similarity}
+            for (_, similarity), document in zip(ranked, documents)
+            if document
+        ]
+
+    async def _load_vectors_from_redis(
+        self,
+        agent_id: str,
+        dimension: int
+    ) -> Tuple[List[str], Optional[np.ndarray]]:
+        """Load the agent's memory embeddings from Redis into a matrix of unit rows.
+
+        The matrix is cached per agent and rebuilt only when the agent's
+        vectors change, reading just the embeddings not loaded yet.
+
+        Args:
+            agent_id: The agent ID.
+            dimension: Dimension of the query embedding; other embeddings are left out.
+
+        Returns:
+            Tuple of (memory IDs, matrix) with one row per ID, or no matrix if
+            the agent has no embeddings of that dimension.
+        """
+        version = await self.redis_client.hget(f"lexical_stats:{agent_id}", "vectors_version")
+        cached = self.vector_caches.get(agent_id)
+        if cached is not None and cached["version"] == version and cached["dimension"] == dimension:
+            self.vector_caches.move_to_end(agent_id)
+            return cached["ids"], cached["matrix"]
+
+        known = cached["vectors"] if cached is not None else {}
+        memory_ids = [
+            memory_id.decode("utf-8") if isinstance(memory_id, bytes) else memory_id
+            for memory_id in await self.redis_client.hkeys(f"memory_vectors:{agent_id}")
+        ]
+        missing = [memory_id for memory_id in memory_ids if memory_id not in known]
+        values = await self.redis_client.hmget(f"memory_vectors:{agent_id}", missing) if missing else []
+
+        vectors = {memory_id: known[memory_id] for memory_id in memory_ids if memory_id in known}
+        for memory_id, value in zip(missing, values):
+            if value:
+                vectors[memory_id] = np.frombuffer(value, dtype=np.float32)
+
+        ids = [memory_id for memory_id, vector in vectors.items() if vector.shape[0] == dimension]
+        matrix = None
+        if ids:
+            loop = asyncio.get_event_loop()
+            matrix = await loop.run_in_executor(self.executor, _unit_rows, [vectors[memory_id] for memory_id in ids])
+
+        self.vector_caches[agent_id] = {
+            "version": version,
+            "dimension": dimension,
+            "vectors": vectors,
+            "ids": ids,
+            "matrix": matrix
+        }
+        self.vector_caches.move_to_end(agent_id)
+        while len(self.vector_caches) > MEMORY_VECTOR_CACHE_AGENTS:
+            self.vector_caches.popitem(last=False)
+        return ids, matrix
+
+    async def _lexical_candidates(self, agent_id: str, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Retrieve BM25 candidates for hybrid search.
+
+        Args:
+            agent_id: The agent ID.
+            query: Search query.
+            limit: Maximum candidates.
+
+        Returns:
+            List of memory objects ordered by BM25 score.
+        """
+        if self.redis_client:
+            try:
+                return await self._search_lexical_index_in_redis(agent_id, query, limit)
+            except Exception as e:
+                logger.error(f"❌ Failed to search lexical index in Redis: {str(e)}")
+
+        index = self.lexical_indexes.get(agent_id)
+        if index is None:
+            return []
+        memories = self.memory_cache.get(agent_id, {})
+        return [{**memories[memory_id], "bm25_score": score} for memory_id, score in index.search(query, limit)]
+
+    def _lexical_document(self, memory: Dict[str, Any]) -> Dict[str, Any]:
+        """The memory as kept in the lexical index, i.e. without its embedding."""
+        return {key: value for key, value in memory.items() if key != "embedding"}
+
+    def _lexical_index_keys(self, agent_id: str) -> List[str]:
+        """Keys of the agent's lexical index in Redis besides the per-term postings."""
+        return [
+            f"lexical_terms:{agent_id}",
+            f"lexical_lengths:{agent_id}",
+            f"lexical_documents:{agent_id}",
+            f"lexical_stats:{agent_id}",
+            f"lexical_expiry:{agent_id}",
+            f"memory_vectors:{agent_id}"
+        ]
+
+    async def _index_memory_in_redis(self, agent_id: str, memory: Dict[str, Any], ttl: int) -> bool:
+        """Add a memory to the agent's lexical index in Redis.
+
+        Each term has a sorted set of memory IDs scored by term frequency.
+        Document lengths, corpus totals and the memories without their
+        embeddings are kept alongside, so a search reads the postings of its
+        terms and the memories it returns, never the whole corpus. Embeddings
+        are kept as float32 bytes for vector search without Pinecone. When
+        each memory expires is recorded too, so sweeps can drop it from the
+        index, and the index keys expire with the agent's last memory.
+
+        Args:
+            agent_id: The agent ID.
+            memory: The memory object.
+            ttl: Seconds until the memory expires.
+
+        Returns:
+            True if the memory was added, False if it was already indexed.
+        """
+        memory_id = memory["id"]
+        # Adding the document first keeps a memory stored during a backfill from being counted twice
+        if not await self.redis_client.hsetnx(
+            f"lexical_documents:{agent_id}",
+            memory_id,
+            json.dumps(self._lexical_document(memory))
+        ):
+            return False
+
+        counts = Counter(tokenize(memory.get("content", "") or ""))
+        length = sum(counts.values())
+        postings_keys = [f"lexical_postings:{agent_id}:{term}" for term in counts]
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for postings_key, count in zip(postings_keys, counts.values()):
+            pipe.zadd(postings_key, {memory_id: count})
+        if counts:
+            # Every term the agent's index uses, so clearing it can find the postings
+            pipe.sadd(f"lexical_terms:{agent_id}", *counts)
+        pipe.hset(f"lexical_lengths:{agent_id}", memory_id, length)
+        pipe.hincrby(f"lexical_stats:{agent_id}", "documents", 1)
+        pipe.hincrby(f"lexical_stats:{agent_id}", "length", length)
+        if memory.get("embedding"):
+            pipe.hset(
+                f"memory_vectors:{agent_id}",
+                memory_id,
+                np.asarray(memory["embedding"], dtype=np.float32).tobytes()
+            )
+            # Tells other workers their loaded vectors are stale
+            pipe.hincrby(f"lexical_stats:{agent_id}", "vectors_version", 1)
+        pipe.zadd(f"lexical_expiry:{agent_id}", {memory_id: int(time.time()) + ttl})
+        await pipe.execute()
+
+        await self._expire_lexical_index_in_redis(agent_id, postings_keys)
+        return True
+
+    async def _expire_lexical_index_in_redis(self, agent_id: str, postings_keys: List[str]):
+        """Make the agent's lexical index keys expire with its last memory.
+
+        Postings written earlier already outlive every memory they list, so
+        only the postings just written need their expiry moved.
+
+        Args:
+            agent_id: The agent ID.
+            postings_keys: Postings keys just written.
+        """
+        latest = await self.redis_client.zrevrange(f"lexical_expiry:{agent_id}", 0, 0, withscores=True)
+        expires_at = int(latest[0][1]) + 1 if latest else int(time.time()) + _retention_days(0.0) * 24 * 60 * 60
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for key in self._lexical_index_keys(agent_id) + postings_keys:
+            pipe.expireat(key, expires_at)
+        await pipe.execute()
+
+    async def _sweep_lexical_index_in_redis(self, agent_id: str):
+        """Remove memories whose TTL has run out from the agent's lexical index in Redis.
+
+        Args:
+            agent_id: The agent ID.
+        """
+        due = await self.redis_client.zrangebyscore(f"lexical_expiry:{agent_id}", 0, int(time.time()))
+        if not due:
+            return
+        memory_ids = [memory_id.decode("utf-8") if isinstance(memory_id, bytes) else memory_id for memory_id in due]
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for memory_id in memory_ids:
+            pipe.ttl(f"memory:{agent_id}:{memory_id}")
+        ttls = await pipe.execute()
+
+        # -2 means the memory is gone; one still stored had its TTL changed, so check it again when that runs out
+        expired = [memory_id for memory_id, ttl in zip(memory_ids, ttls) if ttl == -2]
+        rescheduled = {memory_id: int(time.time()) + ttl for memory_id, ttl in zip(memory_ids, ttls) if ttl > 0}
+        persistent = [memory_id for memory_id, ttl in zip(memory_ids, ttls) if ttl == -1]
+        if rescheduled:
+            await self.redis_client.zadd(f"lexical_expiry:{agent_id}", rescheduled)
+        if persistent:
+            await self.redis_client.zrem(f"lexical_expiry:{agent_id}", *persistent)
+        if expired:
+            await self._unindex_memories_in_redis(agent_id, expired)
+            logger.info(f"✅ Swept {len(expired)} expired memories from the lexical index for agent {agent_id}")
+
+    async def _maintain_lexical_index_in_redis(self, agent_id: str):
+        """Sweep the agent's lexical index and backfill it once if needed.
+
+        Args:
+            agent_id: The agent ID.
+        """
+        await self._sweep_lexical_index_in_redis(agent_id)
+
+        task = self.index_backfills.get(agent_id)
+        if (task is None or task.done()) and not await self.redis_client.hget(
+            f"lexical_stats:{agent_id}", "backfilled"
+        ):
+            # The search goes ahead on what is indexed so far
+            self.index_backfills[agent_id] = asyncio.create_task(self._backfill_lexical_index_in_redis(agent_id))
+
+    async def _backfill_lexical_index_in_redis(self, agent_id: str):
+        """Index the agent's memories stored before it had a lexical index in Redis.
+
+        Args:
+            agent_id: The agent ID.
+        """
+        # One worker backfills an agent at a time
+        lock_key = f"lexical_backfill:{agent_id}"
+        if not await self.redis_client.set(lock_key, 1, nx=True, ex=600):
+            return
+
+        try:
+            memory_ids = [
+                memory_id.decode("utf-8") if isinstance(memory_id, bytes) else memory_id
+                for memory_id in await self.redis_client.zrange(f"memory_index:{agent_id}", 0, -1)
+            ]
+            indexed = 0
+            for start in range(0, len(memory_ids), MEMORY_INDEX_BACKFILL_BATCH):
+                batch = memory_ids[start:start + MEMORY_INDEX_BACKFILL_BATCH]
+                pipe = self.redis_client.pipeline(transaction=False)
+                for memory_id in batch:
+                    pipe.hexists(f"lexical_documents:{agent_id}", memory_id)
+                missing = [memory_id for memory_id, exists in zip(batch, await pipe.execute()) if not exists]
+                if not missing:
+                    continue
+
+                pipe = self.redis_client.pipeline(transaction=False)
+                for memory_id in missing:
+                    pipe.get(f"memory:{agent_id}:{memory_id}")
+                    pipe.ttl(f"memory:{agent_id}:{memory_id}")
+                results = await pipe.execute()
+                stored = [(record, ttl) for record, ttl in zip(results[::2], results[1::2]) if record]
+                # Parsed as one JSON array so the batch goes to the offloader in a single call
+                payload = "[" + ",".join(
+                    record.decode("utf-8") if isinstance(record, bytes) else record for record, _ in stored
+                ) + "]"
+                memories = await offload(json.loads, payload, size=len(payload))
+
+                for memory, (_, ttl) in zip(memories, stored):
+                    # Memories without a TTL are indexed for the longest default retention
+                    if await self._index_memory_in_redis(
+                        agent_id,
+                        memory,
+                        ttl if ttl > 0 else _retention_days(1.0) * 24 * 60 * 60
+                    ):
+                        indexed += 1
+
+            await self.redis_client.hset(f"lexical_stats:{agent_id}", "backfilled", 1)
+            await self._expire_lexical_index_in_redis(agent_id, [])
+            logger.info(f"✅ Backfilled lexical index with {indexed} memories for agent {agent_id}")
+        except Exception as e:
+            logger.error(f"❌ Failed to backfill lexical index for agent {agent_id}: {str(e)}")
+        finally:
+            await self.redis_client.delete(lock_key)
+
+    async def _unindex_memories_in_redis(self, agent_id: str, memory_ids: List[str]):
+        """Remove memories from the agent's lexical index in Redis.
+
+        Args:
+            agent_id: The agent ID.
+            memory_ids: IDs of the memories to remove.
+        """
+        if not memory_ids:
+            return
+        documents = await self.redis_client.hmget(f"lexical_documents:{agent_id}", memory_ids)
+
+        # Removing the document first decides which caller updates the totals
+        # when two remove the same memory at once
+        pipe = self.redis_client.pipeline(transaction=False)
+        for memory_id in memory_ids:
+            pipe.hdel(f"lexical_documents:{agent_id}", memory_id)
+        removed = await pipe.execute()
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        for memory_id, document, was_removed in zip(memory_ids, documents, removed):
+            if not document or not was_removed:
+                continue
+            counts = Counter(tokenize(json.loads(document).get("content", "") or ""))
+            for term in counts:
+                pipe.zrem(f"lexical_postings:{agent_id}:{term}", memory_id)
+            pipe.hdel(f"lexical_lengths:{agent_id}", memory_id)
+            pipe.zrem(f"lexical_expiry:{agent_id}", memory_id)
+            pipe.hdel(f"memory_vectors:{agent_id}", memory_id)
+            pipe.hincrby(f"lexical_stats:{agent_id}", "vectors_version", 1)
+            pipe.hincrby(f"lexical_stats:{agent_id}", "documents", -1)
+            pipe.hincrby(f"lexical_stats:{agent_id}", "length", -sum(counts.values()))
+        await pipe.execute()
+
+    async def _clear_lexical_index_in_redis(self, agent_id: str):
+        """Delete the agent's lexical index in Redis.
+
+        Args:
+            agent_id: The agent ID.
+        """
+        terms = await self.redis_client.smembers(f"lexical_terms:{agent_id}")
+        keys = [
+            f"lexical_postings:{agent_id}:{term.decode('utf-8') if isinstance(term, bytes) else term}"
+            for term in terms
+        ]
+        keys += self._lexical_index_keys(agent_id)
+        for start in range(0, len(keys), 1000):
+            await self.redis_client.delete(*keys[start:start + 1000])
+
+    async def _search_lexical_index_in_redis(self, agent_id: str, query: str, limit: int) -> List[Dict[str, Any]]:
+        """Rank an agent's memories with BM25 using the lexical index in Redis.
+
+        Args:
+            agent_id: The agent ID.
+            query: Search query.
+            limit: Maximum results.
+
+        Returns:
+            List of memory objects, without embeddings, ordered by BM25 score.
+        """
+        terms = sorted(query_terms(query))
+        if not terms:
+            return []
+
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hmget(f"lexical_stats:{agent_id}", ["documents", "length"])
+        for term in terms:
+            pipe.zrange(f"lexical_postings:{agent_id}:{term}", 0, -1, withscores=True)
+        (document_count, total_length), *term_postings = await pipe.execute()
+
+        document_count = int(document_count or 0)
+        postings = {
+            term: {
+                memory_id.decode("utf-8") if isinstance(memory_id, bytes) else memory_id: int(frequency)
+                for memory_id, frequency in entries
+            }
+            for term, entries in zip(terms, term_postings)
+            if entries
+        }
+        if document_count <= 0 or not postings:
+            return []
+
+        memory_ids = sorted(set().union(*postings.values()))
+        lengths = await self.redis_client.hmget(f"lexical_lengths:{agent_id}", memory_ids)
+        # Extra candidates make up for memories that turn out to have expired
+        ranked = await offload(
+            bm25_scores,
+            postings,
+            {memory_id: int(length) for memory_id, length in zip(memory_ids, lengths) if length is not None},
+            document_count,
+            int(total_length or 0) / document_count,
+            limit=limit * 2,
+            size=len(memory_ids)
+        )
+        if not ranked:
+            return []
+
+        ranked_ids = [memory_id for memory_id, _ in ranked]
+        pipe = self.redis_client.pipeline(transaction=False)
+        for memory_id in ranked_ids:
+            pipe.exists(f"memory:{agent_id}:{memory_id}")
+        pipe.hmget(f"lexical_documents:{agent_id}", ranked_ids)
+        *alive, documents = await pipe.execute()
+
+        memories, expired = [], []
+        for (memory_id, score), exists, document in zip(ranked, alive, documents):
+            if not exists or not document:
+                expired.append(memory_id)
+            elif len(memories) < limit:
+                memories.append({**json.loads(document), "bm25_score": score})
+
+        if expired:
+            # Sweeps drop expired memories; this catches any whose TTL was shortened since
+            await self._unindex_memories_in_redis(agent_id, expired)
+        return memories
+
+    @timed("pinecone_query")
     async def _search_memories_with_pinecone(
         self,
         agent_id: str,
@@ -807,6 +1504,87 @@ class MemoryService:
         
         return results[:limit]
     
+    @timed("memory_context")
+    async def retrieve_context_memories(
+        self,
+        agent_id: str,
+        query: str,
+        limit: int = 5,
+        memory_type: Optional[str] = None,
+        metadata_filter: Optional[Dict[str, Any]] = None,
+        include_search: bool = True
+    ) -> List[Dict[str, Any]]:
+        """Retrieve a single ranked list of context memories for a prompt.
+
+        Recent, important and searched memories are gathered concurrently as
+        one candidate set, then re-ranked by similarity, recency and importance
+        with MMR diversity so near-duplicate turns are not all included.
+
+        Args:
+            agent_id: The ID of the agent.
+            query: The current input used for similarity and search.
+            limit: Maximum number of memories to return.
+            memory_type: Optional type filter for the recent-memory candidates.
+            metadata_filter: Optional metadata filter for the recent-memory candidates.
+            include_search: Whether to add search results to the candidates.
+
+        Returns:
+            List of memory objects, best first.
+        """
+        candidate_limit = limit * 2
+        sources = [
+            self.retrieve_recent_memories(
+                agent_id, limit=candidate_limit, memory_type=memory_type, metadata_filter=metadata_filter
+            ),
+            self.retrieve_important_memories(agent_id, limit=candidate_limit)
+        ]
+        if include_search and query:
+            sources.append(self.search_memories(agent_id, query, limit=candidate_limit))
+
+        candidates: Dict[str, Dict[str, Any]] = {}
+        for results in await asyncio.gather(*sources, return_exceptions=True):
+            if isinstance(results, BaseException):
+                logger.error(f"❌ Error retrieving candidate memories: {str(results)}")
+                continue
+            for memory in results:
+                candidates.setdefault(memory["id"], {}).update(memory)
+
+        if not candidates:
+            return []
+
+        memories = list(candidates.values())
+        if not query:
+            memories.sort(key=lambda x: x.get("created_at", 0), reverse=True)
+            return memories[:limit]
+
+        # Memories rebuilt from Pinecone metadata carry no embedding
+        missing = [memory for memory in memories if not memory.get("embedding")]
+        query_embedding, embeddings = await asyncio.gather(
+            self.generate_embedding(query),
+            self.generate_embeddings([memory.get("content", "") or "" for memory in missing])
+        )
+        for memory, embedding in zip(missing, embeddings):
+            memory["embedding"] = embedding
+
+        loop = asyncio.get_event_loop()
+        ranked = await loop.run_in_executor(
+            self.executor,
+            lambda: rerank_memories(
+                memories,
+                query_embedding,
+                limit,
+                similarity_weight=MEMORY_RERANK_SIMILARITY_WEIGHT,
+                recency_weight=MEMORY_RERANK_RECENCY_WEIGHT,
+                importance_weight=MEMORY_RERANK_IMPORTANCE_WEIGHT,
+                match_weight=MEMORY_RERANK_MATCH_WEIGHT,
+                half_life_hours=MEMORY_RERANK_HALF_LIFE_HOURS,
+                mmr_lambda=MEMORY_RERANK_MMR_LAMBDA
+            )
+        )
+
+        logger.info(f"✅ Re-ranked {len(memories)} candidate memories to {len(ranked)} for agent {agent_id}")
+        return ranked
+
     async def delete_memory(self, agent_id: str, memory_id: str) -> bool:
         """Delete a memory.
         
@@ -826,6 +1604,7 @@ class MemoryService:
                 # Remove from indices
                 await self.redis_client.zrem(f"memory_index:{agent_id}", memory_id)
                 await self.redis_client.zrem(f"memory_importance:{agent_id}", memory_id)
+                await self._unindex_memories_in_redis(agent_id, [memory_id])
                 
                 # Delete from Pinecone if available
                 if self.pinecone_index:
@@ -844,6 +1623,7 @@ class MemoryService:
                 # Also remove from in-memory cache if it exists there
                 if agent_id in self.memory_cache and memory_id in self.memory_cache[agent_id]:
                     del self.memory_cache[agent_id][memory_id]
+                    self.lexical_indexes[agent_id].remove(memory_id)
                 
                 return True
             except Exception as e:
@@ -869,6 +1649,7 @@ class MemoryService:
         
         if memory_id in self.memory_cache[agent_id]:
             del self.memory_cache[agent_id][memory_id]
+            self.lexical_indexes[agent_id].remove(memory_id)
             logger.info(f"✅ Memory {memory_id} deleted from in-memory cache for agent {agent_id}")
             return True
         
@@ -902,12 +1683,15 @@ class MemoryService:
                 # Delete indices
                 await self.redis_client.delete(f"memory_index:{agent_id}")
                 await self.redis_client.delete(f"memory_importance:{agent_id}")
+                await self._clear_lexical_index_in_redis(agent_id)
+                self.vector_caches.pop(agent_id, None)
                 
                 logger.info(f"✅ All memories cleared for agent {agent_id}")
                 
                 # Also clear from in-memory cache
                 if agent_id in self.memory_cache:
                     del self.memory_cache[agent_id]
+                    self.lexical_indexes.pop(agent_id, None)
                 
                 return True
             except Exception as e:
@@ -929,6 +1713,7 @@ class MemoryService:
         """
         if agent_id in self.memory_cache:
             del self.memory_cache[agent_id]
+            self.lexical_indexes.pop(agent_id, None)
             logger.info(f"✅ All memories cleared from in-memory cache for agent {agent_id}")
             return True
         
@@ -999,9 +1784,11 @@ class MemoryService:
                     }
                 
                 # Update the memory
+                # Keep the memory's TTL, which its lexical index entry expires with
                 await self.redis_client.set(
                     f"memory:{agent_id}:{memory_id}",
-                    json.dumps(memory)
+                    json.dumps(memory),
+                    keepttl=True
                 )
                 
                 # Update the importance index
@@ -1010,6 +1797,14 @@ class MemoryService:
                     {memory_id: importance}
                 )
                 
+                # Keep the lexical index's copy of the memory current
+                if await self.redis_client.hexists(f"lexical_documents:{agent_id}", memory_id):
+                    await self.redis_client.hset(
+                        f"lexical_documents:{agent_id}",
+                        memory_id,
+                        json.dumps(self._lexical_document(memory))
+                    )
+                
                 logger.info(f"✅ Importance updated to {importance} for memory {memory_id}")
                 
                 # Update Pinecone if available
@@ -1097,13 +1892,15 @@ class MemoryService:
     
     async def close(self):
         """Close connections to external services."""
-        # Close Redis clients
-        if self.redis_client:
-            await self.redis_client.close()
+        # Close Redis clients, including while their circuit breaker is open
+        redis_client = unguarded(self, "redis_client")
+        if redis_client:
+            await redis_client.close()
             logger.info("✅ Redis memory client closed")
             
-        if self.embedding_cache_client and self.embedding_cache_client != self.redis_client:
-            await self.embedding_cache_client.close()
+        embedding_cache_client = unguarded(self, "embedding_cache_client")
+        if embedding_cache_client and embedding_cache_client is not redis_client:
+            await embedding_cache_client.close()
             logger.info("✅ Redis embedding cache client closed")
             
         # Close HTTP client
@@ -0,0 +1,242 @@
+import os
+import time
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Tuple
+from dotenv import load_dotenv
+
+from .request_context import get_request_context
+from .tracing import start_span
+from .timings import get_timings
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+# Distinct agent types or models reported before further ones become "other"
+METRICS_MAX_LABEL_VALUES = int(os.getenv("METRICS_MAX_LABEL_VALUES", "32"))
+METRICS_LATENCY_BUCKETS = tuple(
+    float(bucket) for bucket in os.getenv(
+        "METRICS_LATENCY_BUCKETS",
+        "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60"
+    ).split(",")
+)
+
+
+class LabelLimiter:
+    """Caps the distinct values of a label.
+
+    The first max_values values are reported as they are and any later ones
+    as "other", so labels taken from agent configuration or request input
+    cannot create an unbounded number of series.
+    """
+
+    def __init__(self, max_values: int = METRICS_MAX_LABEL_VALUES):
+        self.max_values = max_values
+        self._seen = set()
+        self._lock = threading.Lock()
+
+    def __call__(self, value: Optional[Any]) -> str:
+        if not value:
+            return "none"
+        value = str(value)
+        if value in self._seen:
+            return value
+        with self._lock:
+            if len(self._seen) < self.max_values:
+                self._seen.add(value)
+                return value
+        return "other"
+
+
+class Metrics:
+    """Prometheus metrics for requests and the stages that serve them.
+
+    Stages are the units of work worth capacity planning for: config
+    resolution, memory lookups, embeddings, Gemini calls, Pinecone calls and
+    voice synthesis. Each records a latency histogram and an error counter
+    labelled by stage, agent type and model; agent type defaults to the one
+    in the request context. Cache lookups are counted by cache and result.
+
+    Stages are also traced as spans when tracing is on, and added to the
+    request's ExecutionTimings when its caller asked for timings. Without
+    prometheus_client installed, or with METRICS_ENABLED=false, nothing is
+    recorded as a metric.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = METRICS_ENABLED,
+        buckets: Tuple[float, ...] = METRICS_LATENCY_BUCKETS,
+        max_label_values: int = METRICS_MAX_LABEL_VALUES,
+        registry: Optional[Any] = None
+    ):
+        """Initialize the metrics.
+
+        Args:
+            enabled: Whether to record metrics.
+            buckets: Latency histogram buckets in seconds.
+            max_label_values: Distinct agent types and models per label.
+            registry: Prometheus registry. Defaults to the global one, which
+                also carries the process and GC collectors.
+        """
+        self.enabled = enabled and prometheus_client is not None
+        if enabled and prometheus_client is None:
+            logger.warning("⚠️ prometheus_client not installed, metrics are disabled")
+        if not self.enabled:
+            return
+
+        self.registry = registry or prometheus_client.REGISTRY
+        self.agent_types = LabelLimiter(max_label_values)
+        self.models = LabelLimiter(max_label_values)
+
+        self.request_duration = prometheus_client.Histogram(
+            "genesis_request_duration_seconds",
+            "HTTP request latency until the response headers are sent",
+            ["method", "route", "status"],
+            buckets=buckets,
+            registry=self.registry
+        )
+        self.stage_duration = prometheus_client.Histogram(
+            "genesis_stage_duration_seconds",
+            "Latency of one stage of request handling",
+            ["stage", "agent_type", "model"],
+            buckets=buckets,
+            registry=self.registry
+        )
+        self.stage_errors = prometheus_client.Counter(
+            "genesis_stage_errors",
+            "Stages that raised or returned an error",
+            ["stage", "agent_type", "model"],
+            registry=self.registry
+        )
+        self.cache_lookups = prometheus_client.Counter(
+            "genesis_cache_lookups",
+            "Cache lookups by cache and result",
+            ["cache", "result"],
+            registry=self.registry
+        )
+        logger.info("📈 Prometheus metrics enabled")
+
+    def observe_request(self, method: str, route: str, status: int, seconds: float):
+        """Record an HTTP request.
+
+        Args:
+            method: HTTP method.
+            route: Route template, e.g. "/agent/{agent_id}/execute", never the
+                raw path.
+            status: Response status code.
+            seconds: Time until the response headers were sent.
+        """
+        if self.enabled:
+            self.request_duration.labels(method, route, str(status)).observe(seconds)
+
+    def observe_stage(
+        self,
+        stage: str,
+        seconds: float,
+        error: bool = False,
+        model: Optional[str] = None,
+        agent_type: Optional[str] = None
+    ):
+        """Record one run of a stage.
+
+        Args:
+            stage: Stage name, e.g. "gemini_call".
+            seconds: Duration.
+            error: Whether the stage failed.
+            model: Model involved, if any.
+            agent_type: Agent type. Defaults to the request context's.
+        """
+        timings = get_timings()
+        if timings is not None:
+            timings.add_stage(stage, seconds, error, model)
+        if not self.enabled:
+            return
+        labels = (
+            stage,
+            self.agent_types(agent_type or get_request_context().get("agent_type")),
+            self.models(model)
+        )
+        self.stage_duration.labels(*labels).observe(seconds)
+        if error:
+            self.stage_errors.labels(*labels).inc()
+
+    @contextmanager
+    def stage(self, stage: str, model: Optional[str] = None, agent_type: Optional[str] = None) -> Iterator[None]:
+        """Time and trace a block as a stage; an exception escaping it counts as an error."""
+        with start_span(stage, **{"genesis.model": model}):
+            start_time = time.perf_counter()
+            error = False
+            try:
+                yield
+            except BaseException:
+                error = True
+                raise
+            finally:
+                self.observe_stage(stage, time.perf_counter() - start_time, error, model, agent_type)
+
+    def record_cache(self, cache: str, result: str):
+        """Count a cache lookup.
+
+        Args:
+            cache: Cache name, e.g. "gemini_exact".
+            result: Lookup result, e.g. "hit" or "miss".
+        """
+        timings = get_timings()
+        if timings is not None:
+            timings.add_cache(cache, result)
+        if self.enabled:
+            self.cache_lookups.labels(cache, result).inc()
+
+    def render(self) -> Tuple[bytes, str]:
+        """Metrics in the Prometheus text format, with its content type.
+
+        When PROMETHEUS_MULTIPROC_DIR is set, as it must be for several
+        worker processes, the metrics of all workers are merged.
+        """
+        registry = self.registry
+        if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+            registry = prometheus_client.CollectorRegistry()
+            multiprocess.MultiProcessCollector(registry)
+        return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+def timed(stage: str) -> Callable:
+    """Decorate a coroutine function to record each call as a stage."""
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with get_metrics().stage(stage):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Global metrics instance
+_metrics = None
+
+
+def get_metrics() -> Metrics:
+    """Get the global metrics instance.
+
+    Returns:
+        Metrics instance.
+    """
+    global _metrics
+
+    if _metrics is None:
+        _metrics = Metrics()
+
+    return _metrics
@@ -0,0 +1,198 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, Optional, Tuple
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Placeholder model names that ask the router to decide
+AUTO_MODEL_NAMES = frozenset({"", "auto", "default"})
+
+# Finish reasons where a stronger model may produce a usable answer. Safety
+# blocks and output length limits would recur on any model.
+ESCALATE_FINISH_REASONS = frozenset({"RECITATION", "OTHER", "MALFORMED_FUNCTION_CALL"})
+
+
+class ModelStats:
+    """Live latency and error statistics for one model."""
+
+    def __init__(self, alpha: float = 0.2, window: int = 200):
+        """Initialize the statistics.
+
+        Args:
+            alpha: Smoothing factor of the moving averages.
+            window: Number of recent latencies kept for percentiles.
+        """
+        self.alpha = alpha
+        self.latency_ewma: Optional[float] = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.latencies: Deque[float] = deque(maxlen=window)
+        self.last_error_at: Optional[float] = None
+
+    def record(self, latency: float, success: bool):
+        """Record the outcome of one request."""
+        self.requests += 1
+        self.error_rate += self.alpha * ((0.0 if success else 1.0) - self.error_rate)
+        if success:
+            self.latencies.append(latency)
+            if self.latency_ewma is None:
+                self.latency_ewma = latency
+            else:
+                self.latency_ewma += self.alpha * (latency - self.latency_ewma)
+        else:
+            self.errors += 1
+            self.last_error_at = time.time()
+
+    def percentile(self, q: float) -> Optional[float]:
+        """Latency percentile over the recent window, or None without samples.
+
+        Args:
+            q: Percentile between 0 and 100.
+        """
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "error_rate": round(self.error_rate, 4),
+            "latency_ewma": round(self.latency_ewma, 4) if self.latency_ewma is not None else None,
+            "latency_p50": self.percentile(50),
+            "latency_p95": self.percentile(95)
+        }
+
+
+class ModelRouter:
+    """Chooses a Gemini model per request and decides when to escalate.
+
+    Requests go to the fast model unless the agent type, input size or
+    output size call for the strong model, or live stats show the
+    preferred model is failing while the other is healthy.
+    """
+
+    def __init__(
+        self,
+        fast_model: str,
+        strong_model: str,
+        strong_agent_types: Iterable[str] = (),
+        long_input_tokens: int = 8000,
+        long_output_tokens: int = 2048,
+        max_error_rate: float = 0.5,
+        cascade: bool = True,
+        min_avg_logprob: float = -1.0
+    ):
+        """Initialize the router.
+
+        Args:
+            fast_model: Low latency model used by default.
+            strong_model: Higher quality model used when needed and for escalation.
+            strong_agent_types: Agent types that always use the strong model.
+            long_input_tokens: Inputs above this size go to the strong model.
+            long_output_tokens: Requested outputs above this size go to the strong model.
+            max_error_rate: Recent error rate above which a model is avoided.
+            cascade: Whether low-confidence fast model output is retried on the strong model.
+            min_avg_logprob: Responses with a lower average token log-probability
+                count as low confidence.
+        """
+        self.fast_model = fast_model
+        self.strong_model = strong_model
+        self.strong_agent_types = frozenset(strong_agent_types)
+        self.long_input_tokens = long_input_tokens
+        self.long_output_tokens = long_output_tokens
+        self.max_error_rate = max_error_rate
+        self.cascade = cascade
+        self.min_avg_logprob = min_avg_logprob
+        self.stats: Dict[str, ModelStats] = {}
+        self.escalations = 0
+
+    def model_stats(self, model: str) -> ModelStats:
+        """Get (creating if needed) the statistics for a model."""
+        if model not in self.stats:
+            self.stats[model] = ModelStats()
+        return self.stats[model]
+
+    def choose(
+        self,
+        requested_model: Optional[str] = None,
+        agent_type: Optional[str] = None,
+        input_tokens: int = 0,
+        max_tokens: int = 1024
+    ) -> Tuple[str, str]:
+        """Pick the model for a request.
+
+        Args:
+            requested_model: Explicit model from the caller; "auto" or None lets the router decide.
+            agent_type: Agent type of the caller.
+            input_tokens: Estimated prompt size.
+            max_tokens: Requested output allowance.
+
+        Returns:
+            Tuple of (model, reason).
+        """
+        if requested_model and requested_model.lower() not in AUTO_MODEL_NAMES:
+            return requested_model, "requested"
+
+        if agent_type in self.strong_agent_types:
+            model, reason = self.strong_model, f"agent type {agent_type}"
+        elif input_tokens > self.long_input_tokens:
+            model, reason = self.strong_model, f"long input ({input_tokens} tokens)"
+        elif max_tokens > self.long_output_tokens:
+            model, reason = self.strong_model, f"long output ({max_tokens} tokens)"
+        else:
+            model, reason = self.fast_model, "default"
+
+        # Route around a model that is currently failing if the other one is not
+        other = self.strong_model if model == self.fast_model else self.fast_model
+        if (
+            self.model_stats(model).error_rate > self.max_error_rate
+            and self.model_stats(other).error_rate <= self.max_error_rate
+        ):
+            return other, f"{model} unhealthy"
+
+        return model, reason
+
+    def escalation_model(self, model: str) -> Optional[str]:
+        """Model to retry low-confidence output on, or None if there is none."""
+        if not self.cascade or model == self.strong_model:
+            return None
+        return self.strong_model
+
+    def should_escalate(
+        self,
+        output_text: str,
+        finish_reason: Optional[str] = None,
+        avg_logprobs: Optional[float] = None
+    ) -> bool:
+        """Whether a response is empty, cut off for a recoverable reason or low confidence.
+
+        Args:
+            output_text: The generated text.
+            finish_reason: The candidate finishReason, if any.
+            avg_logprobs: The candidate avgLogprobs, if the API returned it.
+        """
+        if not output_text or not output_text.strip():
+            return True
+        if finish_reason in ESCALATE_FINISH_REASONS:
+            return True
+        return avg_logprobs is not None and avg_logprobs < self.min_avg_logprob
+
+    def record(self, model: str, latency: float, success: bool):
+        """Record the outcome of one request to a model."""
+        self.model_stats(model).record(latency, success)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Router configuration and live per-model statistics."""
+        return {
+            "fast_model": self.fast_model,
+            "strong_model": self.strong_model,
+            "cascade": self.cascade,
+            "escalations": self.escalations,
+            "models": {model: stats.to_dict() for model, stats in self.stats.items()}
+        }
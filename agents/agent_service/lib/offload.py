@@ -0,0 +1,262 @@
+import os
+import sys
+import types
+import asyncio
+import logging
+import functools
+import contextlib
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+from dotenv import load_dotenv
+import numpy as np
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+OFFLOAD_EXECUTOR = os.getenv("OFFLOAD_EXECUTOR", "thread")  # thread, process or inline
+OFFLOAD_MAX_WORKERS = int(os.getenv("OFFLOAD_MAX_WORKERS", "4"))
+# Inputs smaller than this (characters or bytes) run inline; handing them to a pool costs more than it saves
+OFFLOAD_MIN_SIZE = int(os.getenv("OFFLOAD_MIN_SIZE", "16384"))
+# CPU-bound text processing (keywords, sanitization, local embeddings) gets its own pool,
+# a process pool by default so it runs in parallel instead of competing for the GIL
+OFFLOAD_CPU_EXECUTOR = os.getenv("OFFLOAD_CPU_EXECUTOR", "process")
+OFFLOAD_CPU_MAX_WORKERS = int(os.getenv("OFFLOAD_CPU_MAX_WORKERS", "2"))
+OFFLOAD_CPU_MIN_SIZE = int(os.getenv("OFFLOAD_CPU_MIN_SIZE", "32768"))
+
+
+def _fill_shared_rows(func: Callable, name: str, shape: Tuple[int, int], start: int, items: Sequence[Any]):
+    """Run func(items, rows) in a worker, on rows start.. of a shared memory array."""
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        rows = np.ndarray(shape, dtype=np.float64, buffer=block.buf)[start:start + len(items)]
+        func(items, rows)
+        del rows
+    finally:
+        block.close()
+
+
+@contextlib.contextmanager
+def _hidden_main():
+    """Hide the main module from processes spawned inside the block.
+
+    A spawned process re-runs its parent's main module as __mp_main__ before
+    doing any work. Here that is main.py, which builds every service; pool
+    workers only run module-level functions from lib, which are pickled by
+    module name, so they are started without it.
+    """
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = types.ModuleType("__main__")
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+class _WorkerPool(ProcessPoolExecutor):
+    """Process pool whose workers import only what the submitted work needs."""
+
+    def submit(self, fn, /, *args, **kwargs):
+        # Workers are spawned on demand from within submit
+        with _hidden_main():
+            return super().submit(fn, *args, **kwargs)
+
+
+class Offloader:
+    """Runs CPU-heavy or blocking helpers off the event loop.
+
+    Work on inputs of at least min_size runs on a thread or process pool,
+    so one large input cannot stall every concurrent request; smaller
+    inputs run inline. A thread pool keeps the loop responsive but still
+    shares the GIL, while a process pool also runs the work in parallel at
+    the cost of pickling arguments and results, and only takes module-level
+    functions. Process workers import just the modules of the functions
+    they run, so those should stay light (see lib.text_processing). The
+    pool is created on first use.
+
+    Sizes are a rough measure of the work, e.g. characters of text or values
+    produced; each caller picks the one that grows with its cost.
+    """
+
+    def __init__(
+        self,
+        kind: str = OFFLOAD_EXECUTOR,
+        max_workers: int = OFFLOAD_MAX_WORKERS,
+        min_size: int = OFFLOAD_MIN_SIZE,
+        name: str = "offload"
+    ):
+        """Initialize the offloader.
+
+        Args:
+            kind: "thread", "process" or "inline" to run everything inline.
+            max_workers: Pool size.
+            min_size: Smallest input size that is offloaded.
+            name: Name for logs and the pool's threads.
+        """
+        if kind not in ("thread", "process", "inline"):
+            logger.warning(f"⚠️ Unknown executor {kind!r} for {name}, using thread")
+            kind = "thread"
+        self.name = name
+        self.kind = kind
+        self.max_workers = max_workers
+        self.min_size = min_size
+        self._executor: Optional[Executor] = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                # Spawned workers start clean instead of inheriting the
+                # event loop, sockets and locks of a forked server
+                self._executor = _WorkerPool(
+                    max_workers=self.max_workers,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers,
+                    thread_name_prefix=self.name
+                )
+            logger.info(f"✅ Started {self.name} {self.kind} pool of {self.max_workers} for work of size {self.min_size}+")
+        return self._executor
+
+    def should_offload(self, size: Optional[int]) -> bool:
+        """Whether work on an input of this size goes to the pool; None means always."""
+        return self.kind != "inline" and (size is None or size >= self.min_size)
+
+    async def run(self, func: Callable, *args: Any, size: Optional[int] = None, **kwargs: Any) -> Any:
+        """Run func(*args, **kwargs), on the pool if the input is large enough.
+
+        Args:
+            func: Function to run; module-level for a process pool.
+            *args: Positional arguments.
+            size: Input size, e.g. characters of text. None always offloads.
+            **kwargs: Keyword arguments.
+
+        Returns:
+            The function's result.
+        """
+        if not self.should_offload(size):
+            return func(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(),
+            functools.partial(func, *args, **kwargs)
+        )
+
+    async def map_rows(
+        self,
+        func: Callable,
+        items: Sequence[Any],
+        width: int,
+        size: Optional[int] = None
+    ) -> List[List[float]]:
+        """Compute one row of floats per item, in batches on the pool if the work is large enough.
+
+        func(batch, rows) writes the row of each item of a batch into rows.
+        Items are split into one batch per worker, so a large request costs
+        a handful of submissions rather than one per item. On a process pool
+        the rows are written straight into shared memory, so results come
+        back without being pickled.
+
+        Args:
+            func: Function filling rows; module-level for a process pool.
+            items: Items to compute rows for.
+            width: Row length.
+            size: Work size. None always offloads.
+
+        Returns:
+            One list of floats per item.
+        """
+        if not items:
+            return []
+        shape = (len(items), width)
+        if not self.should_offload(size):
+            rows = np.empty(shape)
+            func(items, rows)
+            return rows.tolist()
+
+        batch_size = -(-len(items) // self.max_workers)
+        starts = range(0, len(items), batch_size)
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+
+        if self.kind != "process":
+            rows = np.empty(shape)
+            await asyncio.gather(*(
+                loop.run_in_executor(executor, func, items[start:start + batch_size], rows[start:start + batch_size])
+                for start in starts
+            ))
+            return rows.tolist()
+
+        block = shared_memory.SharedMemory(create=True, size=shape[0] * shape[1] * np.dtype(np.float64).itemsize)
+        try:
+            await asyncio.gather(*(
+                loop.run_in_executor(
+                    executor, _fill_shared_rows, func, block.name, shape, start, items[start:start + batch_size]
+                )
+                for start in starts
+            ))
+            return np.ndarray(shape, dtype=np.float64, buffer=block.buf).tolist()
+        finally:
+            block.close()
+            block.unlink()
+
+    def shutdown(self):
+        """Shut the pool down without waiting for running work."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+# Global offloader instance
+_offloader = None
+
+
+def get_offloader() -> Offloader:
+    """Get the global offloader instance.
+
+    Returns:
+        Offloader instance.
+    """
+    global _offloader
+
+    if _offloader is None:
+        _offloader = Offloader()
+
+    return _offloader
+
+
+async def offload(func: Callable, *args: Any, size: Optional[int] = None, **kwargs: Any) -> Any:
+    """Run a helper through the global offloader; see Offloader.run."""
+    return await get_offloader().run(func, *args, size=size, **kwargs)
+
+
+# Global offloader instance for CPU-bound text processing
+_cpu_offloader = None
+
+
+def get_cpu_offloader() -> Offloader:
+    """Get the global offloader instance for CPU-bound text processing.
+
+    Returns:
+        Offloader instance.
+    """
+    global _cpu_offloader
+
+    if _cpu_offloader is None:
+        _cpu_offloader = Offloader(
+            OFFLOAD_CPU_EXECUTOR,
+            OFFLOAD_CPU_MAX_WORKERS,
+            OFFLOAD_CPU_MIN_SIZE,
+            name="offload-cpu"
+        )
+
+    return _cpu_offloader
+
+
+async def offload_cpu(func: Callable, *args: Any, size: Optional[int] = None, **kwargs: Any) -> Any:
+    """Run a CPU-bound helper through the CPU offloader; see Offloader.run."""
+    return await get_cpu_offloader().run(func, *args, size=size, **kwargs)
@@ -0,0 +1,220 @@
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, Optional, Sequence
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+PROFILER_DEFAULT_HZ = int(os.getenv("PROFILER_DEFAULT_HZ", "100"))
+PROFILER_MAX_HZ = int(os.getenv("PROFILER_MAX_HZ", "1000"))
+PROFILER_MAX_SECONDS = float(os.getenv("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MAX_DEPTH = int(os.getenv("PROFILER_MAX_DEPTH", "128"))
+
+PROFILE_MODES = ("wall", "cpu")
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one is running."""
+
+
+def cpu_mode_supported() -> bool:
+    """Whether per-thread CPU clocks are available on this platform."""
+    return hasattr(time, "pthread_getcpuclockid")
+
+
+def _frame_label(frame: Any) -> str:
+    code = frame.f_code
+    # Last two path components are enough to tell modules apart and keep lines short
+    filename = os.path.join(*code.co_filename.replace("\\", "/").split("/")[-2:])
+    name = getattr(code, "co_qualname", code.co_name)
+    return f"{name} ({filename}:{code.co_firstlineno})"
+
+
+class SamplingProfiler:
+    """Samples thread stacks from a background thread for a fixed time.
+
+    Nothing is hooked into the interpreter: the sampler thread exists only
+    while a profile runs and reads stacks with sys._current_frames(), so an
+    idle service pays nothing and a profiled one pays for one stack walk per
+    thread and tick.
+
+    In wall mode every tick samples each thread, including ones waiting on
+    I/O or locks, and a stack's weight is its sample count, which shows
+    where latency goes. In cpu mode a stack's weight is the CPU time, in
+    microseconds, its thread used since the previous tick, which shows where
+    CPU goes; threads that stayed idle add nothing. The sampler needs the
+    GIL to take a sample, so CPU used in short bursts tends to be charged to
+    the wait that follows them, e.g. the event loop's selector; hot spots
+    that hold the loop for more than a few milliseconds show up clearly.
+    Stacks of suspended coroutines are not visible; the event loop thread
+    shows the coroutine running at the time, or the selector while it waits.
+    """
+
+    def __init__(
+        self,
+        thread_ids: Sequence[int],
+        thread_prefixes: Sequence[str] = (),
+        mode: str = "wall",
+        hz: int = PROFILER_DEFAULT_HZ,
+        max_depth: int = PROFILER_MAX_DEPTH
+    ):
+        """Initialize the profiler.
+
+        Args:
+            thread_ids: Idents of threads to sample, e.g. the event loop's.
+            thread_prefixes: Also sample threads whose name starts with one
+                of these, including threads started during the profile. An
+                empty prefix matches every thread but the sampler.
+            mode: "wall" or "cpu".
+            hz: Samples per second.
+            max_depth: Frames kept per stack, innermost first.
+        """
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"Unknown profile mode {mode!r}, expected one of {', '.join(PROFILE_MODES)}")
+        if mode == "cpu" and not cpu_mode_supported():
+            raise ValueError("cpu mode needs per-thread CPU clocks, which this platform lacks")
+        self.thread_ids = set(thread_ids)
+        self.thread_prefixes = tuple(thread_prefixes)
+        self.mode = mode
+        self.interval = 1 / max(1, min(hz, PROFILER_MAX_HZ))
+        self.max_depth = max_depth
+        self.stacks: Counter = Counter()
+        self.total_weight = 0
+        self.samples = 0
+        self.ticks = 0
+        self.duration = 0.0
+        self._cpu_times: Dict[int, float] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def _targets(self) -> Dict[int, str]:
+        targets = {}
+        for thread in threading.enumerate():
+            if thread is self._thread:
+                continue
+            if thread.ident in self.thread_ids or (
+                self.thread_prefixes and thread.name.startswith(self.thread_prefixes)
+            ):
+                targets[thread.ident] = thread.name
+        return targets
+
+    def _cpu_used(self, ident: int) -> int:
+        """Microseconds of CPU the thread used since the previous call."""
+        try:
+            cpu_time = time.clock_gettime(time.pthread_getcpuclockid(ident))
+        except (OSError, OverflowError):
+            # Thread exited between enumerate() and here
+            return 0
+        previous = self._cpu_times.get(ident, cpu_time)
+        self._cpu_times[ident] = cpu_time
+        return int((cpu_time - previous) * 1_000_000)
+
+    def _sample(self):
+        targets = self._targets()
+        frames = sys._current_frames()
+        for ident, name in targets.items():
+            frame = frames.get(ident)
+            weight = self._cpu_used(ident) if self.mode == "cpu" else 1
+            if frame is None or weight <= 0:
+                continue
+            labels = []
+            while frame is not None and len(labels) < self.max_depth:
+                labels.append(_frame_label(frame))
+                frame = frame.f_back
+            labels.append(name)
+            self.stacks[";".join(reversed(labels))] += weight
+            self.total_weight += weight
+            self.samples += 1
+        self.ticks += 1
+
+    def _run(self):
+        start_time = time.perf_counter()
+        if self.mode == "cpu":
+            # Prime the CPU clocks so the first tick compares against something
+            for ident in self._targets():
+                self._cpu_used(ident)
+        while not self._stop.wait(self.interval):
+            try:
+                self._sample()
+            except Exception as e:
+                logger.error(f"❌ Profiler sample failed: {str(e)}")
+                break
+        self.duration = time.perf_counter() - start_time
+
+    def start(self):
+        """Start sampling in a background thread."""
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread to exit."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flamegraph.pl and speedscope.
+
+        One line per distinct stack: the thread name and frames from
+        outermost to innermost separated by semicolons, then the weight.
+        """
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        """Sampling statistics and the functions with the most weight on top of a stack."""
+        self_counts: Counter = Counter()
+        for stack, count in self.stacks.items():
+            self_counts[stack.rsplit(";", 1)[-1]] += count
+        return {
+            "mode": self.mode,
+            "duration_s": round(self.duration, 3),
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "weight_unit": "cpu_us" if self.mode == "cpu" else "samples",
+            "total_weight": self.total_weight,
+            "distinct_stacks": len(self.stacks),
+            "top_self": [
+                {"frame": frame, "weight": weight, "share": round(weight / self.total_weight, 4)}
+                for frame, weight in self_counts.most_common(20)
+            ] if self.total_weight else []
+        }
+
+
+# Only one profile runs at a time; two samplers would skew each other
+_profile_lock = threading.Lock()
+
+
+def run_profile(seconds: float, **kwargs: Any) -> SamplingProfiler:
+    """Profile for a number of seconds, blocking the calling thread.
+
+    Args:
+        seconds: Profile duration, capped at PROFILER_MAX_SECONDS.
+        **kwargs: SamplingProfiler arguments.
+
+    Returns:
+        The finished profiler.
+
+    Raises:
+        ProfilerBusy: If another profile is running.
+        ValueError: If the arguments are invalid.
+    """
+    profiler = SamplingProfiler(**kwargs)
+    if not _profile_lock.acquire(blocking=False):
+        raise ProfilerBusy("A profile is already running")
+    try:
+        seconds = max(0.0, min(seconds, PROFILER_MAX_SECONDS))
+        logger.info(f"🔬 Profiling for {seconds:.1f}s in {profiler.mode} mode")
+        profiler.start()
+        time.sleep(seconds)
+        profiler.stop()
+    finally:
+        _profile_lock.release()
+    return profiler
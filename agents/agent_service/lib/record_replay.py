@@ -0,0 +1,359 @@
+import os
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import logging
+import threading
+from collections import defaultdict
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+import httpx
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# off, record or replay
+TRAFFIC_MODE = os.getenv("TRAFFIC_MODE", "off").lower()
+TRAFFIC_CASSETTE = os.getenv("TRAFFIC_CASSETTE", "recordings/traffic.jsonl")
+# Replay timing: none (instant), original (recorded latency of the matched
+# interaction) or sampled (seeded draw from the endpoint's recorded latencies)
+TRAFFIC_REPLAY_LATENCY = os.getenv("TRAFFIC_REPLAY_LATENCY", "none").lower()
+TRAFFIC_REPLAY_SEED = int(os.getenv("TRAFFIC_REPLAY_SEED", "0"))
+# Without strict matching, an unrecorded request gets a recorded response from the same endpoint
+TRAFFIC_REPLAY_STRICT = os.getenv("TRAFFIC_REPLAY_STRICT", "false").lower() == "true"
+
+_REDACTED_PARAMS = {"key", "api_key"}
+_DROPPED_HEADERS = {"set-cookie", "transfer-encoding", "connection", "date"}
+
+
+class ReplayMissError(httpx.TransportError):
+    """Raised in replay mode when no recorded interaction matches a request."""
+
+
+def _redact_url(url: str) -> str:
+    parts = urlsplit(url)
+    query = [(k, "REDACTED" if k in _REDACTED_PARAMS else v) for k, v in parse_qsl(parts.query, keep_blank_values=True)]
+    return urlunsplit((parts.scheme, parts.netloc, parts.path, urlencode(query), ""))
+
+
+def _request_key(service: str, method: str, target: str, body: Any) -> str:
+    """Stable key of a request, ignoring credentials."""
+    if isinstance(body, bytes):
+        try:
+            body = json.loads(body)
+        except ValueError:
+            body = body.decode("latin-1")
+    payload = json.dumps([service, method, target, body], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class Cassette:
+    """A JSON-lines file of recorded interactions."""
+
+    def __init__(self, path: str = TRAFFIC_CASSETTE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._by_key: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+        self._by_endpoint: Dict[Tuple[str, str, str], List[Dict[str, Any]]] = defaultdict(list)
+        self._cursors: Dict[str, int] = defaultdict(int)
+
+    def append(self, interaction: Dict[str, Any]):
+        """Append an interaction to the cassette file."""
+        with self._lock:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(interaction) + "\n")
+
+    def load(self) -> int:
+        """Load recorded interactions for replay.
+
+        Returns:
+            Number of interactions loaded.
+        """
+        count = 0
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                interaction = json.loads(line)
+                self._by_key[interaction["key"]].append(interaction)
+                self._by_endpoint[self._endpoint(interaction)].append(interaction)
+                count += 1
+        logger.info(f"📼 Loaded {count} recorded interactions from {self.path}")
+        return count
+
+    def match(self, key: str, service: str, method: str, target: str) -> Optional[Dict[str, Any]]:
+        """Find the recorded interaction for a request.
+
+        Repeated requests cycle through their recordings in recorded order.
+        Without an exact match and unless TRAFFIC_REPLAY_STRICT is set, a
+        recording of the same endpoint is chosen deterministically by key.
+        """
+        with self._lock:
+            candidates = self._by_key.get(key)
+            if candidates:
+                cursor = self._cursors[key]
+                self._cursors[key] = cursor + 1
+                return candidates[cursor % len(candidates)]
+
+            if TRAFFIC_REPLAY_STRICT:
+                return None
+            candidates = self._by_endpoint.get((service, method, urlsplit(target).path))
+            if not candidates:
+                return None
+            return candidates[int(key[:8], 16) % len(candidates)]
+
+    def latencies(self, interaction: Dict[str, Any]) -> List[float]:
+        """Recorded latencies of all interactions with the same endpoint."""
+        return [i["latency"] for i in self._by_endpoint.get(self._endpoint(interaction), [])]
+
+    @staticmethod
+    def _endpoint(interaction: Dict[str, Any]) -> Tuple[str, str, str]:
+        return (interaction["service"], interaction["method"], urlsplit(interaction["target"]).path)
+
+
+class _RecordingStream(httpx.AsyncByteStream):
+    """Passes a response body through while recording chunk timings."""
+
+    def __init__(self, response: httpx.Response, interaction: Dict[str, Any], start: float, cassette: Cassette):
+        self._response = response
+        self._interaction = interaction
+        self._start = start
+        self._cassette = cassette
+        self._chunks: List[List[Any]] = []
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        async for chunk in self._response.stream:
+            self._chunks.append([round(time.time() - self._start, 4), base64.b64encode(chunk).decode("ascii")])
+            yield chunk
+
+    async def aclose(self):
+        await self._response.aclose()
+        self._interaction["latency"] = round(time.time() - self._start, 4)
+        self._interaction["chunks"] = self._chunks
+        self._cassette.append(self._interaction)
+
+
+class _ReplayStream(httpx.AsyncByteStream):
+    """Replays recorded chunks, spaced by their recorded offsets times a scale."""
+
+    def __init__(self, chunks: List[List[Any]], scale: float):
+        self._chunks = chunks
+        self._scale = scale
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        previous = None
+        for offset, data in self._chunks:
+            if self._scale and previous is not None:
+                await asyncio.sleep((offset - previous) * self._scale)
+            previous = offset
+            yield base64.b64decode(data)
+
+
+class RecordReplayTransport(httpx.AsyncBaseTransport):
+    """httpx transport that records real traffic or replays a recording.
+
+    Recorded interactions keep the response status, headers, body chunks
+    and their timing: time to headers, offset of every body chunk and total
+    latency. Credentials in query strings are redacted before anything is
+    stored or matched.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        mode: str,
+        cassette: Cassette,
+        transport: Optional[httpx.AsyncBaseTransport] = None,
+        latency: str = TRAFFIC_REPLAY_LATENCY,
+        seed: int = TRAFFIC_REPLAY_SEED
+    ):
+        """Initialize the transport.
+
+        Args:
+            service: Service name recorded with each interaction, e.g. "gemini".
+            mode: "record" or "replay".
+            cassette: Where interactions are recorded or replayed from.
+            transport: Real transport used when recording.
+            latency: Replay timing: none, original or sampled.
+            seed: Seed for sampled latencies.
+        """
+        self.service = service
+        self.mode = mode
+        self.cassette = cassette
+        self.transport = transport or httpx.AsyncHTTPTransport()
+        self.latency = latency
+        self._random = random.Random(f"{seed}:{service}")
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        target = _redact_url(str(request.url))
+        body = await request.aread()
+        key = _request_key(self.service, request.method, target, body)
+
+        if self.mode == "replay":
+            return await self._replay(request, key, target)
+
+        start = time.time()
+        response = await self.transport.handle_async_request(request)
+        interaction = {
+            "service": self.service,
+            "method": request.method,
+            "target": target,
+            "key": key,
+            "status": response.status_code,
+            "headers": [[k, v] for k, v in response.headers.items() if k.lower() not in _DROPPED_HEADERS],
+            "ttfb": round(time.time() - start, 4),
+            "recorded_at": start
+        }
+        return httpx.Response(
+            status_code=response.status_code,
+            headers=response.headers,
+            stream=_RecordingStream(response, interaction, start, self.cassette),
+            extensions=response.extensions,
+            request=request
+        )
+
+    async def _replay(self, request: httpx.Request, key: str, target: str) -> httpx.Response:
+        interaction = self.cassette.match(key, self.service, request.method, target)
+        if interaction is None:
+            raise ReplayMissError(f"No recorded {self.service} response for {request.method} {target}", request=request)
+
+        scale = self._latency_scale(interaction)
+        if scale:
+            await asyncio.sleep(interaction["ttfb"] * scale)
+
+        return httpx.Response(
+            status_code=interaction["status"],
+            headers=interaction["headers"],
+            stream=_ReplayStream(interaction["chunks"], scale),
+            request=request
+        )
+
+    def _latency_scale(self, interaction: Dict[str, Any]) -> float:
+        """Factor applied to the recorded timings of an interaction."""
+        if self.latency == "original":
+            return 1.0
+        if self.latency == "sampled" and interaction["latency"] > 0:
+            return self._random.choice(self.cassette.latencies(interaction)) / interaction["latency"]
+        return 0.0
+
+    async def aclose(self):
+        await self.transport.aclose()
+
+
+def _to_plain(value: Any) -> Any:
+    """Convert an SDK response object to JSON-compatible data."""
+    if hasattr(value, "to_dict"):
+        value = value.to_dict()
+    return json.loads(json.dumps(value, default=str))
+
+
+class RecordReplayPineconeIndex:
+    """Records or replays calls to a Pinecone index.
+
+    Results are stored as plain dicts, which is how the memory service reads
+    them. In replay mode no real index is needed.
+    """
+
+    def __init__(self, mode: str, cassette: Cassette, index: Any = None, latency: str = TRAFFIC_REPLAY_LATENCY):
+        self.mode = mode
+        self.cassette = cassette
+        self.index = index
+        self.latency = latency
+
+    def __getattr__(self, name: str):
+        if name.startswith("_"):
+            raise AttributeError(name)
+
+        def call(*args, **kwargs):
+            target = f"pinecone://index/{name}"
+            key = _request_key("pinecone", "CALL", target, {"args": _to_plain(args), "kwargs": _to_plain(kwargs)})
+
+            if self.mode == "replay":
+                interaction = self.cassette.match(key, "pinecone", "CALL", target)
+                if interaction is None:
+                    raise ReplayMissError(f"No recorded Pinecone {name} call")
+                if self.latency != "none":
+                    time.sleep(interaction["latency"])
+                return interaction["result"]
+
+            start = time.time()
+            result = getattr(self.index, name)(*args, **kwargs)
+            self.cassette.append({
+                "service": "pinecone",
+                "method": "CALL",
+                "target": target,
+                "key": key,
+                "result": _to_plain(result),
+                "latency": round(time.time() - start, 4),
+                "recorded_at": start
+            })
+            return result
+
+        return call
+
+
+class ReplayPineconeClient:
+    """Stands in for the Pinecone client in replay mode."""
+
+    def __init__(self, index_name: str, index: RecordReplayPineconeIndex):
+        self.index_name = index_name
+        self.index = index
+
+    def list_indexes(self) -> List[Any]:
+        return [type("IndexDescription", (), {"name": self.index_name})()]
+
+    def Index(self, name: str) -> RecordReplayPineconeIndex:
+        return self.index
+
+
+# One cassette per process, shared by all services
+_cassette: Optional[Cassette] = None
+
+
+def get_cassette() -> Cassette:
+    """Get the process-wide cassette, loading it in replay mode."""
+    global _cassette
+
+    if _cassette is None:
+        _cassette = Cassette()
+        if TRAFFIC_MODE == "replay":
+            _cassette.load()
+        elif TRAFFIC_MODE == "record":
+            logger.info(f"📼 Recording external API traffic to {_cassette.path}")
+
+    return _cassette
+
+
+def get_transport(service: str) -> Optional[httpx.AsyncBaseTransport]:
+    """Transport for an httpx client of a service, or None for the default.
+
+    Args:
+        service: Service name, e.g. "gemini" or "elevenlabs".
+    """
+    if TRAFFIC_MODE not in ("record", "replay"):
+        return None
+    return RecordReplayTransport(service, TRAFFIC_MODE, get_cassette())
+
+
+def wrap_pinecone_index(index: Any) -> Any:
+    """Wrap a Pinecone index for recording, or return it unchanged."""
+    if TRAFFIC_MODE != "record":
+        return index
+    return RecordReplayPineconeIndex("record", get_cassette(), index)
+
+
+def replay_api_key(api_key: Optional[str]) -> Optional[str]:
+    """Placeholder credential so services run against a replay without real keys."""
+    if TRAFFIC_MODE == "replay" and (not api_key or api_key.startswith("your_")):
+        return "replay"
+    return api_key
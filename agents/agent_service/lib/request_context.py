@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator
+
+# Attributes of the work being done, e.g. agent_id and guild_id, visible to
+# everything called while handling it without threading them through calls
+_request_context: ContextVar[Dict[str, Any]] = ContextVar("request_context", default={})
+
+
+def get_request_context() -> Dict[str, Any]:
+    """Get the attributes of the current request."""
+    return _request_context.get()
+
+
+@contextmanager
+def request_context(**fields: Any) -> Iterator[Dict[str, Any]]:
+    """Add attributes to the request context for the duration of a block.
+
+    Fields set to None are ignored, and nested blocks inherit outer fields.
+
+    Args:
+        **fields: Attributes to set, e.g. agent_id="seo_1".
+
+    Yields:
+        The combined context.
+    """
+    context = {**_request_context.get(), **{k: v for k, v in fields.items() if v is not None}}
+    token = _request_context.set(context)
+    try:
+        yield context
+    finally:
+        _request_context.reset(token)
@@ -0,0 +1,310 @@
+import math
+import re
+import time
+import heapq
+from collections import Counter
+from typing import Any, Dict, Hashable, List, Mapping, Optional, Sequence, Set, Tuple
+
+import numpy as np
+
+# Identifiers such as order numbers, SKUs and emails are kept whole
+# (e.g. "ord-10042", "sku_77/a") and also indexed by their parts.
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./#@][a-z0-9]+)*")
+_TOKEN_SPLIT_PATTERN = re.compile(r"[-_./#@]")
+
+# Query terms that carry no retrieval signal on their own
+_STOPWORDS = frozenset({
+    "the", "a", "an", "and", "or", "but", "is", "are", "was", "were", "be", "been",
+    "in", "on", "at", "to", "for", "with", "by", "about", "from", "of", "as",
+    "i", "we", "you", "they", "he", "she", "it", "my", "our", "your", "this", "that",
+    "what", "which", "who", "when", "where", "why", "how", "do", "does", "did",
+    "can", "could", "would", "should", "will", "have", "has", "had", "me", "please"
+})
+
+
+def tokenize(text: str) -> List[str]:
+    """Tokenize text for lexical retrieval.
+
+    Args:
+        text: Text to tokenize.
+
+    Returns:
+        List of lowercase tokens. Compound identifiers are emitted both
+        whole and split into their alphanumeric parts.
+    """
+    tokens = []
+    for token in _TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        parts = _TOKEN_SPLIT_PATTERN.split(token)
+        if len(parts) > 1:
+            tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def query_terms(query: str) -> Set[str]:
+    """Distinct terms of a query that carry retrieval signal.
+
+    Args:
+        query: The search query.
+
+    Returns:
+        Set of tokens without stopwords.
+    """
+    return set(tokenize(query)) - _STOPWORDS
+
+
+def bm25_scores(
+    postings: Mapping[str, Mapping[Hashable, int]],
+    document_lengths: Mapping[Hashable, int],
+    document_count: int,
+    average_length: float,
+    k1: float = 1.5,
+    b: float = 0.75,
+    limit: Optional[int] = None
+) -> List[Tuple[Hashable, float]]:
+    """Score documents with Okapi BM25 from the postings of the query terms.
+
+    Only documents containing a query term are visited, so the cost grows
+    with the postings of the query terms rather than with the corpus.
+
+    Args:
+        postings: Mapping of each query term to {document: term frequency}.
+        document_lengths: Token count of each document in the postings.
+        document_count: Number of documents in the corpus.
+        average_length: Average document token count in the corpus.
+        k1: Term frequency saturation parameter.
+        b: Document length normalization parameter.
+        limit: Optional maximum number of results.
+
+    Returns:
+        List of (document, score) tuples with a positive score, best match first.
+    """
+    average_length = average_length or 1.0
+    scores: Dict[Hashable, float] = {}
+    for documents in postings.values():
+        frequency_in_corpus = len(documents)
+        if not frequency_in_corpus:
+            continue
+        idf = math.log(1 + (document_count - frequency_in_corpus + 0.5) / (frequency_in_corpus + 0.5))
+        for document, frequency in documents.items():
+            length = document_lengths.get(document, average_length)
+            denominator = frequency + k1 * (1 - b + b * length / average_length)
+            scores[document] = scores.get(document, 0.0) + idf * frequency * (k1 + 1) / denominator
+
+    positive = ((document, score) for document, score in scores.items() if score > 0)
+    if limit:
+        return heapq.nlargest(limit, positive, key=lambda item: item[1])
+    return sorted(positive, key=lambda item: item[1], reverse=True)
+
+
+def bm25_rank(
+    query: str,
+    documents: Sequence[str],
+    k1: float = 1.5,
+    b: float = 0.75,
+    limit: Optional[int] = None
+) -> List[Tuple[int, float]]:
+    """Rank documents against a query with Okapi BM25.
+
+    Tokenizes every document on each call; use LexicalIndex to search a
+    corpus repeatedly.
+
+    Args:
+        query: The search query.
+        documents: Document texts to rank.
+        k1: Term frequency saturation parameter.
+        b: Document length normalization parameter.
+        limit: Optional maximum number of results.
+
+    Returns:
+        List of (document_index, score) tuples with a positive score,
+        best match first.
+    """
+    terms = query_terms(query)
+    if not terms or not documents:
+        return []
+
+    postings: Dict[str, Dict[int, int]] = {term: {} for term in terms}
+    lengths = []
+    for index, document in enumerate(documents):
+        counts = Counter(tokenize(document))
+        lengths.append(sum(counts.values()))
+        for term in terms:
+            if term in counts:
+                postings[term][index] = counts[term]
+
+    return bm25_scores(
+        postings, dict(enumerate(lengths)), len(documents), sum(lengths) / len(documents),
+        k1=k1, b=b, limit=limit
+    )
+
+
+class LexicalIndex:
+    """BM25 index that is updated one document at a time.
+
+    Holds postings (term to {document: term frequency}) and document
+    lengths, so a document is tokenized once when it is added and a search
+    only visits the documents containing a query term.
+    """
+
+    def __init__(self):
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.lengths: Dict[str, int] = {}
+        self.total_length = 0
+        self._terms: Dict[str, Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        return len(self.lengths)
+
+    def add(self, document_id: str, text: str):
+        """Index a document, replacing any earlier version of it."""
+        self.remove(document_id)
+        counts = Counter(tokenize(text))
+        for term, count in counts.items():
+            self.postings.setdefault(term, {})[document_id] = count
+        self._terms[document_id] = tuple(counts)
+        self.lengths[document_id] = sum(counts.values())
+        self.total_length += self.lengths[document_id]
+
+    def remove(self, document_id: str) -> bool:
+        """Remove a document; returns whether it was indexed."""
+        terms = self._terms.pop(document_id, None)
+        if terms is None:
+            return False
+        for term in terms:
+            documents = self.postings[term]
+            del documents[document_id]
+            if not documents:
+                del self.postings[term]
+        self.total_length -= self.lengths.pop(document_id)
+        return True
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Tuple[str, float]]:
+        """Rank indexed documents against a query with BM25.
+
+        Args:
+            query: The search query.
+            limit: Optional maximum number of results.
+
+        Returns:
+            List of (document_id, score) tuples, best match first.
+        """
+        if not self.lengths:
+            return []
+        postings = {term: self.postings[term] for term in query_terms(query) if term in self.postings}
+        return bm25_scores(
+            postings, self.lengths, len(self.lengths), self.total_length / len(self.lengths), limit=limit
+        )
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, List[str]],
+    k: int = 60,
+    weights: Optional[Dict[str, float]] = None
+) -> List[Tuple[str, float, List[str]]]:
+    """Fuse several ranked id lists with reciprocal rank fusion.
+
+    Args:
+        rankings: Mapping of source name to ids ordered best first.
+        k: RRF damping constant; larger values flatten rank differences.
+        weights: Optional per-source weights (default 1.0).
+
+    Returns:
+        List of (id, fused_score, contributing_sources) tuples, best first.
+    """
+    fused: Dict[str, float] = {}
+    sources: Dict[str, List[str]] = {}
+    for source, ids in rankings.items():
+        weight = (weights or {}).get(source, 1.0)
+        for rank, item_id in enumerate(ids, 1):
+            fused[item_id] = fused.get(item_id, 0.0) + weight / (k + rank)
+            sources.setdefault(item_id, []).append(source)
+
+    ordered = sorted(fused.items(), key=lambda item: item[1], reverse=True)
+    return [(item_id, score, sources[item_id]) for item_id, score in ordered]
+
+
+def rerank_memories(
+    memories: Sequence[Dict[str, Any]],
+    query_embedding: Sequence[float],
+    limit: int,
+    similarity_weight: float = 0.6,
+    recency_weight: float = 0.2,
+    importance_weight: float = 0.2,
+    match_weight: float = 0.2,
+    half_life_hours: float = 72.0,
+    mmr_lambda: float = 0.7,
+    now: Optional[float] = None
+) -> List[Dict[str, Any]]:
+    """Score candidate memories and select a diverse subset with Maximal Marginal Relevance.
+
+    Relevance combines cosine similarity to the query, exponential time decay
+    from ``created_at``, the stored ``importance`` and, for memories returned
+    by hybrid search, their normalized ``rrf_score``. MMR then trades that
+    relevance off against similarity to memories already selected, so
+    near-duplicate past turns do not crowd out other useful context.
+
+    Args:
+        memories: Candidate memory objects. Each must carry an ``embedding``.
+        query_embedding: Embedding of the current input.
+        limit: Maximum number of memories to return.
+        similarity_weight: Weight of query similarity in the relevance score.
+        recency_weight: Weight of time decay in the relevance score.
+        importance_weight: Weight of stored importance in the relevance score.
+        match_weight: Weight of the search match (``rrf_score``) in the relevance score.
+        half_life_hours: Age at which the recency term halves.
+        mmr_lambda: 1.0 ranks purely by relevance, lower values favour diversity.
+        now: Reference timestamp in seconds (defaults to the current time).
+
+    Returns:
+        Selected memories in rank order, each annotated with ``rerank_score``
+        and ``relevance``.
+    """
+    if not memories or limit <= 0:
+        return []
+
+    embeddings = np.asarray([memory["embedding"] for memory in memories], dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    embeddings = embeddings / np.where(norms > 0, norms, 1.0)
+
+    query_vector = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query_vector)
+    if query_norm > 0:
+        query_vector = query_vector / query_norm
+
+    now = time.time() if now is None else now
+    created_at = np.asarray([memory.get("created_at") or 0 for memory in memories], dtype=np.float64)
+    age_hours = np.clip(now - created_at, 0, None) / 3600.0
+    recency = np.exp(-math.log(2) * age_hours / max(half_life_hours, 1e-6))
+    importance = np.asarray([memory.get("importance") or 0.0 for memory in memories], dtype=np.float64)
+    similarity = embeddings @ query_vector
+    match = np.asarray([memory.get("rrf_score") or 0.0 for memory in memories], dtype=np.float64)
+    if match.max() > 0:
+        match = match / match.max()
+
+    relevance = (
+        similarity_weight * similarity
+        + recency_weight * recency
+        + importance_weight * importance
+        + match_weight * match
+    )
+
+    selected: List[int] = []
+    scores: List[float] = []
+    remaining = np.ones(len(memories), dtype=bool)
+    # Highest similarity of each candidate to anything already selected
+    redundancy = np.full(len(memories), -np.inf)
+
+    for _ in range(min(limit, len(memories))):
+        marginal = mmr_lambda * relevance - (1 - mmr_lambda) * np.where(np.isfinite(redundancy), redundancy, 0.0)
+        marginal = np.where(remaining, marginal, -np.inf)
+        chosen = int(np.argmax(marginal))
+        selected.append(chosen)
+        scores.append(float(marginal[chosen]))
+        remaining[chosen] = False
+        redundancy = np.maximum(redundancy, embeddings @ embeddings[chosen])
+
+    return [
+        {**memories[i], "rerank_score": score, "relevance": float(relevance[i])}
+        for i, score in zip(selected, scores)
+    ]
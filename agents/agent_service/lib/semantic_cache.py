@@ -0,0 +1,188 @@
+import json
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import uuid4
+
+import numpy as np
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+
+class SemanticCache:
+    """Nearest-neighbour cache keyed on embeddings instead of exact text.
+
+    Entries live in per-namespace in-process indexes searched with a single
+    matrix-vector product. When a Redis client is attached, entries are
+    written through to Redis and namespaces are periodically reloaded so
+    workers share hits.
+    """
+
+    def __init__(
+        self,
+        ttl: int = 3600,
+        max_entries: int = 1000,
+        key_prefix: str = "semantic_cache",
+        refresh_interval: float = 60.0
+    ):
+        """Initialize the semantic cache.
+
+        Args:
+            ttl: Entry time-to-live in seconds.
+            max_entries: Maximum entries per namespace; least recently used
+                entries are evicted first.
+            key_prefix: Redis key prefix.
+            refresh_interval: Seconds between reloads of a namespace from Redis.
+        """
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.key_prefix = key_prefix
+        self.refresh_interval = refresh_interval
+        self.redis_client = None
+        self._entries: Dict[str, "OrderedDict[str, Dict[str, Any]]"] = {}
+        self._matrices: Dict[str, Tuple[List[str], np.ndarray]] = {}
+        self._loaded_at: Dict[str, float] = {}
+
+    async def lookup(
+        self,
+        namespace: str,
+        embedding: List[float],
+        threshold: float
+    ) -> Optional[Tuple[Any, float]]:
+        """Find the nearest cached value above a similarity threshold.
+
+        Args:
+            namespace: Cache namespace.
+            embedding: Query embedding.
+            threshold: Minimum cosine similarity for a hit.
+
+        Returns:
+            Tuple of (value, similarity) or None on a miss.
+        """
+        await self._maybe_reload(namespace)
+        self._purge_expired(namespace)
+
+        entries = self._entries.get(namespace)
+        if not entries:
+            return None
+
+        ids, matrix = self._matrix(namespace)
+        similarities = matrix @ self._normalize(embedding)
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < threshold:
+            return None
+
+        entry_id = ids[best]
+        entries.move_to_end(entry_id)
+        return entries[entry_id]["value"], similarity
+
+    async def store(
+        self,
+        namespace: str,
+        embedding: List[float],
+        value: Any,
+        entry_id: Optional[str] = None
+    ):
+        """Add a value to the cache.
+
+        Args:
+            namespace: Cache namespace.
+            embedding: Embedding the value is looked up by.
+            value: JSON-serializable value to cache.
+            entry_id: Optional stable id; storing again under the same id
+                replaces the previous entry instead of adding a duplicate.
+        """
+        entry_id = entry_id or str(uuid4())
+        entry = {
+            "embedding": self._normalize(embedding),
+            "value": value,
+            "expires_at": time.time() + self.ttl
+        }
+        self._add(namespace, entry_id, entry)
+
+        if self.redis_client:
+            try:
+                payload = {
+                    "embedding": entry["embedding"].tolist(),
+                    "value": value,
+                    "expires_at": entry["expires_at"]
+                }
+                index_key = f"{self.key_prefix}:{namespace}"
+                await self.redis_client.setex(f"{index_key}:{entry_id}", self.ttl, json.dumps(payload))
+                await self.redis_client.zadd(index_key, {entry_id: entry["expires_at"]})
+                await self.redis_client.zremrangebyscore(index_key, 0, time.time())
+                # Keep the shared index bounded like the local one
+                await self.redis_client.zremrangebyrank(index_key, 0, -self.max_entries - 1)
+            except Exception as e:
+                logger.error(f"❌ Error storing semantic cache entry in Redis: {str(e)}")
+
+    def size(self, namespace: Optional[str] = None) -> int:
+        """Number of cached entries in one or all namespaces."""
+        if namespace is not None:
+            return len(self._entries.get(namespace, {}))
+        return sum(len(entries) for entries in self._entries.values())
+
+    def _add(self, namespace: str, entry_id: str, entry: Dict[str, Any]):
+        entries = self._entries.setdefault(namespace, OrderedDict())
+        entries[entry_id] = entry
+        entries.move_to_end(entry_id)
+        while len(entries) > self.max_entries:
+            entries.popitem(last=False)
+        self._matrices.pop(namespace, None)
+
+    def _purge_expired(self, namespace: str):
+        entries = self._entries.get(namespace)
+        if not entries:
+            return
+        now = time.time()
+        expired = [entry_id for entry_id, entry in entries.items() if entry["expires_at"] <= now]
+        for entry_id in expired:
+            del entries[entry_id]
+        if expired:
+            self._matrices.pop(namespace, None)
+
+    def _matrix(self, namespace: str) -> Tuple[List[str], np.ndarray]:
+        if namespace not in self._matrices:
+            entries = self._entries[namespace]
+            ids = list(entries.keys())
+            self._matrices[namespace] = (ids, np.stack([entries[i]["embedding"] for i in ids]))
+        return self._matrices[namespace]
+
+    async def _maybe_reload(self, namespace: str):
+        if not self.redis_client:
+            return
+        now = time.time()
+        if now - self._loaded_at.get(namespace, 0) < self.refresh_interval:
+            return
+        self._loaded_at[namespace] = now
+
+        try:
+            index_key = f"{self.key_prefix}:{namespace}"
+            entry_ids = await self.redis_client.zrangebyscore(index_key, now, "+inf")
+            entry_ids = [i.decode("utf-8") if isinstance(i, bytes) else i for i in entry_ids]
+            known = self._entries.get(namespace, {})
+            missing = [i for i in entry_ids if i not in known]
+            if not missing:
+                return
+
+            payloads = await self.redis_client.mget([f"{index_key}:{i}" for i in missing])
+            for entry_id, payload in zip(missing, payloads):
+                if not payload:
+                    continue
+                data = json.loads(payload)
+                self._add(namespace, entry_id, {
+                    "embedding": np.asarray(data["embedding"], dtype=np.float32),
+                    "value": data["value"],
+                    "expires_at": data["expires_at"]
+                })
+        except Exception as e:
+            logger.error(f"❌ Error loading semantic cache from Redis: {str(e)}")
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
@@ -0,0 +1,124 @@
+import re
+import hashlib
+import heapq
+from collections import Counter
+from typing import List, Sequence
+
+import numpy as np
+
+# CPU-heavy text helpers for the process pool. Workers import this module
+# without the services, so it must only depend on the standard library and
+# NumPy.
+
+_URL_PATTERN = re.compile(r'(?i)(?:https?://|www\.)(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*\\(\\),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+')
+_WORD_PATTERN = re.compile(r'\b[a-z0-9_\']+\b')
+
+_COMMON_WORDS = frozenset({
+    "the", "a", "an", "and", "or", "but", "is", "are", "was", "were",
+    "in", "on", "at", "to", "for", "with", "by", "about", "like",
+    "from", "of", "as", "my", "our", "your", "their", "his", "her", "its",
+    "i", "we", "you", "they", "he", "she", "it", "this", "that",
+    "what", "which", "who", "whom", "whose", "when", "where", "why", "how",
+    "can", "could", "would", "should", "will", "shall", "may", "might",
+    "must", "have", "has", "had", "do", "does", "did", "am",
+    "be", "been", "being"
+})
+
+
+def sanitize_input(text: str) -> str:
+    """Strip surrounding whitespace and replace URLs.
+
+    Args:
+        text: The raw user input.
+
+    Returns:
+        Sanitized text.
+    """
+    return _URL_PATTERN.sub('[URL removed for security]', text.strip())
+
+
+def extract_keywords(text: str, max_keywords: int = 10) -> List[str]:
+    """Extract key terms from a text string.
+
+    Up to half the slots go to the most frequent two-word phrases, the rest
+    to the most frequent single words not already in a phrase. Runs in
+    linear time: words and phrases are counted in one pass each rather than
+    by rescanning the text for every distinct word and phrase.
+
+    Args:
+        text: The input text.
+        max_keywords: Maximum number of keywords to extract.
+
+    Returns:
+        List of extracted keywords.
+    """
+    lowered = text.lower()
+    matches = list(_WORD_PATTERN.finditer(lowered))
+    words = [match.group().strip(".,;:!?\"'()[]{}-") for match in matches if len(match.group()) > 2]
+    keyword_counts = Counter(word for word in words if word and len(word) > 2 and word not in _COMMON_WORDS)
+
+    # Phrases (bigrams) of adjacent words that are not common words
+    phrases = {
+        f"{first} {second}": (first, second) for first, second in zip(words, words[1:])
+        if first not in _COMMON_WORDS and second not in _COMMON_WORDS
+    }
+    # How often each pair of words appears in the text as written, i.e. separated by one space
+    text_counts = Counter(
+        f"{first.group()} {second.group()}" for first, second in zip(matches, matches[1:])
+        if second.start() == first.end() + 1 and lowered[first.end()] == " "
+    )
+
+    # Phrases that repeat, or contain a frequent word, get a slight boost; the rest rank last
+    def phrase_score(phrase):
+        if text_counts[phrase] > 1 or any(keyword_counts[word] > 2 for word in phrases[phrase]):
+            return text_counts[phrase] * 1.5
+        return 0
+
+    final_keywords = heapq.nlargest(max_keywords // 2, phrases, key=phrase_score)
+
+    # Fill remaining slots with single words not already in phrases
+    remaining_slots = max_keywords - len(final_keywords)
+    if remaining_slots > 0:
+        for word in sorted(keyword_counts, key=keyword_counts.get, reverse=True):
+            if not any(word in phrase for phrase in final_keywords):
+                final_keywords.append(word)
+                remaining_slots -= 1
+                if remaining_slots <= 0:
+                    break
+
+    return final_keywords
+
+
+def _local_vector(text: str, dimension: int) -> np.ndarray:
+    hash_bytes = hashlib.sha256(text.encode('utf-8')).digest()
+    # A generator of its own, rather than reseeding the global one, is safe across threads
+    # and yields the same vectors
+    vector = np.random.RandomState(int.from_bytes(hash_bytes[:4], byteorder='big')).uniform(-1, 1, dimension)
+
+    # Normalize to unit length (important for cosine similarity)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+
+def local_embedding(text: str, dimension: int) -> List[float]:
+    """Deterministic unit vector derived from a hash of the text.
+
+    Args:
+        text: Text to embed.
+        dimension: Vector length.
+
+    Returns:
+        Embedding vector.
+    """
+    return _local_vector(text, dimension).tolist()
+
+
+def local_embeddings(texts: Sequence[str], out: np.ndarray):
+    """Write the local embedding of each text into the matching row of out.
+
+    Args:
+        texts: Texts to embed.
+        out: Array of shape (len(texts), dimension), e.g. a view of shared memory.
+    """
+    for row, text in zip(out, texts):
+        row[:] = _local_vector(text, out.shape[1])
@@ -0,0 +1,90 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, Optional
+
+# Collector for the request being handled, if its caller asked for timings
+_timings: ContextVar[Optional["ExecutionTimings"]] = ContextVar("execution_timings", default=None)
+
+
+class ExecutionTimings:
+    """Stage durations and cache results collected while handling one request.
+
+    Stages are the ones recorded through Metrics (memory lookups, prompt
+    build, Gemini calls, memory writes, voice synthesis, ...). Stages nest,
+    e.g. memory_context includes its embedding, so durations are inclusive
+    and do not add up to the total. A stage run several times, such as a
+    retried Gemini call, is reported once with the summed duration.
+    """
+
+    def __init__(self):
+        self.started_at = time.perf_counter()
+        self.stages: Dict[str, Dict[str, Any]] = {}
+        self.cache: Dict[str, str] = {}
+
+    def add_stage(self, stage: str, seconds: float, error: bool = False, model: Optional[str] = None):
+        entry = self.stages.setdefault(stage, {"duration_ms": 0.0, "count": 0, "errors": 0})
+        entry["duration_ms"] += seconds * 1000
+        entry["count"] += 1
+        entry["errors"] += int(error)
+        if model:
+            entry["model"] = model
+
+    def add_cache(self, cache: str, result: str):
+        self.cache[cache] = result
+
+    def total_ms(self) -> float:
+        return (time.perf_counter() - self.started_at) * 1000
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Timings as the structured field returned to the caller."""
+        return {
+            "total_ms": round(self.total_ms(), 2),
+            "stages": {
+                stage: {**entry, "duration_ms": round(entry["duration_ms"], 2)}
+                for stage, entry in self.stages.items()
+            },
+            "cache": dict(self.cache)
+        }
+
+    def server_timing(self) -> str:
+        """Timings as a Server-Timing header value.
+
+        Each stage is a metric with its duration and, for model calls, the
+        model as description; each cache is a metric without a duration
+        whose description is the lookup result.
+        """
+        metrics = [f"total;dur={self.total_ms():.1f}"]
+        for stage, entry in self.stages.items():
+            metric = f"{stage};dur={entry['duration_ms']:.1f}"
+            if entry.get("model"):
+                metric += f';desc="{entry["model"]}"'
+            metrics.append(metric)
+        metrics.extend(f'cache_{cache};desc="{result}"' for cache, result in self.cache.items())
+        return ", ".join(metrics)
+
+
+def get_timings() -> Optional[ExecutionTimings]:
+    """Get the timings collector of the current request, if any."""
+    return _timings.get()
+
+
+@contextmanager
+def collect_timings(enabled: bool = True) -> Iterator[Optional[ExecutionTimings]]:
+    """Collect stage timings for the duration of a block.
+
+    Args:
+        enabled: Whether to collect; when False the block runs unchanged.
+
+    Yields:
+        The collector, or None when not enabled.
+    """
+    if not enabled:
+        yield None
+        return
+    timings = ExecutionTimings()
+    token = _timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _timings.reset(token)
@@ -0,0 +1,211 @@
+import hashlib
+import logging
+import math
+import re
+from collections import OrderedDict
+from typing import Any, Optional
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+# Input token limits for the Gemini models we route to. Matched by prefix so
+# versioned names like "gemini-1.5-flash-latest" resolve to their family.
+MODEL_INPUT_TOKEN_LIMITS = {
+    "gemini-1.5-pro": 2097152,
+    "gemini-1.5-flash": 1048576,
+    "gemini-2.0-flash": 1048576,
+    "gemini-pro": 30720,
+}
+DEFAULT_INPUT_TOKEN_LIMIT = 30720
+
+# Words, numbers and individual punctuation marks, roughly how SentencePiece
+# splits English text before merging sub-word pieces.
+_PIECE_PATTERN = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def estimate_tokens(text: Optional[str]) -> int:
+    """Estimate the number of Gemini tokens in a text string.
+
+    Counts one token per punctuation mark and roughly one token per four
+    characters of each word, which tracks the model tokenizer much more
+    closely than a flat character ratio for code, identifiers and JSON.
+
+    Args:
+        text: Text to count tokens for.
+
+    Returns:
+        Estimated token count.
+    """
+    if not text:
+        return 0
+    return sum(max(1, math.ceil(len(piece) / 4)) for piece in _PIECE_PATTERN.findall(text))
+
+
+def get_model_input_limit(model: Optional[str]) -> int:
+    """Get the input token limit for a model.
+
+    Args:
+        model: Model name, with or without the "models/" prefix.
+
+    Returns:
+        Maximum number of input tokens accepted by the model.
+    """
+    if model:
+        name = model.split("/")[-1]
+        for prefix, limit in MODEL_INPUT_TOKEN_LIMITS.items():
+            if name.startswith(prefix):
+                return limit
+    return DEFAULT_INPUT_TOKEN_LIMIT
+
+
+class TokenCounter:
+    """Token counter backed by the Gemini countTokens API with caching.
+
+    Counts are cached in an in-process LRU and, when available, in Redis keyed
+    on a hash of the model and text. A local estimate, continuously calibrated
+    against real counts, is used offline or when the API call fails.
+    """
+
+    def __init__(
+        self,
+        api_url: str,
+        api_key: Optional[str],
+        http_client: Any,
+        model: str,
+        use_api: bool = True,
+        cache_size: int = 10000,
+        cache_ttl: int = 86400
+    ):
+        """Initialize the token counter.
+
+        Args:
+            api_url: Base URL of the Gemini models API.
+            api_key: Gemini API key. If None, only the local estimate is used.
+            http_client: httpx.AsyncClient used for countTokens requests.
+            model: Default model whose tokenizer is used.
+            use_api: Whether to call countTokens on a cache miss.
+            cache_size: Maximum entries in the in-process LRU cache.
+            cache_ttl: Redis cache TTL in seconds.
+        """
+        self.api_url = api_url
+        self.api_key = api_key
+        self.http_client = http_client
+        self.model = model
+        self.use_api = use_api and bool(api_key)
+        self.cache_size = cache_size
+        self.cache_ttl = cache_ttl
+        self.redis_client = None
+        self._cache: "OrderedDict[str, int]" = OrderedDict()
+        # Ratio of real token counts to the local estimate, learned online
+        self.calibration = 1.0
+
+    def estimate(self, text: Optional[str]) -> int:
+        """Fast local token estimate, calibrated against real counts.
+
+        Args:
+            text: Text to count tokens for.
+
+        Returns:
+            Estimated token count.
+        """
+        raw = estimate_tokens(text)
+        return max(1, round(raw * self.calibration)) if raw else 0
+
+    async def count(self, text: Optional[str], model: Optional[str] = None) -> int:
+        """Count tokens, using the caches and the countTokens API.
+
+        Args:
+            text: Text to count tokens for.
+            model: Optional model override.
+
+        Returns:
+            Token count (calibrated estimate if no real count is available).
+        """
+        if not text:
+            return 0
+
+        model = model or self.model
+        key = self._cache_key(text, model)
+
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+
+        if self.redis_client:
+            try:
+                cached = await self.redis_client.get(f"token_count:{key}")
+                if cached:
+                    tokens = int(cached)
+                    self._cache_put(key, tokens)
+                    return tokens
+            except Exception as e:
+                logger.error(f"❌ Error reading token count cache: {str(e)}")
+
+        if self.use_api:
+            try:
+                tokens = await self._count_with_api(text, model)
+                await self.record(text, tokens, model)
+                return tokens
+            except Exception as e:
+                logger.warning(f"⚠️ countTokens failed, using local estimate: {str(e)}")
+
+        return self.estimate(text)
+
+    async def record(self, text: str, tokens: int, model: Optional[str] = None):
+        """Record a known token count, e.g. from generate usageMetadata.
+
+        Args:
+            text: The text that was counted.
+            tokens: Its real token count.
+            model: Optional model override.
+        """
+        if not text:
+            return
+
+        key = self._cache_key(text, model or self.model)
+        self._cache_put(key, tokens)
+        self.calibrate(estimate_tokens(text), tokens)
+
+        if self.redis_client:
+            try:
+                await self.redis_client.setex(f"token_count:{key}", self.cache_ttl, tokens)
+            except Exception as e:
+                logger.error(f"❌ Error storing token count in cache: {str(e)}")
+
+    def calibrate(self, estimated: int, actual: int):
+        """Update the estimate calibration from a real count.
+
+        Args:
+            estimated: Uncalibrated local estimate for a text.
+            actual: Real token count for the same text.
+        """
+        # Very short texts are dominated by rounding and would add noise
+        if estimated < 8 or actual <= 0:
+            return
+        ratio = min(max(actual / estimated, 0.5), 2.0)
+        self.calibration += 0.1 * (ratio - self.calibration)
+
+    async def _count_with_api(self, text: str, model: str) -> int:
+        """Call the Gemini countTokens endpoint."""
+        url = f"{self.api_url}/{model}:countTokens?key={self.api_key}"
+        response = await self.http_client.post(
+            url, json={"contents": [{"parts": [{"text": text}]}]}
+        )
+        if response.status_code != 200:
+            raise Exception(f"countTokens error: {response.status_code} {response.text[:200]}")
+        return int(response.json()["totalTokens"])
+
+    def _cache_key(self, text: str, model: str) -> str:
+        return hashlib.sha256(f"{model}:{text}".encode()).hexdigest()
+
+    def _cache_get(self, key: str) -> Optional[int]:
+        tokens = self._cache.get(key)
+        if tokens is not None:
+            self._cache.move_to_end(key)
+        return tokens
+
+    def _cache_put(self, key: str, tokens: int):
+        self._cache[key] = tokens
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
@@ -0,0 +1,316 @@
+import os
+import json
+import random
+import logging
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Iterator, Mapping, Optional, Sequence
+from dotenv import load_dotenv
+
+from .request_context import get_request_context
+
+try:
+    from opentelemetry import propagate, trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import ReadableSpan, SpanProcessor, TracerProvider
+    from opentelemetry.sdk.trace.export import (
+        BatchSpanProcessor,
+        ConsoleSpanExporter,
+        SpanExporter,
+        SpanExportResult
+    )
+    from opentelemetry.sdk.trace.sampling import ALWAYS_ON
+    from opentelemetry.trace import SpanKind, Status, StatusCode
+except ImportError:
+    trace = None
+    SpanExporter = SpanProcessor = object
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "genesis-agent-service")
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "file")  # otlp, file or console
+TRACING_FILE = os.getenv("TRACING_FILE", "traces/spans.jsonl")
+# Traces slower than this, or with an error, are always kept
+TRACING_SLOW_THRESHOLD_MS = float(os.getenv("TRACING_SLOW_THRESHOLD_MS", "2000"))
+# Fraction of the remaining traces kept
+TRACING_SAMPLE_RATIO = float(os.getenv("TRACING_SAMPLE_RATIO", "0.05"))
+TRACING_MAX_PENDING_TRACES = int(os.getenv("TRACING_MAX_PENDING_TRACES", "10000"))
+
+# Request context fields copied onto every span
+_CONTEXT_ATTRIBUTES = ("agent_id", "agent_type", "guild_id", "execution_id")
+
+
+class JSONLinesSpanExporter(SpanExporter):
+    """Appends finished spans to a file, one JSON object per line.
+
+    Needs no collector, so traces can be recorded offline and loaded into
+    a viewer later.
+    """
+
+    def __init__(self, path: str = TRACING_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def export(self, spans: Sequence["ReadableSpan"]) -> "SpanExportResult":
+        try:
+            lines = [json.dumps(json.loads(span.to_json())) + "\n" for span in spans]
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                f.writelines(lines)
+            return SpanExportResult.SUCCESS
+        except Exception as e:
+            logger.error(f"❌ Failed to write spans to {self.path}: {str(e)}")
+            return SpanExportResult.FAILURE
+
+    def shutdown(self):
+        pass
+
+
+class TailSamplingProcessor(SpanProcessor):
+    """Decides whether to keep a trace once its local root span has ended.
+
+    Finished spans are held per trace until the root span of this process
+    (the server span, or one whose parent is remote) ends. The whole trace
+    is then passed on if the root took longer than slow_threshold, if any
+    span failed, or else with probability sample_ratio. Spans ending after
+    their root follow the decision already made. At most max_traces traces
+    are held; beyond that the oldest are dropped.
+    """
+
+    def __init__(
+        self,
+        next_processor: "SpanProcessor",
+        slow_threshold: float = TRACING_SLOW_THRESHOLD_MS / 1000,
+        sample_ratio: float = TRACING_SAMPLE_RATIO,
+        max_traces: int = TRACING_MAX_PENDING_TRACES
+    ):
+        """Initialize the processor.
+
+        Args:
+            next_processor: Processor that kept spans are passed to.
+            slow_threshold: Root duration in seconds above which traces are kept.
+            sample_ratio: Probability of keeping any other trace.
+            max_traces: Traces held, and decisions remembered, at most.
+        """
+        self.next_processor = next_processor
+        self.slow_threshold = slow_threshold
+        self.sample_ratio = sample_ratio
+        self.max_traces = max_traces
+        self._pending: "OrderedDict[int, list]" = OrderedDict()
+        self._decisions: "OrderedDict[int, bool]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"kept": 0, "dropped": 0, "evicted": 0}
+
+    def on_start(self, span: Any, parent_context: Optional[Any] = None):
+        pass
+
+    def on_end(self, span: "ReadableSpan"):
+        trace_id = span.context.trace_id
+        is_root = span.parent is None or span.parent.is_remote
+
+        with self._lock:
+            # The orchestrator may send several requests in one trace; each root decides afresh
+            decision = None if is_root else self._decisions.get(trace_id)
+            if decision is None:
+                self._pending.setdefault(trace_id, []).append(span)
+                if not is_root:
+                    if len(self._pending) > self.max_traces:
+                        self._pending.popitem(last=False)
+                        self.stats["evicted"] += 1
+                    return
+                spans = self._pending.pop(trace_id)
+                decision = self._keep(span, spans)
+                self._decisions[trace_id] = decision
+                if len(self._decisions) > self.max_traces:
+                    self._decisions.popitem(last=False)
+                self.stats["kept" if decision else "dropped"] += 1
+            else:
+                spans = [span]
+
+        if decision:
+            for finished in spans:
+                self.next_processor.on_end(finished)
+
+    def _keep(self, root: "ReadableSpan", spans: Sequence["ReadableSpan"]) -> bool:
+        if (root.end_time - root.start_time) / 1e9 >= self.slow_threshold:
+            return True
+        if any(finished.status.status_code == StatusCode.ERROR for finished in spans):
+            return True
+        return random.random() < self.sample_ratio
+
+    def shutdown(self):
+        self.next_processor.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.next_processor.force_flush(timeout_millis)
+
+
+class _NoopSpan:
+    """Stands in for a span while tracing is off."""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, attributes: Mapping[str, Any]):
+        pass
+
+    def update_name(self, name: str):
+        pass
+
+
+_NOOP_SPAN = _NoopSpan()
+_tracer = None
+
+
+def _create_exporter(kind: str) -> "SpanExporter":
+    if kind == "otlp":
+        # Endpoint and headers come from the standard OTEL_EXPORTER_OTLP_* variables
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if kind == "console":
+        return ConsoleSpanExporter()
+    return JSONLinesSpanExporter(TRACING_FILE)
+
+
+def setup_tracing(enabled: bool = TRACING_ENABLED) -> bool:
+    """Configure tracing for the process.
+
+    Call before any HTTP client is created, so the httpx instrumentation,
+    when installed, sees every client. Redis calls are traced too when
+    opentelemetry-instrumentation-redis is installed.
+
+    Args:
+        enabled: Whether to trace.
+
+    Returns:
+        Whether tracing is active.
+    """
+    global _tracer
+
+    if _tracer is not None or not enabled:
+        return _tracer is not None
+    if trace is None:
+        logger.warning("⚠️ opentelemetry-sdk not installed, tracing is disabled")
+        return False
+
+    try:
+        provider = TracerProvider(
+            resource=Resource.create({"service.name": TRACING_SERVICE_NAME}),
+            # Every span is recorded; TailSamplingProcessor decides what is kept
+            sampler=ALWAYS_ON
+        )
+        provider.add_span_processor(TailSamplingProcessor(BatchSpanProcessor(_create_exporter(TRACING_EXPORTER))))
+        trace.set_tracer_provider(provider)
+        _tracer = trace.get_tracer(__name__)
+    except Exception as e:
+        logger.error(f"❌ Failed to set up tracing: {str(e)}")
+        return False
+
+    for module, instrumentor in (
+        ("opentelemetry.instrumentation.httpx", "HTTPXClientInstrumentor"),
+        ("opentelemetry.instrumentation.redis", "RedisInstrumentor")
+    ):
+        try:
+            getattr(__import__(module, fromlist=[instrumentor]), instrumentor)().instrument()
+        except ImportError:
+            pass
+        except Exception as e:
+            logger.warning(f"⚠️ Failed to instrument with {instrumentor}: {str(e)}")
+
+    logger.info(f"🔭 Tracing enabled, exporting to {TRACING_EXPORTER}")
+    return True
+
+
+def tracing_enabled() -> bool:
+    """Whether setup_tracing has configured tracing."""
+    return _tracer is not None
+
+
+@contextmanager
+def start_span(name: str, current: bool = True, **attributes: Any) -> Iterator[Any]:
+    """Trace a block as a span.
+
+    The span carries the request context's agent and guild, plus any
+    attributes given that are not None. An exception escaping the block is
+    recorded on the span and marks it as failed.
+
+    Args:
+        name: Span name, e.g. "gemini.generate_content".
+        current: Whether the span becomes the parent of spans started in
+            the block. Use False in async generators, which may resume in a
+            different context than the one they suspended in.
+        **attributes: Span attributes.
+
+    Yields:
+        The span, or a no-op stand-in when tracing is off.
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    context = get_request_context()
+    span_attributes = {f"genesis.{key}": context[key] for key in _CONTEXT_ATTRIBUTES if context.get(key)}
+    span_attributes.update({key: value for key, value in attributes.items() if value is not None})
+
+    if current:
+        with _tracer.start_as_current_span(name, attributes=span_attributes) as span:
+            yield span
+        return
+
+    span = _tracer.start_span(name, attributes=span_attributes)
+    try:
+        yield span
+    except Exception as e:
+        span.record_exception(e)
+        span.set_status(Status(StatusCode.ERROR, str(e)))
+        raise
+    finally:
+        span.end()
+
+
+def mark_span_error(span: Any, description: str):
+    """Mark a span as failed without an exception, e.g. for an error status code."""
+    if _tracer is not None and span is not _NOOP_SPAN:
+        span.set_status(Status(StatusCode.ERROR, description))
+
+
+@contextmanager
+def server_span(method: str, path: str, headers: Mapping[str, str]) -> Iterator[Any]:
+    """Trace an incoming request, continuing the caller's W3C trace context.
+
+    Args:
+        method: HTTP method.
+        path: Request path; rename the span to the route template once known.
+        headers: Request headers, read for traceparent and tracestate.
+
+    Yields:
+        The server span, or a no-op stand-in when tracing is off.
+    """
+    if _tracer is None:
+        yield _NOOP_SPAN
+        return
+
+    with _tracer.start_as_current_span(
+        f"{method} {path}",
+        context=propagate.extract(dict(headers)),
+        kind=SpanKind.SERVER,
+        attributes={"http.request.method": method, "url.path": path}
+    ) as span:
+        yield span
+
+
+def current_trace_id() -> Optional[str]:
+    """Hex id of the current trace, if any."""
+    if _tracer is None:
+        return None
+    span_context = trace.get_current_span().get_span_context()
+    return format(span_context.trace_id, "032x") if span_context.is_valid else None
+
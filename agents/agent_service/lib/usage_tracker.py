@@ -0,0 +1,346 @@
+import os
+import time
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from dotenv import load_dotenv
+
+from .request_context import get_request_context
+
+# Load environment variables
+load_dotenv()
+
+# Configure logging
+logger = logging.getLogger(__name__)
+
+USAGE_TRACKING_ENABLED = os.getenv("USAGE_TRACKING_ENABLED", "true").lower() == "true"
+USAGE_QUEUE_SIZE = int(os.getenv("USAGE_QUEUE_SIZE", "10000"))
+USAGE_FLUSH_INTERVAL = float(os.getenv("USAGE_FLUSH_INTERVAL", "2.0"))
+USAGE_BATCH_SIZE = int(os.getenv("USAGE_BATCH_SIZE", "500"))
+USAGE_RETENTION_DAYS = int(os.getenv("USAGE_RETENTION_DAYS", "30"))
+# USD per million tokens as model:input:output:cached, matched by model name prefix
+GEMINI_PRICING = os.getenv(
+    "GEMINI_PRICING",
+    "gemini-1.5-flash:0.075:0.30:0.01875,gemini-1.5-pro:1.25:5.00:0.3125"
+)
+
+COUNTER_FIELDS = (
+    "calls",
+    "errors",
+    "cache_hits",
+    "cache_misses",
+    "prompt_tokens",
+    "output_tokens",
+    "cached_tokens",
+    "latency_ms",
+    "cost_micros"
+)
+
+
+def _parse_pricing(value: str) -> Dict[str, Tuple[float, float, float]]:
+    """Parse "model:input:output:cached,..." into per-token USD prices."""
+    pricing = {}
+    for item in value.split(","):
+        parts = item.strip().split(":")
+        if len(parts) != 4:
+            if item.strip():
+                logger.warning(f"⚠️ Ignoring invalid pricing entry: {item}")
+            continue
+        try:
+            pricing[parts[0]] = tuple(float(price) / 1_000_000 for price in parts[1:])
+        except ValueError:
+            logger.warning(f"⚠️ Ignoring invalid pricing entry: {item}")
+    return pricing
+
+
+class UsageTracker:
+    """Collects per-call model usage and aggregates it into rollups.
+
+    ``record`` only appends to an in-process queue, so callers on the hot
+    path never wait for Redis. A background task drains the queue in
+    batches, sums the records per agent, guild, model and overall for the
+    current day, and applies each sum with a single HINCRBY. Without Redis
+    the rollups are kept in memory.
+    """
+
+    def __init__(
+        self,
+        queue_size: int = USAGE_QUEUE_SIZE,
+        flush_interval: float = USAGE_FLUSH_INTERVAL,
+        batch_size: int = USAGE_BATCH_SIZE,
+        retention_days: int = USAGE_RETENTION_DAYS,
+        pricing: Optional[Dict[str, Tuple[float, float, float]]] = None,
+        key_prefix: str = "usage"
+    ):
+        """Initialize the usage tracker.
+
+        Args:
+            queue_size: Records buffered before new ones are dropped.
+            flush_interval: Maximum seconds between flushes.
+            batch_size: Records aggregated per flush at most.
+            retention_days: Days daily rollups are kept in Redis.
+            pricing: Per-token (input, output, cached) USD prices by model
+                prefix. Defaults to GEMINI_PRICING.
+            key_prefix: Redis key prefix.
+        """
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.pricing = pricing if pricing is not None else _parse_pricing(GEMINI_PRICING)
+        self.key_prefix = key_prefix
+        self.redis_client = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self._task: Optional[asyncio.Task] = None
+        self._batch: List[Dict[str, Any]] = []
+        self._local: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.stats = {"recorded": 0, "dropped": 0, "flushed": 0, "flush_errors": 0}
+
+    def record(
+        self,
+        model: str,
+        prompt_tokens: int = 0,
+        output_tokens: int = 0,
+        cached_tokens: int = 0,
+        latency: float = 0.0,
+        cache: str = "miss",
+        error: bool = False,
+        **attributes: Any
+    ):
+        """Record one model call without blocking.
+
+        agent_id and guild_id default to the current request context.
+
+        Args:
+            model: Model that served the call.
+            prompt_tokens: Prompt tokens billed, including cached ones.
+            output_tokens: Output tokens generated.
+            cached_tokens: Prompt tokens served from a context cache.
+            latency: Call latency in seconds.
+            cache: "miss" for a model call, or the response cache that
+                answered it, e.g. "exact" or "semantic".
+            error: Whether the call failed.
+            **attributes: Overrides for request context attributes.
+        """
+        if not USAGE_TRACKING_ENABLED:
+            return
+
+        context = get_request_context()
+        usage_record = {
+            "agent_id": attributes.get("agent_id", context.get("agent_id")),
+            "guild_id": attributes.get("guild_id", context.get("guild_id")),
+            "model": model,
+            "prompt_tokens": prompt_tokens or 0,
+            "output_tokens": output_tokens or 0,
+            "cached_tokens": cached_tokens or 0,
+            "latency": latency,
+            "cache": cache,
+            "error": error,
+            "timestamp": time.time()
+        }
+
+        try:
+            self._queue.put_nowait(usage_record)
+            self.stats["recorded"] += 1
+        except asyncio.QueueFull:
+            self.stats["dropped"] += 1
+            return
+
+        self._ensure_worker()
+
+    def cost(self, model: str, prompt_tokens: int, output_tokens: int, cached_tokens: int) -> float:
+        """USD cost of a call, or 0 for models without pricing."""
+        prefix = max((p for p in self.pricing if model.startswith(p)), key=len, default=None)
+        if prefix is None:
+            return 0.0
+        input_price, output_price, cached_price = self.pricing[prefix]
+        return (
+            (prompt_tokens - cached_tokens) * input_price
+            + cached_tokens * cached_price
+            + output_tokens * output_price
+        )
+
+    def _ensure_worker(self):
+        if self._task is not None and not self._task.done():
+            return
+        try:
+            self._task = asyncio.get_running_loop().create_task(self._run())
+        except RuntimeError:
+            # No event loop in this thread; records are flushed by the next caller that has one
+            pass
+
+    async def _run(self):
+        while True:
+            self._batch.append(await self._queue.get())
+            deadline = time.time() + self.flush_interval
+            while len(self._batch) < self.batch_size:
+                timeout = deadline - time.time()
+                if timeout <= 0:
+                    break
+                try:
+                    self._batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            batch, self._batch = self._batch, []
+            await self._flush(batch)
+
+    def _aggregate(self, batch: List[Dict[str, Any]]) -> Dict[str, Dict[str, int]]:
+        """Sum a batch of records into rollup key -> field -> increment."""
+        rollups: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        for usage_record in batch:
+            day = datetime.fromtimestamp(usage_record["timestamp"], timezone.utc).strftime("%Y%m%d")
+            increments = {
+                "calls": 1,
+                "errors": int(usage_record["error"]),
+                "cache_hits": int(usage_record["cache"] != "miss"),
+                "cache_misses": int(usage_record["cache"] == "miss"),
+                "prompt_tokens": usage_record["prompt_tokens"],
+                "output_tokens": usage_record["output_tokens"],
+                "cached_tokens": usage_record["cached_tokens"],
+                "latency_ms": int(usage_record["latency"] * 1000),
+                "cost_micros": int(round(self.cost(
+                    usage_record["model"],
+                    usage_record["prompt_tokens"],
+                    usage_record["output_tokens"],
+                    usage_record["cached_tokens"]
+                ) * 1_000_000))
+            }
+            for dimension, member in (
+                ("agent", usage_record["agent_id"]),
+                ("guild", usage_record["guild_id"]),
+                ("model", usage_record["model"]),
+                ("total", "all")
+            ):
+                if member is None:
+                    continue
+                rollup = rollups[f"{day}|{dimension}|{member}"]
+                for field, value in increments.items():
+                    rollup[field] += value
+        return rollups
+
+    async def _flush(self, batch: List[Dict[str, Any]]):
+        rollups = self._aggregate(batch)
+
+        if self.redis_client:
+            try:
+                pipe = self.redis_client.pipeline(transaction=False)
+                ttl = self.retention_days * 86400
+                for rollup_key, fields in rollups.items():
+                    day, dimension, member = rollup_key.split("|", 2)
+                    key = f"{self.key_prefix}:{day}:{dimension}:{member}"
+                    index_key = f"{self.key_prefix}:{day}:{dimension}"
+                    for field, value in fields.items():
+                        if value:
+                            pipe.hincrby(key, field, value)
+                    pipe.expire(key, ttl)
+                    pipe.sadd(index_key, member)
+                    pipe.expire(index_key, ttl)
+                await pipe.execute()
+                self.stats["flushed"] += len(batch)
+                return
+            except Exception as e:
+                self.stats["flush_errors"] += 1
+                logger.error(f"❌ Error flushing usage rollups to Redis: {str(e)}")
+
+        for rollup_key, fields in rollups.items():
+            for field, value in fields.items():
+                self._local[rollup_key][field] += value
+        self.stats["flushed"] += len(batch)
+
+    async def flush(self):
+        """Aggregate everything queued so far."""
+        batch, self._batch = self._batch, []
+        while not self._queue.empty():
+            batch.append(self._queue.get_nowait())
+        if batch:
+            await self._flush(batch)
+
+    async def get_rollups(
+        self,
+        dimension: str,
+        days: int = 1,
+        member: Optional[str] = None
+    ) -> Dict[str, Dict[str, Any]]:
+        """Usage totals over the last days, per member of a dimension.
+
+        Args:
+            dimension: One of "agent", "guild", "model" or "total".
+            days: Number of days including today.
+            member: Optional single member, e.g. an agent id.
+
+        Returns:
+            Dict of member -> counters plus avg_latency_ms and cost_usd.
+        """
+        today = datetime.now(timezone.utc)
+        day_keys = [(today - timedelta(days=offset)).strftime("%Y%m%d") for offset in range(days)]
+        totals: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+
+        if self.redis_client:
+            try:
+                for day in day_keys:
+                    if member is not None:
+                        members = [member]
+                    else:
+                        members = await self.redis_client.smembers(f"{self.key_prefix}:{day}:{dimension}")
+                        members = [m.decode("utf-8") if isinstance(m, bytes) else m for m in members]
+                    if not members:
+                        continue
+                    pipe = self.redis_client.pipeline(transaction=False)
+                    for m in members:
+                        pipe.hgetall(f"{self.key_prefix}:{day}:{dimension}:{m}")
+                    for m, fields in zip(members, await pipe.execute()):
+                        for field, value in fields.items():
+                            field = field.decode("utf-8") if isinstance(field, bytes) else field
+                            totals[m][field] += int(value)
+            except Exception as e:
+                logger.error(f"❌ Error reading usage rollups from Redis: {str(e)}")
+        else:
+            for rollup_key, fields in self._local.items():
+                day, key_dimension, key_member = rollup_key.split("|", 2)
+                if day in day_keys and key_dimension == dimension and member in (None, key_member):
+                    for field, value in fields.items():
+                        totals[key_member][field] += value
+
+        return {m: self._summarize(fields) for m, fields in totals.items() if fields.get("calls")}
+
+    @staticmethod
+    def _summarize(fields: Dict[str, int]) -> Dict[str, Any]:
+        summary: Dict[str, Any] = {field: fields.get(field, 0) for field in COUNTER_FIELDS}
+        api_calls = summary["cache_misses"]
+        summary["avg_latency_ms"] = round(summary["latency_ms"] / api_calls, 1) if api_calls else 0.0
+        summary["cost_usd"] = round(summary["cost_micros"] / 1_000_000, 6)
+        return summary
+
+    async def close(self):
+        """Stop the background worker after flushing queued records."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Tracker counters and queue depth."""
+        return {"enabled": USAGE_TRACKING_ENABLED, "queued": self._queue.qsize(), **self.stats}
+
+
+# Global usage tracker instance
+_usage_tracker = None
+
+
+def get_usage_tracker() -> UsageTracker:
+    """Get the global usage tracker instance.
+
+    Returns:
+        UsageTracker instance.
+    """
+    global _usage_tracker
+
+    if _usage_tracker is None:
+        _usage_tracker = UsageTracker()
+
+    return _usage_tracker
@@ -9,6 +9,9 @@ import httpx
 from typing import List
 import redis.asyncio as redis
 from dotenv import load_dotenv
+from .circuit_breaker import BreakerGuarded, get_circuit_breaker, unguarded
+from .record_replay import get_transport, replay_api_key
+from .metrics import get_metrics, timed
 
 # Load environment variables
 load_dotenv()
@@ -24,16 +27,20 @@ VOICE_CACHE_EXPIRY = int(os.getenv("VOICE_CACHE_EXPIRY", "3600"))  # Default 1 h
 # Get environment variables
 ELEVENLABS_API_KEY = os.getenv("ELEVENLABS_API_KEY")
 ELEVENLABS_VOICE_ID = os.getenv("ELEVENLABS_VOICE_ID", "21m00Tcm4TlvDq8ikWAM")  # Default voice ID
+ELEVENLABS_API_URL = os.getenv("ELEVENLABS_API_URL", "https://api.elevenlabs.io/v1")
 REDIS_URL = os.getenv("REDIS_URL")
 
 class VoiceService:
     """Service for text-to-speech synthesis using ElevenLabs."""
     
+    # Cache reads are skipped while the shared Redis circuit breaker is open
+    redis_client = BreakerGuarded("redis", probe=lambda client: client.ping())
+    
     def __init__(self):
         """Initialize the voice service."""
-        self.api_key = ELEVENLABS_API_KEY
+        self.api_key = replay_api_key(ELEVENLABS_API_KEY)
         self.voice_id = ELEVENLABS_VOICE_ID
-        self.client = httpx.AsyncClient(timeout=60.0)
+        self.client = httpx.AsyncClient(timeout=60.0, transport=get_transport("elevenlabs"))
         self.redis_client = None
 
         # Voice cache configuration
@@ -55,7 +62,18 @@ class VoiceService:
         else:
             self.enabled = True
             logger.info(f"🔊 Voice service initialized with voice ID: {self.voice_id}")
+        
+        self.circuit_breaker = get_circuit_breaker("elevenlabs", probe=self._probe_api)
+    
+    async def _probe_api(self) -> bool:
+        """Check whether ElevenLabs is reachable, for circuit breaker recovery."""
+        response = await self.client.get(
+            f"{ELEVENLABS_API_URL}/voices",
+            headers={"Accept": "application/json", "xi-api-key": self.api_key}
+        )
+        return response.status_code < 500 and response.status_code != 429
     
+    @timed("voice_synthesis")
     async def synthesize_speech(
         self,
         text: str,
@@ -89,6 +107,7 @@ class VoiceService:
                 }))}"
                 
                 cached_audio = await self.redis_client.get(cache_key)
+                get_metrics().record_cache("voice", "hit" if cached_audio else "miss")
                 if cached_audio:
                     logger.info("✅ Using cached voice audio")
                     return cached_audio.decode('utf-8')
@@ -99,10 +118,15 @@ class VoiceService:
             logger.warning("⚠️ ElevenLabs voice synthesis is not enabled.")
             return None
         
+        # Respond without audio while ElevenLabs is failing
+        if not self.circuit_breaker.allow_request():
+            logger.warning("⚠️ ElevenLabs circuit breaker is open, skipping voice synthesis")
+            return None
+        
         voice_id_to_use = voice_id or self.voice_id
         
         try:
-            url = f"https://api.elevenlabs.io/v1/text-to-speech/{voice_id_to_use}"
+            url = f"{ELEVENLABS_API_URL}/text-to-speech/{voice_id_to_use}"
             
             headers = {
                 "Accept": "audio/mpeg",
@@ -121,7 +145,12 @@ class VoiceService:
                 }
             }
             
-            response = await self.client.post(url, json=data, headers=headers)
+            try:
+                response = await self.client.post(url, json=data, headers=headers)
+            except Exception:
+                self.circuit_breaker.record_failure()
+                raise
+            self.circuit_breaker.record_status(response.status_code)
             
             if response.status_code != 200:
                 logger.error(f"❌ ElevenLabs API error: {response.status_code} {response.text}")
@@ -165,7 +194,7 @@ class VoiceService:
             return []
         
         try:
-            url = "https://api.elevenlabs.io/v1/voices"
+            url = f"{ELEVENLABS_API_URL}/voices"
             
             headers = {
                 "Accept": "application/json",
@@ -210,7 +239,7 @@ class VoiceService:
         voice_id_to_use = voice_id or self.voice_id
         
         try:
-            url = f"https://api.elevenlabs.io/v1/voices/{voice_id_to_use}/settings"
+            url = f"{ELEVENLABS_API_URL}/voices/{voice_id_to_use}/settings"
             
             headers = {
                 "Accept": "application/json",
@@ -244,8 +273,10 @@ class VoiceService:
         """Close the HTTP client."""
         await self.client.aclose()
         
-        if self.redis_client:
-            await self.redis_client.close()
+        # Closed even while the Redis circuit breaker is open
+        redis_client = unguarded(self, "redis_client")
+        if redis_client:
+            await redis_client.close()
             logger.info("✅ Redis client closed")
 
 
@@ -3,18 +3,30 @@ import json
 import logging
 import asyncio
 import traceback
+import inspect
+import hmac
+import threading
 import time
 from typing import Dict, Any, Optional, List, Union, Annotated
 from pydantic import BaseModel, Field
 from fastapi import FastAPI, HTTPException, Body, Request, Depends, Path, Query, status, APIRouter
-from fastapi.responses import JSONResponse, StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 from dotenv import load_dotenv
-from lib.memory_service import get_memory_service
+from lib.memory_service import get_memory_service, MEMORY_EXECUTOR_THREAD_PREFIX
 from lib.agent_manager import get_agent_manager
 from lib.gemini_service import get_gemini_service
 from lib.voice_service import get_voice_service
+from lib.circuit_breaker import get_circuit_breakers
+from lib.usage_tracker import get_usage_tracker
+from lib.admission import AdmissionRejected
+from lib.metrics import get_metrics
+from lib.tracing import current_trace_id, server_span, setup_tracing
+from lib.timings import collect_timings
+from lib.profiler import PROFILER_DEFAULT_HZ, ProfilerBusy, run_profile
+from lib.loop_monitor import LOOP_MONITOR_ENABLED, get_loop_monitor
+from lib.offload import get_cpu_offloader, get_offloader
 
 # Load environment variables
 load_dotenv()
@@ -28,6 +40,8 @@ AGENT_PORT = int(os.getenv("AGENT_PORT", "8001"))
 DEBUG_MODE = os.getenv("DEBUG", "false").lower() == "true"
 ALLOWED_ORIGINS = os.getenv("ALLOWED_ORIGINS", "*").split(",")
 API_VERSION = "v1"
+# Bearer token for /admin endpoints; they are disabled while unset
+ADMIN_API_TOKEN = os.getenv("ADMIN_API_TOKEN")
 
 # Define API models
 class AgentInput(BaseModel):
@@ -39,6 +53,7 @@ class AgentOutput(BaseModel):
     chain_of_thought: str
     status: str = "completed"
     audio: Optional[str] = None
+    timings: Optional[Dict[str, Any]] = None
 
 class AgentConfig(BaseModel):
     name: str
@@ -96,11 +111,15 @@ class ErrorResponse(BaseModel):
     status: str = "error"
     detail: Optional[Dict[str, Any]] = None
 
+# Tracing must be set up before the services create their HTTP clients
+setup_tracing()
+
 # Initialize services
 memory_service = get_memory_service()
 agent_manager = get_agent_manager()
 gemini_service = get_gemini_service()
 voice_service = get_voice_service()
+metrics = get_metrics()
 
 # Define shutdown event handler
 @asynccontextmanager
@@ -109,11 +128,18 @@ async def lifespan(app: FastAPI):
         # Startup logic - use plain text for Windows compatibility
         logger.info("Starting GenesisOS Agent Service")
         
+        # Watch for callbacks that block the event loop from the start
+        if LOOP_MONITOR_ENABLED:
+            get_loop_monitor().start()
+        
         # Initialize services with enhanced setup
         try:
             # Initialize Gemini service with Redis caching
             await gemini_service.initialize_cache()
             
+            # Connect to Pinecone off the event loop
+            await memory_service.initialize()
+            
             # Log the available AI models
             logger.info(f"🧠 Available AI models: {os.getenv('GEMINI_PRO_MODEL')}, {os.getenv('GEMINI_FLASH_MODEL')}")
             
@@ -146,12 +172,18 @@ async def lifespan(app: FastAPI):
         await agent_manager.close()
         await gemini_service.close()
         await voice_service.close()
+        await get_usage_tracker().close()
+        await get_loop_monitor().stop()
+        get_offloader().shutdown()
+        get_cpu_offloader().shutdown()
     except Exception as e:
         logger.error(f"Error in lifespan: {e}")
         raise
 
-# Create FastAPI app
-app = FastAPI(lifespan=lifespan)
+# Create FastAPI app. Requests are traced by trace_request on every FastAPI
+# version, so the HTTP spans of versions with built-in telemetry are turned off
+app_options = {"telemetry": {"tracing": False}} if "telemetry" in inspect.signature(FastAPI).parameters else {}
+app = FastAPI(lifespan=lifespan, **app_options)
 
 # Configure CORS with more specific settings
 app.add_middleware(
@@ -160,9 +192,42 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
-    expose_headers=["Content-Type", "Authorization"]
+    expose_headers=["Content-Type", "Authorization", "X-Trace-Id", "X-Blueprint-Cache", "Server-Timing"]
 )
 
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    start_time = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # Label by route template so path parameters don't multiply series
+        route = request.scope.get("route")
+        metrics.observe_request(
+            request.method,
+            getattr(route, "path", "unmatched"),
+            status_code,
+            time.perf_counter() - start_time
+        )
+
+@app.middleware("http")
+async def trace_request(request: Request, call_next):
+    # Continues the orchestrator's trace when it sends a traceparent header
+    with server_span(request.method, request.url.path, request.headers) as span:
+        response = await call_next(request)
+        route = request.scope.get("route")
+        if route is not None:
+            span.update_name(f"{request.method} {route.path}")
+            span.set_attribute("http.route", route.path)
+        span.set_attribute("http.response.status_code", response.status_code)
+        trace_id = current_trace_id()
+        if trace_id:
+            response.headers["X-Trace-Id"] = trace_id
+        return response
+
 # Add version prefix to all routes
 api_router = APIRouter(prefix=f"/{API_VERSION}")
 
@@ -195,9 +260,88 @@ async def read_root():
             "memory": True,
             "voice": elevenlabs_configured,
             "blueprint_generation": gemini_configured
+        },
+        "circuit_breakers": {
+            name: breaker.to_dict() for name, breaker in get_circuit_breakers().items()
         }
     }
 
+# Prometheus metrics endpoint
+@app.get("/metrics")
+async def get_prometheus_metrics():
+    if not metrics.enabled:
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Metrics are disabled or prometheus_client is not installed", "status": "error"}
+        )
+    body, content_type = metrics.render()
+    return Response(content=body, media_type=content_type)
+
+def check_admin_token(request: Request) -> Optional[JSONResponse]:
+    """Error response for a request without the admin token, or None if it has it."""
+    if not ADMIN_API_TOKEN or ADMIN_API_TOKEN.startswith("your_"):
+        return JSONResponse(
+            status_code=503,
+            content={"error": "Admin endpoints are disabled. Please set ADMIN_API_TOKEN in .env file.", "status": "error"}
+        )
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), ADMIN_API_TOKEN.encode()):
+        return JSONResponse(
+            status_code=401,
+            headers={"WWW-Authenticate": "Bearer"},
+            content={"error": "Invalid or missing admin token", "status": "error"}
+        )
+    return None
+
+# Event loop stalls with the stacks that caused them
+@app.get("/admin/loop")
+async def get_loop_stalls(request: Request):
+    error_response = check_admin_token(request)
+    if error_response is not None:
+        return error_response
+    return get_loop_monitor().to_dict()
+
+# Sampling profiler for live workers
+@app.get("/admin/profile")
+async def profile_worker(
+    request: Request,
+    seconds: float = Query(10.0, gt=0, description="Profile duration, capped by PROFILER_MAX_SECONDS"),
+    mode: str = Query("wall", description="wall samples waiting threads too; cpu only threads using CPU"),
+    hz: int = Query(PROFILER_DEFAULT_HZ, gt=0, description="Samples per second"),
+    output_format: str = Query("collapsed", alias="format", description="collapsed stacks for flamegraph.pl/speedscope, or json"),
+    all_threads: bool = Query(False, description="Sample every thread, not just the event loop and memory executor")
+):
+    error_response = check_admin_token(request)
+    if error_response is not None:
+        return error_response
+    
+    try:
+        # This handler runs on the event loop thread, so its ident is the loop's
+        loop_thread_id = threading.get_ident()
+        profiler = await asyncio.get_running_loop().run_in_executor(
+            None,
+            lambda: run_profile(
+                seconds,
+                thread_ids=[loop_thread_id],
+                thread_prefixes=[""] if all_threads else [MEMORY_EXECUTOR_THREAD_PREFIX],
+                mode=mode,
+                hz=hz
+            )
+        )
+    except ProfilerBusy as e:
+        return JSONResponse(status_code=409, content={"error": str(e), "status": "error"})
+    except ValueError as e:
+        return JSONResponse(status_code=400, content={"error": str(e), "status": "error"})
+    
+    summary = profiler.summary()
+    logger.info(f"🔬 Profile finished: {summary['samples']} samples in {summary['duration_s']}s")
+    if output_format == "json":
+        return {**summary, "collapsed": profiler.collapsed(), "status": "completed"}
+    return PlainTextResponse(
+        profiler.collapsed(),
+        headers={"X-Profile-Mode": profiler.mode, "X-Profile-Samples": str(profiler.samples)}
+    )
+
 # API version endpoint
 @app.get("/version")
 async def get_version():
@@ -208,53 +352,80 @@ async def get_version():
 
 # Execute agent endpoint
 @app.post("/agent/{agent_id}/execute", response_model=AgentOutput)
-async def execute_agent(agent_id: str, agent_input: AgentInput):
+async def execute_agent(
+    agent_id: str,
+    agent_input: AgentInput,
+    response: Response,
+    timings: bool = Query(False, description="Return a per-stage timing breakdown in the Server-Timing header and the timings field")
+):
     print(f"Received execute request for agent {agent_id}")
     try:
-        input_text = agent_input.input
-        context = agent_input.context or {}
+        # Per-stage timings are collected only when the caller asks for them
+        with collect_timings(timings) as collected:
+            input_text = agent_input.input
+            context = agent_input.context or {}
         
-        logger.info(f"Agent {agent_id} executing with input: {input_text[:50]}...")
+            logger.info(f"Agent {agent_id} executing with input: {input_text[:50]}...")
         
-        # Get execution ID from context or generate one
-        execution_id = context.get("executionId", f"exec-{int(time.time())}")
+            # Get execution ID from context or generate one
+            execution_id = context.get("executionId", f"exec-{int(time.time())}")
         
-        # Add execution ID to context if not present
-        if "executionId" not in context:
-            context["executionId"] = execution_id
+            # Add execution ID to context if not present
+            if "executionId" not in context:
+                context["executionId"] = execution_id
         
-        # Note if this is a test/simulation
-        is_simulation = context.get("isSimulation", False)
-        logger.info(f"Execution {execution_id} is simulation: {is_simulation}")
-        
-        # Execute the agent
-        output, chain_of_thought = await agent_manager.execute_agent(
-            agent_id=agent_id,
-            input_text=input_text,
-            context=context
-        )
+            # Note if this is a test/simulation
+            is_simulation = context.get("isSimulation", False)
+            logger.info(f"Execution {execution_id} is simulation: {is_simulation}")
         
-        # Handle voice synthesis if enabled
-        audio_data = None
-        if context.get("voice_enabled", False) and voice_service.enabled:
-            voice_id = context.get("voice_id")
-            audio_data = await voice_service.synthesize_speech(
-                text=output,
-                voice_id=voice_id,
-                stability=context.get('voice_config', {}).get('stability', 0.5),
-                similarity_boost=context.get('voice_config', {}).get('similarity_boost', 0.75),
-                style=context.get('voice_config', {}).get('style', 0.0)
+            # Execute the agent
+            output, chain_of_thought = await agent_manager.execute_agent(
+                agent_id=agent_id,
+                input_text=input_text,
+                context=context
             )
         
-        # Log execution
-        logger.info(f"✅ Agent {agent_id} completed execution for {execution_id}")
-        
-        return AgentOutput(
+            # Handle voice synthesis if enabled
+            audio_data = None
+            if context.get("voice_enabled", False) and voice_service.enabled:
+                voice_id = context.get("voice_id")
+                audio_data = await voice_service.synthesize_speech(
+                    text=output,
+                    voice_id=voice_id,
+                    stability=context.get('voice_config', {}).get('stability', 0.5),
+                    similarity_boost=context.get('voice_config', {}).get('similarity_boost', 0.75),
+                    style=context.get('voice_config', {}).get('style', 0.0)
+                )
+        
+            # Log execution
+            logger.info(f"✅ Agent {agent_id} completed execution for {execution_id}")
+        
+        result = AgentOutput(
             output=output,
             chain_of_thought=chain_of_thought,
             status="completed",
             audio=audio_data
         )
+        if collected is not None:
+            response.headers["Server-Timing"] = collected.server_timing()
+            result.timings = collected.to_dict()
+        return result
+    except AdmissionRejected as e:
+        logger.warning(f"Agent {agent_id} execution rejected: {str(e)}")
+        return JSONResponse(
+            status_code=429,
+            headers={"Retry-After": str(int(e.retry_after + 0.999))},
+            content={
+                "error": f"Agent execution rejected: {str(e)}",
+                "status": "error",
+                "detail": {
+                    "agent_id": agent_id,
+                    "tenant": e.tenant,
+                    "budget": e.metric,
+                    "retry_after": e.retry_after
+                }
+            }
+        )
     except Exception as e:
         logger.error(f"Error executing agent {agent_id}: {str(e)}")
         
@@ -458,22 +629,28 @@ async def search_memories(
     agent_id: str,
     query: str,
     limit: int = Query(10, ge=1, le=50),
-    min_similarity: float = Query(0.6, ge=0, le=1)
+    min_similarity: float = Query(0.6, ge=0, le=1),
+    mode: Optional[str] = Query(None, pattern="^(hybrid|semantic|keyword)$")
 ):
     try:
         logger.info(f"Searching memories for agent {agent_id}: {query}")
         
+        # Filled with per-source timings when the search is hybrid
+        timings = {}
         memories = await memory_service.search_memories(
             agent_id=agent_id,
             query=query,
             limit=limit,
-            min_similarity=min_similarity
+            min_similarity=min_similarity,
+            mode=mode,
+            stats=timings
         )
         
         return {
             "agent_id": agent_id,
             "memories": memories,
-            "count": len(memories)
+            "count": len(memories),
+            "timings": timings or None
         }
     except Exception as e:
         logger.error(f"Error searching memories: {str(e)}")
@@ -539,7 +716,8 @@ async def get_agent_memories(agent_id: str, limit: int = 10):
 # Blueprint generation endpoint
 @app.post("/generate-blueprint")
 async def generate_blueprint(
-    user_input: str = Body(..., embed=True)
+    user_input: str = Body(..., embed=True),
+    stale_while_revalidate: Optional[bool] = Query(None, description="Serve stale or near-duplicate cached blueprints while regenerating in the background")
 ):
     try:
         logger.info(f"Generating blueprint for: {user_input[:50]}...")
@@ -553,11 +731,13 @@ async def generate_blueprint(
                 }
             )
         
-        blueprint = await gemini_service.generate_blueprint(user_input)
+        blueprint, cache_status = await gemini_service.generate_blueprint_with_status(
+            user_input, stale_while_revalidate
+        )
         
-        logger.info(f"✅ Blueprint generated successfully: {blueprint['id']}")
+        logger.info(f"✅ Blueprint generated successfully: {blueprint['id']} (cache: {cache_status})")
         
-        return blueprint
+        return JSONResponse(content=blueprint, headers={"X-Blueprint-Cache": cache_status})
     except Exception as e:
         logger.error(f"Error generating blueprint: {str(e)}")
         return JSONResponse(
@@ -567,7 +747,142 @@ async def generate_blueprint(
                 "status": "error"
             }
         )
+
+@app.post("/regenerate-blueprint")
+async def regenerate_blueprint(
+    blueprint: Dict[str, Any] = Body(...),
+    user_input: str = Body(...)
+):
+    try:
+        logger.info(f"Regenerating blueprint {blueprint.get('id')} for: {user_input[:50]}...")
         
+        if not gemini_service.api_key or gemini_service.api_key.startswith("your_"):
+            return JSONResponse(
+                status_code=400,
+                content={
+                    "error": "Gemini API key is not configured. Please set GEMINI_API_KEY in .env file.",
+                    "status": "error"
+                }
+            )
+        
+        result = await gemini_service.regenerate_blueprint(blueprint, user_input)
+        
+        logger.info(f"✅ Blueprint regenerated ({result['mode']}): {result['blueprint']['id']}")
+        
+        return result
+    except ValueError as e:
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": str(e),
+                "status": "error"
+            }
+        )
+    except Exception as e:
+        logger.error(f"Error regenerating blueprint: {str(e)}")
+        return JSONResponse(
+            status_code=500,
+            content={
+                "error": f"Blueprint regeneration failed: {str(e)}",
+                "status": "error"
+            }
+        )
+
+@app.post("/generate-blueprint/stream")
+async def stream_blueprint(
+    user_input: str = Body(..., embed=True),
+    stale_while_revalidate: Optional[bool] = Query(None, description="Serve stale or near-duplicate cached blueprints while regenerating in the background")
+):
+    logger.info(f"Streaming blueprint for: {user_input[:50]}...")
+    
+    if not gemini_service.api_key or gemini_service.api_key.startswith("your_"):
+        return JSONResponse(
+            status_code=400,
+            content={
+                "error": "Gemini API key is not configured. Please set GEMINI_API_KEY in .env file.",
+                "status": "error"
+            }
+        )
+    
+    async def event_stream():
+        try:
+            async for event in gemini_service.stream_blueprint(user_input, stale_while_revalidate):
+                payload = {key: value for key, value in event.items() if key != "event"}
+                yield f"event: {event['event']}\ndata: {json.dumps(payload)}\n\n"
+        except Exception as e:
+            logger.error(f"Error streaming blueprint: {str(e)}")
+            payload = {"error": f"Blueprint generation failed: {str(e)}", "status": "error"}
+            yield f"event: error\ndata: {json.dumps(payload)}\n\n"
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+# Model routing statistics endpoint
+@app.get("/models/router")
+async def get_model_router_stats(request: Request):
+    error_response = check_admin_token(request)
+    if error_response is not None:
+        return error_response
+    stats = gemini_service.model_router.to_dict()
+    if gemini_service.hedge_policy:
+        stats["hedging"] = gemini_service.hedge_policy.to_dict()
+    return stats
+
+# Admission control status endpoint
+@app.get("/admission")
+async def get_admission_status(request: Request):
+    error_response = check_admin_token(request)
+    if error_response is not None:
+        return error_response
+    return gemini_service.admission.to_dict()
+
+# Usage and cost rollups endpoints
+@app.get("/usage")
+async def get_usage(
+    request: Request,
+    dimension: str = Query("agent", pattern="^(agent|guild|model|total)$"),
+    days: int = Query(1, ge=1, le=90),
+    sort_by: str = Query("cost_usd", pattern="^(cost_usd|calls|prompt_tokens|output_tokens|latency_ms|avg_latency_ms|errors)$"),
+    limit: int = Query(20, ge=1, le=500)
+):
+    error_response = check_admin_token(request)
+    if error_response is not None:
+        return error_response
+    usage_tracker = get_usage_tracker()
+    await usage_tracker.flush()
+    rollups = await usage_tracker.get_rollups(dimension, days)
+    ranked = sorted(rollups.items(), key=lambda item: item[1][sort_by], reverse=True)[:limit]
+    return {
+        "dimension": dimension,
+        "days": days,
+        "sort_by": sort_by,
+        "usage": [{"id": member, **summary} for member, summary in ranked],
+        "tracker": usage_tracker.to_dict()
+    }
+
+@app.get("/usage/{dimension}/{member}")
+async def get_usage_for(
+    request: Request,
+    dimension: str = Path(..., pattern="^(agent|guild|model)$"),
+    member: str = Path(...),
+    days: int = Query(1, ge=1, le=90)
+):
+    error_response = check_admin_token(request)
+    if error_response is not None:
+        return error_response
+    usage_tracker = get_usage_tracker()
+    await usage_tracker.flush()
+    rollups = await usage_tracker.get_rollups(dimension, days, member=member)
+    if member not in rollups:
+        return JSONResponse(
+            status_code=404,
+            content={"error": f"No usage recorded for {dimension} {member}", "status": "error"}
+        )
+    return {"dimension": dimension, "id": member, "days": days, **rollups[member]}
+
 # Register the API router
 app.include_router(api_router)
 